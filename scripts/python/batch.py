@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import create_metadata_records
+import generate_picklist_metadata
+from benchmark import RESULTS_FILE
+from manifest import MANIFEST_SUFFIX
+from package_output import ZipOutput
+from package_planner import PLAN_FILE
+from taxonomy import load_taxonomy
+from validation import ValidationError, check_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+OUTPUT_ROOT = 'tenants'
+# Taxonomy files picked up when a directory is given
+TAXONOMY_PATTERN = '*.json'
+# JSON files the other scripts write, never picked up as taxonomies (unless
+# given by name): incremental manifests, benchmark results, deploy plans
+NON_TAXONOMY_SUFFIXES = (MANIFEST_SUFFIX,)
+NON_TAXONOMY_FILES = (RESULTS_FILE, PLAN_FILE)
+# A tenant folder holding this file is named after the folder
+TENANT_FILE = generate_picklist_metadata.INPUT_FILE  # real.json
+
+# ---------------------------------------------------------
+# DISCOVERY
+# ---------------------------------------------------------
+
+def tenant_name(path):
+    """shul_a.json -> 'shul_a'; shul_a/real.json -> 'shul_a'."""
+    if os.path.basename(path) == TENANT_FILE:
+        return os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return os.path.splitext(os.path.basename(path))[0]
+
+def is_taxonomy_file(path):
+    """False for the JSON files other scripts write (see NON_TAXONOMY_FILES)."""
+    name = os.path.basename(path)
+    return name not in NON_TAXONOMY_FILES and not name.endswith(NON_TAXONOMY_SUFFIXES)
+
+def discover_tenants(sources):
+    """
+    Finds the taxonomy files of every tenant.
+
+    :param sources: Files, directories (their *.json files and */real.json)
+        or glob patterns. Files found in a directory or by a pattern are
+        skipped when they are not taxonomies (see is_taxonomy_file); files
+        given by name are always used.
+    :return: List of (tenant name, path), sorted by name.
+    :raises ValueError: when two files would write to the same tenant folder.
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(filter(is_taxonomy_file, glob.glob(os.path.join(source, TAXONOMY_PATTERN))))
+            paths.extend(glob.glob(os.path.join(source, '*', TENANT_FILE)))
+        elif os.path.isfile(source):
+            paths.append(source)
+        else:
+            paths.extend(filter(is_taxonomy_file, glob.glob(source)))
+
+    tenants = {}
+    for path in paths:
+        name = tenant_name(path)
+        other = tenants.get(name)
+        if other is not None and os.path.abspath(other) != os.path.abspath(path):
+            raise ValueError(f"Tenant '{name}' found twice: {other} and {path}")
+        tenants[name] = path
+    return sorted(tenants.items())
+
+# ---------------------------------------------------------
+# BUILD
+# ---------------------------------------------------------
+
+def build_tenant(name, path, output_root, incremental=False, validate=True, zip_output=False):
+    """
+    Generates one tenant's deploy_package and deploy_pkg under
+    output_root/<name>/ (or output_root/<name>.zip). Runs in a pool worker,
+    so every failure is caught and returned instead of raised.
+
+    :return: Dict describing the result (see print_summary).
+    """
+    result = {'tenant': name, 'input': path, 'ok': False, 'nodes': 0, 'records': 0, 'seconds': 0.0}
+    log = io.StringIO()
+    start = time.perf_counter()
+    archive = None
+    try:
+        with contextlib.redirect_stdout(log):
+            taxonomy = load_taxonomy(path)
+            result['nodes'] = len(taxonomy)
+            result['records'] = sum(1 for _ in taxonomy.iter_entries())
+            if validate:
+                # Both packages are checked before either is written, so a
+                # failed tenant never ends up half built
+                check_taxonomy(taxonomy, create_metadata_records.record_for_node,
+                               create_metadata_records.record_label)
+
+            tenant_dir = os.path.join(output_root, name)
+            picklist_dir = os.path.join(tenant_dir, generate_picklist_metadata.OUTPUT_DIR)
+            records_dir = os.path.join(tenant_dir, create_metadata_records.ROOT_DIR)
+            if zip_output:
+                os.makedirs(output_root, exist_ok=True)
+                result['output'] = os.path.join(output_root, f"{name}.zip")
+                archive = ZipOutput(result['output'])
+                picklist_output = archive.package(generate_picklist_metadata.OUTPUT_DIR)
+                records_output = archive.package(create_metadata_records.ROOT_DIR)
+            else:
+                result['output'] = tenant_dir
+                picklist_output = records_output = None
+
+            generate_picklist_metadata.process_json_and_generate_files(
+                taxonomy, incremental, picklist_output, validate=False, output_dir=picklist_dir)
+            create_metadata_records.process_json(
+                taxonomy, incremental, output=records_output, validate=False, root_dir=records_dir)
+        result['ok'] = True
+    except ValidationError as exc:
+        result['error'] = f"{len(exc.report.errors)} validation error(s): " + "; ".join(exc.report.errors[:5])
+    except Exception as exc:
+        result['error'] = f"{type(exc).__name__}: {exc}"
+        result['traceback'] = traceback.format_exc()
+    finally:
+        if archive is not None:
+            archive.close()
+            if not result['ok']:
+                os.remove(result['output'])
+    result['seconds'] = time.perf_counter() - start
+    result['log'] = log.getvalue()
+    return result
+
+def run_batch(tenants, output_root=OUTPUT_ROOT, workers=None, incremental=False, validate=True,
+              zip_output=False):
+    """
+    Builds every tenant on a process pool (workers=1 builds them in this
+    process, one after the other).
+
+    :param tenants: List of (tenant name, path), see discover_tenants.
+    :return: Result dicts, in the order of `tenants`.
+    """
+    options = (output_root, incremental, validate, zip_output)
+    if workers == 1:
+        results = []
+        for name, path in tenants:
+            results.append(build_tenant(name, path, *options))
+            _print_progress(results[-1], len(results), len(tenants))
+        return results
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(build_tenant, name, path, *options): name for name, path in tenants}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as exc:
+                # The worker itself died (e.g. out of memory); keep the other tenants going
+                result = {'tenant': name, 'ok': False, 'nodes': 0, 'records': 0, 'seconds': 0.0,
+                          'error': f"worker failed: {type(exc).__name__}: {exc}"}
+            results[name] = result
+            _print_progress(result, len(results), len(tenants))
+    return [results[name] for name, _ in tenants]
+
+# ---------------------------------------------------------
+# SUMMARY
+# ---------------------------------------------------------
+
+def _print_progress(result, done, total):
+    status = 'ok' if result['ok'] else 'FAILED'
+    print(f"[{done}/{total}] {result['tenant']}: {status} ({result['seconds']:.2f}s)", file=sys.stderr)
+
+def print_summary(results, wall_seconds):
+    failed = [r for r in results if not r['ok']]
+    width = max([len(r['tenant']) for r in results] + [6])
+    print(f"\n{'Tenant':<{width}}  {'Status':<6}  {'Nodes':>7}  {'Records':>7}  {'Seconds':>8}")
+    for r in results:
+        status = 'ok' if r['ok'] else 'FAILED'
+        print(f"{r['tenant']:<{width}}  {status:<6}  {r['nodes']:>7}  {r['records']:>7}  {r['seconds']:>8.2f}")
+    for r in failed:
+        print(f"\n{r['tenant']}: {r['error']}")
+    total_nodes = sum(r['nodes'] for r in results)
+    print(f"\n{len(results) - len(failed)} of {len(results)} tenant(s) built, {total_nodes} nodes, "
+          f"{wall_seconds:.2f}s wall time")
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the deploy packages of many tenant taxonomies in parallel")
+    parser.add_argument('sources', nargs='+',
+                        help="taxonomy files, directories (*.json and */real.json) or glob patterns")
+    parser.add_argument('--output-root', default=OUTPUT_ROOT,
+                        help=f"each tenant is written to <output-root>/<tenant>/ (default: {OUTPUT_ROOT})")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--incremental', action='store_true', help="incremental build per tenant")
+    parser.add_argument('--zip', action='store_true', help="write <output-root>/<tenant>.zip instead of folders")
+    parser.add_argument('--no-validate', action='store_true')
+    parser.add_argument('--summary-json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.incremental and args.zip:
+        sys.exit("Error: --incremental needs folder output, not --zip.")
+    if args.workers is not None and args.workers < 1:
+        sys.exit("Error: --workers must be at least 1.")
+    try:
+        tenants = discover_tenants(args.sources)
+    except ValueError as exc:
+        sys.exit(f"Error: {exc}")
+    if not tenants:
+        sys.exit("Error: no taxonomy files found.")
+
+    start = time.perf_counter()
+    results = run_batch(tenants, args.output_root, args.workers, args.incremental, not args.no_validate, args.zip)
+    print_summary(results, time.perf_counter() - start)
+
+    if args.summary_json:
+        with open(args.summary_json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if not all(r['ok'] for r in results):
+        sys.exit(1)
@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import create_metadata_records
+import generate_picklist_metadata
+import json_generator
+import renderers
+import taxonomy
+import validation
+from synthetic_taxonomy import DEFAULT_FANOUT, DEFAULT_SEED, count_nodes, generate_csv_text, generate_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_REPEAT = 3
+RESULTS_FILE = 'bench_results.json'
+
+# A stage is reported as a regression when it is this much slower than the
+# baseline results (0.25 = 25%).
+DEFAULT_TOLERANCE = 0.25
+
+# ---------------------------------------------------------
+# STAGES
+# ---------------------------------------------------------
+# Every stage runs inside a scratch directory holding the synthetic real.json,
+# exactly like the scripts run inside scripts/python.
+
+def _reset_caches():
+    taxonomy._cache.clear()
+    # Every lru_cache of the renderers, including ones added later
+    for cached in vars(renderers).values():
+        if callable(getattr(cached, 'cache_clear', None)):
+            cached.cache_clear()
+
+def stage_csv_to_json(csv_text):
+    return json_generator.parse_csv_to_nested_json(csv_text)
+
+def stage_validate(csv_text):
+    tax = taxonomy.load_taxonomy(generate_picklist_metadata.INPUT_FILE)
+    return validation.validate_taxonomy(tax, create_metadata_records.record_for_node,
+                                        create_metadata_records.record_label)
+
+# Synthetic names easily break the Salesforce limits (long DeveloperNames),
+# so the render stages skip validation; it is timed on its own above.
+def stage_picklists(csv_text):
+    shutil.rmtree(generate_picklist_metadata.OUTPUT_DIR, ignore_errors=True)
+    generate_picklist_metadata.process_json_and_generate_files(validate=False)
+
+def stage_records(csv_text):
+    shutil.rmtree(create_metadata_records.ROOT_DIR, ignore_errors=True)
+    create_metadata_records.process_json(validate=False)
+
+STAGES = {
+    'csv_to_json': stage_csv_to_json,
+    'validate': stage_validate,
+    'json_to_picklists': stage_picklists,
+    'json_to_records': stage_records,
+}
+
+def _count_output(path):
+    files = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+def run_stage(stage, csv_text, repeat, measure_memory):
+    """
+    Times `stage` (best of `repeat` runs) and, optionally, measures its peak
+    Python heap with tracemalloc in one extra run (tracemalloc slows the code
+    down, so it never overlaps with the timed runs).
+    """
+    func = STAGES[stage]
+    timings = []
+    for _ in range(repeat):
+        _reset_caches()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(csv_text)
+            timings.append(time.perf_counter() - start)
+
+    result = {
+        'seconds': min(timings),
+        'seconds_all': timings,
+    }
+
+    if measure_memory:
+        _reset_caches()
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(csv_text)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    if stage == 'json_to_picklists':
+        result['files'], result['bytes'] = _count_output(generate_picklist_metadata.OUTPUT_DIR)
+    elif stage == 'json_to_records':
+        result['files'], result['bytes'] = _count_output(create_metadata_records.ROOT_DIR)
+    return result
+
+def run_benchmarks(sizes, fanout=DEFAULT_FANOUT, seed=DEFAULT_SEED, stages=None, repeat=DEFAULT_REPEAT,
+                   measure_memory=True):
+    """
+    Runs every stage against synthetic taxonomies of the given sizes.
+
+    :return: Dict of machine-readable results (see RESULTS_FILE).
+    """
+    stages = stages or list(STAGES)
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'fanout': list(fanout),
+        'seed': seed,
+        'repeat': repeat,
+        'runs': [],
+    }
+
+    cwd = os.getcwd()
+    for size in sizes:
+        data = generate_taxonomy(size, fanout, seed)
+        csv_text = generate_csv_text(data)
+        work_dir = tempfile.mkdtemp(prefix='taxonomy_bench_')
+        try:
+            os.chdir(work_dir)
+            # Both generators read the same INPUT_FILE name
+            with open(generate_picklist_metadata.INPUT_FILE, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+
+            for stage in stages:
+                run = {'stage': stage, 'target_nodes': size, 'nodes': count_nodes(data)}
+                run.update(run_stage(stage, csv_text, repeat, measure_memory))
+                results['runs'].append(run)
+                print(f"{stage:<18} {run['nodes']:>9} nodes  {run['seconds']:9.3f}s"
+                      + (f"  {run['peak_bytes'] / 1e6:9.1f} MB peak" if 'peak_bytes' in run else ""),
+                      file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+# ---------------------------------------------------------
+# REGRESSIONS
+# ---------------------------------------------------------
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares two result sets run by run (same stage and size).
+
+    :return: List of human readable regression messages.
+    """
+    previous = {(r['stage'], r['target_nodes']): r for r in baseline.get('runs', [])}
+    regressions = []
+    for run in results['runs']:
+        before = previous.get((run['stage'], run['target_nodes']))
+        if not before:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if metric in run and metric in before and before[metric] > 0:
+                ratio = run[metric] / before[metric]
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{run['stage']} @ {run['target_nodes']} nodes: {metric} "
+                                       f"{before[metric]:.4g} -> {run[metric]:.4g} (+{(ratio - 1) * 100:.0f}%)")
+    return regressions
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic taxonomies")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="approximate node counts, e.g. 100 1000 10000 100000 1000000")
+    parser.add_argument('--fanout', type=int, nargs=2, default=DEFAULT_FANOUT, metavar=('SUBTYPES', 'DETAILS'))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON results file")
+    parser.add_argument('--baseline', help="results file to compare against; exits 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    # Resolve paths before the benchmark changes directories
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args.sizes, tuple(args.fanout), args.seed, args.stages, args.repeat,
+                             measure_memory=not args.no_memory)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to '{output}'")
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
@@ -0,0 +1,294 @@
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+
+from hierarchy import SCHEMA, padded
+from taxonomy import load_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+INPUT_FILE = 'real.json'
+OUTPUT_DIR = 'campaign_load'
+FILE_PREFIX = 'campaigns'
+
+# Rows per CSV file (a Bulk API batch holds at most 10,000 records)
+DEFAULT_CHUNK_ROWS = 10000
+
+YEAR_TOKEN = '{year}'
+NAME_MAX_LENGTH = 80  # Campaign.Name
+
+# Bulk API CSV columns of the Campaign rows: a picklist field per level
+CSV_HEADER = ['Name'] + [level.picklist_field for level in SCHEMA] + ['Hebrew_Year__c', 'IsActive']
+
+# How {year} is written in the Campaign name:
+#   short  - last 2 digits, like CampaignGeneratorAction (5784 -> 84)
+#   full   - the whole year (5784)
+#   hebrew - Hebrew numerals without the thousands (5784 -> תשפ״ד), except for
+#            exact thousands (5000 -> ה׳)
+YEAR_FORMATS = ('short', 'full', 'hebrew')
+
+HEBREW_NUMERALS = [
+    (400, 'ת'), (300, 'ש'), (200, 'ר'), (100, 'ק'),
+    (90, 'צ'), (80, 'פ'), (70, 'ע'), (60, 'ס'), (50, 'נ'), (40, 'מ'), (30, 'ל'), (20, 'כ'), (10, 'י'),
+    (9, 'ט'), (8, 'ח'), (7, 'ז'), (6, 'ו'), (5, 'ה'), (4, 'ד'), (3, 'ג'), (2, 'ב'), (1, 'א'),
+]
+GERESH = '׳'
+GERSHAYIM = '״'
+
+# ---------------------------------------------------------
+# YEARS
+# ---------------------------------------------------------
+
+def hebrew_numeral(number):
+    """
+    Writes 1..999 in Hebrew numerals (gematria), e.g. 784 -> תשפ״ד.
+    15 and 16 are written ט״ו / ט״ז, as is customary.
+
+    :raises ValueError: outside 1..999 (there is no letter for 0).
+    """
+    if not 1 <= number <= 999:
+        raise ValueError(f"{number} cannot be written in Hebrew numerals (1..999)")
+    letters = []
+    rest = number
+    for value, letter in HEBREW_NUMERALS:
+        while rest >= value:
+            letters.append(letter)
+            rest -= value
+    text = ''.join(letters)
+    text = text.replace('יה', 'טו').replace('יו', 'טז')
+    if len(text) == 1:
+        return text + GERESH
+    return text[:-1] + GERSHAYIM + text[-1]
+
+def year_label(year, year_format='short'):
+    """The text that replaces {year} in a Campaign name."""
+    year_text = str(year)
+    if year_format == 'short':
+        return year_text[-2:]
+    if year_format == 'hebrew':
+        # Exact thousands (5000) are written with the thousands: ה׳
+        year = int(year)
+        return hebrew_numeral(year % 1000 or year // 1000)
+    return year_text
+
+def parse_years(specs):
+    """
+    Turns ['5784-5786', '5790'] into [5784, 5785, 5786, 5790].
+
+    :raises ValueError: on anything that is not a year or a FROM-TO range.
+    """
+    years = []
+    for spec in specs:
+        for part in spec.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, end = (int(p) for p in part.split('-', 1))
+                if end < start:
+                    raise ValueError(f"Empty year range: {part}")
+                years.extend(range(start, end + 1))
+            else:
+                years.append(int(part))
+    # Keep the order given, drop repeats
+    return list(dict.fromkeys(years))
+
+# ---------------------------------------------------------
+# EXPANSION
+# ---------------------------------------------------------
+
+class CampaignTemplate:
+    """
+    One record of the taxonomy, prepared once so that expanding it for a year
+    is a single join (the name is pre-split around {year}).
+    """
+    __slots__ = ('names', 'name_parts', 'connected_to_year')
+
+    def __init__(self, node):
+        # One name per level, '' below the node's level
+        self.names = padded(node.path)
+        self.connected_to_year = node.connected_to_year
+        self.name_parts = (node.campaign_name or '').split(YEAR_TOKEN)
+
+    def key(self, year):
+        # Same key as CampaignGeneratorAction.generateKey
+        return "|".join(self.names + (str(year or ''),)).lower()
+
+    def row(self, year=None, label=None):
+        if year is None:
+            # Not connected to a year: {year} is left as is (as in the Apex action)
+            name = YEAR_TOKEN.join(self.name_parts)
+            hebrew_year = ''
+        else:
+            name = label.join(self.name_parts)
+            hebrew_year = str(year)
+        return [name[:NAME_MAX_LENGTH], *self.names, hebrew_year, 'true']
+
+
+def expand_campaigns(taxonomy, years, year_format='short', skipped=None):
+    """
+    Yields one Campaign row per record not connected to a year, then, year by
+    year, one row per year-connected record (the cross product).
+
+    Rows follow CampaignGeneratorAction: {year} is only replaced on records
+    connected to a year, names are cut to 80 characters and repeated
+    Type|SubType|Detail|Year keys are written once.
+
+    :param years: Hebrew years, e.g. [5784, 5785].
+    :param skipped: Optional list collecting the paths of records without a campaign name.
+    """
+    static = []
+    yearly = []
+    for node in taxonomy.iter_entries():
+        if not node.campaign_name:
+            if skipped is not None:
+                skipped.append(' > '.join(node.path))
+            continue
+        template = CampaignTemplate(node)
+        (yearly if template.connected_to_year else static).append(template)
+
+    seen = set()
+    for template in static:
+        key = template.key(None)
+        if key not in seen:
+            seen.add(key)
+            yield template.row()
+
+    for year in years:
+        label = year_label(year, year_format)
+        for template in yearly:
+            key = template.key(year)
+            if key not in seen:
+                seen.add(key)
+                yield template.row(year, label)
+
+# ---------------------------------------------------------
+# OUTPUT
+# ---------------------------------------------------------
+
+class ChunkedCsvWriter:
+    """
+    Writes rows to numbered CSV files (campaigns_001.csv, ...) of at most
+    `chunk_rows` rows each, every file starting with the header, optionally
+    gzipped. Gzip headers carry no timestamp, so the same rows always give
+    the same bytes.
+    """
+
+    def __init__(self, directory, header, chunk_rows=DEFAULT_CHUNK_ROWS, compress=False, prefix=FILE_PREFIX):
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+        self.directory = directory
+        self.header = header
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.prefix = prefix
+        self.files = []
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._chunk_rows = 0
+
+    def _open_next(self):
+        self._close_current()
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}_{len(self.files) + 1:03d}.csv" + ('.gz' if self.compress else '')
+        path = os.path.join(self.directory, name)
+        if self.compress:
+            raw = gzip.GzipFile(path, 'wb', mtime=0)
+            self._file = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(self.header)
+        self._chunk_rows = 0
+        self.files.append(path)
+
+    def _close_current(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def writerows(self, rows):
+        rows = iter(rows)
+        while True:
+            if self._file is None or self._chunk_rows >= self.chunk_rows:
+                # Only start a file once there is a row for it
+                first = next(rows, None)
+                if first is None:
+                    return
+                self._open_next()
+                self._writer.writerow(first)
+                self._chunk_rows += 1
+                self.rows += 1
+            # Fill the rest of the chunk in one writerows call
+            room = self.chunk_rows - self._chunk_rows
+            batch = [row for _, row in zip(range(room), rows)]
+            if not batch:
+                return
+            self._writer.writerows(batch)
+            self._chunk_rows += len(batch)
+            self.rows += len(batch)
+
+    def close(self):
+        self._close_current()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def remove_chunk_files(directory, prefix=FILE_PREFIX):
+    """Deletes the CSV files of an earlier run, so no stale chunk is left behind."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith(f"{prefix}_") and name.endswith(('.csv', '.csv.gz')):
+            os.remove(os.path.join(directory, name))
+
+def write_campaign_files(taxonomy, years, output_dir=OUTPUT_DIR, year_format='short',
+                         chunk_rows=DEFAULT_CHUNK_ROWS, compress=False):
+    """
+    Expands the taxonomy over `years` into chunked Bulk API CSV files.
+
+    :return: (written file paths, number of rows, paths of records skipped for lack of a name)
+    """
+    skipped = []
+    remove_chunk_files(output_dir)
+    with ChunkedCsvWriter(output_dir, CSV_HEADER, chunk_rows, compress) as writer:
+        writer.writerows(expand_campaigns(taxonomy, years, year_format, skipped))
+    return writer.files, writer.rows, skipped
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand real.json over Hebrew years into Bulk API Campaign CSVs")
+    parser.add_argument('years', nargs='+', help="Hebrew years or ranges, e.g. 5784-5793 or 5784,5786")
+    parser.add_argument('--input', default=INPUT_FILE)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--year-format', choices=YEAR_FORMATS, default='short',
+                        help="how {year} is written in the Campaign name (default: last 2 digits, like the Apex action)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="rows per CSV file")
+    parser.add_argument('--gzip', action='store_true', help="gzip the CSV files")
+    args = parser.parse_args()
+
+    try:
+        years = parse_years(args.years)
+    except ValueError as exc:
+        sys.exit(f"Error: invalid years: {exc}")
+    if not os.path.exists(args.input):
+        sys.exit(f"Error: {args.input} not found.")
+
+    taxonomy = load_taxonomy(args.input)
+    files, rows, skipped = write_campaign_files(taxonomy, years, args.output_dir, args.year_format,
+                                                args.chunk_rows, args.gzip)
+    for path in skipped:
+        print(f"Skipped (no campaign name): {path}")
+    print(f"Success! {rows} campaigns for {len(years)} year(s) written to {len(files)} file(s) in '{args.output_dir}'")
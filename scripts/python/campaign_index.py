@@ -0,0 +1,516 @@
+import argparse
+import array
+import csv
+import difflib
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+import zlib
+
+from taxonomy import load_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+INPUT_FILE = 'real.json'
+INDEX_FILE = 'campaign_index.bin'
+
+MAGIC = b'CMPIDX\0\0'
+FORMAT_VERSION = 1
+NO_PARENT = 0xFFFFFFFF
+
+# Sections of the file, in order; each is an array of little-endian uint32
+# except the string blob (UTF-8).
+SECTIONS = ('string_offsets', 'string_blob', 'entries', 'hash', 'children', 'trie', 'postings')
+# magic, version, entry count, then (offset, length) of every section
+HEADER = struct.Struct('<8s2I' + 'II' * len(SECTIONS))
+
+# Entry: name, normalized path key, campaignName (string ids), parent entry,
+# flags, first child (index into `children`), child count
+ENTRY_FIELDS = 7
+FLAG_INDEPENDENT = 1
+FLAG_YEAR = 2
+DEPTH_SHIFT = 2
+
+# Trie node: code point, first child node, child count, first posting, posting count
+TRIE_FIELDS = 5
+
+# Fuzzy matches below this similarity (0..1) are not accepted
+FUZZY_CUTOFF = 0.8
+# Score given to names that only differ in their vowels (Bamidbor / Bamidbar)
+SKELETON_SCORE = 0.9
+
+PATH_SEPARATOR = '\x1f'
+_APOSTROPHES = re.compile("['\u2019`\u05f3]")
+_NON_WORD = re.compile(r'[\W_]+')
+_VOWELS = re.compile(r'(?<=.)[aeiouy]+')
+
+# ---------------------------------------------------------
+# NORMALIZATION
+# ---------------------------------------------------------
+
+def normalize(name):
+    """'  Men's Mikvah - Fund ' -> 'mens mikvah fund' (case, accents and punctuation folded)."""
+    decomposed = unicodedata.normalize('NFKD', _APOSTROPHES.sub('', name or ''))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD.sub(' ', stripped.casefold()).strip()
+
+def skeleton(normalized):
+    """Consonant skeleton used for spelling variants: 'bamidbor' -> 'bmdbr'."""
+    return _VOWELS.sub('', normalized.replace(' ', ''))
+
+def path_key(names):
+    """Hash key of a (Type, SubType, Detail) path; trailing empty names are dropped."""
+    names = [normalize(n) for n in names]
+    while names and not names[-1]:
+        names.pop()
+    return PATH_SEPARATOR.join(names)
+
+# ---------------------------------------------------------
+# BUILDING
+# ---------------------------------------------------------
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, text):
+        if text not in self.ids:
+            self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self.ids[text]
+
+    def sections(self):
+        offsets = array.array('I', [0])
+        blob = bytearray()
+        for text in self.strings:
+            blob += text.encode('utf-8')
+            offsets.append(len(blob))
+        return offsets, bytes(blob)
+
+
+def _hash_capacity(count):
+    capacity = 8
+    while capacity < count * 2:
+        capacity *= 2
+    return capacity
+
+def _build_trie(names_with_entries):
+    """
+    :param names_with_entries: Dict { normalized name: [entry ids] }.
+    :return: (trie array, postings array), nodes laid out breadth first so
+        the children of a node are contiguous and sorted by code point.
+    """
+    root = {}
+    for name, entries in names_with_entries.items():
+        node = root
+        for char in name:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).extend(entries)
+
+    trie = array.array('I')
+    postings = array.array('I')
+    queue = [(0, root)]
+    trie.extend([0] * TRIE_FIELDS)
+    head = 0
+    while head < len(queue):
+        position, node = queue[head]
+        head += 1
+        entries = node.get(None, [])
+        trie[position + 3] = len(postings)
+        trie[position + 4] = len(entries)
+        postings.extend(entries)
+        chars = sorted(c for c in node if c is not None)
+        trie[position + 1] = len(trie) // TRIE_FIELDS
+        trie[position + 2] = len(chars)
+        for char in chars:
+            child_position = len(trie)
+            trie.extend([ord(char), 0, 0, 0, 0])
+            queue.append((child_position, node[char]))
+    return trie, postings
+
+def build_index(taxonomy):
+    """
+    Serializes the lookup index of a Taxonomy.
+
+    :return: The index file content (bytes).
+    """
+    strings = _StringTable()
+    entry_ids = {}
+    entries = array.array('I')
+    children = array.array('I')
+    names = {}
+    for entry_id, node in enumerate(taxonomy.nodes):
+        entry_ids[node] = entry_id
+        flags = node.depth << DEPTH_SHIFT
+        if node.independent_entry:
+            flags |= FLAG_INDEPENDENT
+        if node.connected_to_year:
+            flags |= FLAG_YEAR
+        parent = entry_ids[node.parent] if node.parent is not None else NO_PARENT
+        entries.extend([strings.add(node.name), strings.add(path_key(node.path)), strings.add(node.campaign_name),
+                        parent, flags, 0, 0])
+        names.setdefault(normalize(node.name), []).append(entry_id)
+    for entry_id, node in enumerate(taxonomy.nodes):
+        base = entry_id * ENTRY_FIELDS
+        entries[base + 5] = len(children)
+        entries[base + 6] = len(node.children)
+        children.extend(entry_ids[child] for child in node.children)
+
+    # Open addressing with linear probing; a slot holds entry id + 1 (0 = empty).
+    # The first node of a path wins when two paths normalize to the same key.
+    capacity = _hash_capacity(len(taxonomy.nodes))
+    table = array.array('I', [0]) * capacity
+    for entry_id in range(len(taxonomy.nodes)):
+        key = strings.strings[entries[entry_id * ENTRY_FIELDS + 1]]
+        slot = zlib.crc32(key.encode('utf-8')) & (capacity - 1)
+        while table[slot]:
+            if strings.strings[entries[(table[slot] - 1) * ENTRY_FIELDS + 1]] == key:
+                break
+            slot = (slot + 1) & (capacity - 1)
+        else:
+            table[slot] = entry_id + 1
+
+    string_offsets, string_blob = strings.sections()
+    trie, postings = _build_trie(names)
+    payloads = [string_offsets.tobytes(), string_blob, entries.tobytes(), table.tobytes(),
+                children.tobytes(), trie.tobytes(), postings.tobytes()]
+    if sys.byteorder != 'little':
+        for position in (0, 2, 3, 4, 5, 6):
+            swapped = array.array('I', payloads[position])
+            swapped.byteswap()
+            payloads[position] = swapped.tobytes()
+
+    layout = []
+    offset = HEADER.size
+    for payload in payloads:
+        # uint32 sections stay 4-byte aligned
+        offset += -offset % 4
+        layout.extend([offset, len(payload)])
+        offset += len(payload)
+    content = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, len(taxonomy.nodes), *layout))
+    for payload, section_offset in zip(payloads, layout[::2]):
+        content += b'\0' * (section_offset - len(content))
+        content += payload
+    return bytes(content)
+
+def write_index(taxonomy, path=INDEX_FILE):
+    content = build_index(taxonomy)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return len(content)
+
+# ---------------------------------------------------------
+# QUERYING
+# ---------------------------------------------------------
+
+class IndexEntry:
+    """One Type / SubType / Detail of the index, as returned by the queries."""
+    __slots__ = ('path', 'campaign_name', 'independent_entry', 'connected_to_year', 'score')
+
+    def __init__(self, path, campaign_name, independent_entry, connected_to_year, score=1.0):
+        self.path = path
+        self.campaign_name = campaign_name
+        self.independent_entry = independent_entry
+        self.connected_to_year = connected_to_year
+        # 1.0 for exact matches, lower for fuzzy ones
+        self.score = score
+
+    def __repr__(self):
+        return f"IndexEntry({' > '.join(self.path)!r}, campaign_name={self.campaign_name!r}, score={self.score:.2f})"
+
+
+class CampaignIndex:
+    """
+    Read-only view of an index file. The file is memory-mapped and queried in
+    place: opening it costs the same for ten or a million entries, and
+    processes resolving rows in parallel share its pages.
+    """
+
+    def __init__(self, path=INDEX_FILE):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._map)
+        magic, version, self.entry_count = header[:3]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a campaign index (version {FORMAT_VERSION})")
+        if sys.byteorder != 'little':
+            self._map.close()
+            raise ValueError("Campaign index files can only be read on little-endian machines")
+        view = memoryview(self._map)
+        sections = {}
+        for position, name in enumerate(SECTIONS):
+            offset, length = header[3 + position * 2], header[4 + position * 2]
+            section = view[offset:offset + length]
+            sections[name] = section if name == 'string_blob' else section.cast('I')
+        self._string_offsets = sections['string_offsets']
+        self._blob = sections['string_blob']
+        self._entries = sections['entries']
+        self._hash = sections['hash']
+        self._children = sections['children']
+        self._trie = sections['trie']
+        self._postings = sections['postings']
+        self._roots = None
+
+    def close(self):
+        for section in (self._string_offsets, self._blob, self._entries, self._hash,
+                        self._children, self._trie, self._postings):
+            section.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.entry_count
+
+    # -- raw access ------------------------------------------------------
+
+    def _string(self, string_id):
+        return str(self._blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]], 'utf-8')
+
+    def _field(self, entry_id, field):
+        return self._entries[entry_id * ENTRY_FIELDS + field]
+
+    def _children_of(self, entry_id):
+        if entry_id is None:
+            if self._roots is None:
+                self._roots = [e for e in range(self.entry_count) if self._field(e, 3) == NO_PARENT]
+            return self._roots
+        start = self._field(entry_id, 5)
+        return list(self._children[start:start + self._field(entry_id, 6)])
+
+    def _entry(self, entry_id, score=1.0):
+        names = []
+        node = entry_id
+        while node != NO_PARENT:
+            names.append(self._string(self._field(node, 0)))
+            node = self._field(node, 3)
+        flags = self._field(entry_id, 4)
+        return IndexEntry(tuple(reversed(names)), self._string(self._field(entry_id, 2)),
+                          bool(flags & FLAG_INDEPENDENT), bool(flags & FLAG_YEAR), score)
+
+    def _find(self, key):
+        encoded = key.encode('utf-8')
+        mask = len(self._hash) - 1
+        slot = zlib.crc32(encoded) & mask
+        while True:
+            value = self._hash[slot]
+            if not value:
+                return None
+            key_id = self._field(value - 1, 1)
+            if self._blob[self._string_offsets[key_id]:self._string_offsets[key_id + 1]] == encoded:
+                return value - 1
+            slot = (slot + 1) & mask
+
+    # -- queries ---------------------------------------------------------
+
+    def lookup(self, type_name, subtype='', detail='', fuzzy=False):
+        """
+        Resolves a (Type, SubType, Detail) triple; empty trailing names
+        resolve to the Type or SubType itself.
+
+        :param fuzzy: When there is no exact match, match each level to the
+            most similar name under the level above (see FUZZY_CUTOFF).
+        :return: IndexEntry, or None.
+        """
+        names = (type_name, subtype, detail)
+        key = path_key(names)
+        if not key:
+            return None
+        entry_id = self._find(key)
+        if entry_id is not None:
+            return self._entry(entry_id)
+        if fuzzy:
+            return self._fuzzy(key.split(PATH_SEPARATOR))
+        return None
+
+    def _fuzzy(self, names):
+        parent = None
+        score = 1.0
+        for name in names:
+            best, best_score = None, 0.0
+            name_skeleton = skeleton(name)
+            for child in self._children_of(parent):
+                candidate = normalize(self._string(self._field(child, 0)))
+                if candidate == name:
+                    best, best_score = child, 1.0
+                    break
+                similarity = difflib.SequenceMatcher(None, name, candidate).ratio()
+                if name_skeleton and skeleton(candidate) == name_skeleton:
+                    similarity = max(similarity, SKELETON_SCORE)
+                if similarity > best_score:
+                    best, best_score = child, similarity
+            if best is None or best_score < FUZZY_CUTOFF:
+                return None
+            parent = best
+            score = min(score, best_score)
+        return self._entry(parent, score)
+
+    def lookup_many(self, triples, fuzzy=False):
+        """
+        Resolves many triples (e.g. the rows of a donation import); each
+        distinct path is only resolved once per call, so the cache never
+        outlives (or outgrows) the batch it serves.
+
+        :param triples: Iterable of (Type, SubType, Detail).
+        :return: Generator of IndexEntry or None, in input order.
+        """
+        # Rows repeat the same spellings, so the raw triple is looked up
+        # before paying for normalization
+        cache = {}
+        for triple in triples:
+            raw_key = (tuple(triple), fuzzy)
+            entry = cache.get(raw_key, cache)
+            if entry is cache:
+                key = (path_key(triple), fuzzy)
+                if key not in cache:
+                    cache[key] = self.lookup(*triple, fuzzy=fuzzy)
+                entry = cache[raw_key] = cache[key]
+            yield entry
+
+    def prefix(self, text, level=None, limit=20):
+        """
+        Entries whose own name starts with `text` (normalized), shortest
+        names first.
+
+        :param level: Only 'type', 'subtype' or 'detail' entries.
+        """
+        depth = {'type': 0, 'subtype': 1, 'detail': 2}[level] if level else None
+        node = 0
+        for char in normalize(text):
+            start = self._trie[node * TRIE_FIELDS + 1]
+            low, high = start, start + self._trie[node * TRIE_FIELDS + 2]
+            code = ord(char)
+            while low < high:
+                middle = (low + high) // 2
+                if self._trie[middle * TRIE_FIELDS] < code:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == start + self._trie[node * TRIE_FIELDS + 2] or self._trie[low * TRIE_FIELDS] != code:
+                return []
+            node = low
+
+        results = []
+        queue = [node]
+        # Breadth first: shorter names come first
+        while queue and len(results) < limit:
+            next_queue = []
+            for node in queue:
+                base = node * TRIE_FIELDS
+                first = self._trie[base + 3]
+                for entry_id in self._postings[first:first + self._trie[base + 4]]:
+                    if depth is None or self._field(entry_id, 4) >> DEPTH_SHIFT == depth:
+                        results.append(self._entry(entry_id))
+                        if len(results) == limit:
+                            return results
+                start = self._trie[base + 1]
+                next_queue.extend(range(start, start + self._trie[base + 2]))
+            queue = next_queue
+        return results
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+def resolve_csv(index, source, target, fuzzy=False):
+    """
+    Adds Campaign_Name and Match_Score columns to a CSV with Type, SubType
+    and Detail columns. Rows matching a node without a campaign (not an
+    independentEntry) are left blank and counted as unresolved.
+
+    :return: (rows, unresolved rows)
+    """
+    reader = csv.DictReader(source)
+    missing = {'Type', 'SubType', 'Detail'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}")
+    writer = csv.DictWriter(target, reader.fieldnames + ['Campaign_Name', 'Match_Score'])
+    writer.writeheader()
+    rows = unresolved = 0
+    buffered = []
+    for row in reader:
+        buffered.append(row)
+        if len(buffered) == 10000:
+            unresolved += _write_resolved(index, buffered, writer, fuzzy)
+            rows += len(buffered)
+            buffered = []
+    unresolved += _write_resolved(index, buffered, writer, fuzzy)
+    return rows + len(buffered), unresolved
+
+def _write_resolved(index, rows, writer, fuzzy):
+    unresolved = 0
+    triples = ((r['Type'], r['SubType'], r['Detail']) for r in rows)
+    for row, entry in zip(rows, index.lookup_many(triples, fuzzy)):
+        if entry is None or not entry.campaign_name:
+            unresolved += 1
+            row['Campaign_Name'], row['Match_Score'] = '', ''
+        else:
+            row['Campaign_Name'], row['Match_Score'] = entry.campaign_name, f"{entry.score:.2f}"
+    writer.writerows(rows)
+    return unresolved
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the binary campaign lookup index")
+    parser.add_argument('--index', default=INDEX_FILE, help=f"index file (default: {INDEX_FILE})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="write the index from real.json")
+    build.add_argument('--input', default=INPUT_FILE)
+
+    lookup = commands.add_parser('lookup', help="resolve one Type [SubType [Detail]]")
+    lookup.add_argument('names', nargs='+', metavar='NAME')
+    lookup.add_argument('--fuzzy', action='store_true', help="accept spelling variants")
+
+    prefix = commands.add_parser('prefix', help="entries whose name starts with TEXT")
+    prefix.add_argument('text')
+    prefix.add_argument('--level', choices=('type', 'subtype', 'detail'))
+    prefix.add_argument('--limit', type=int, default=20)
+
+    resolve = commands.add_parser('resolve', help="add Campaign_Name to a CSV with Type, SubType and Detail columns")
+    resolve.add_argument('csv_file')
+    resolve.add_argument('--output', help="output CSV (default: stdout)")
+    resolve.add_argument('--fuzzy', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.exists(args.input):
+            sys.exit(f"Error: {args.input} not found.")
+        taxonomy = load_taxonomy(args.input)
+        size = write_index(taxonomy, args.index)
+        print(f"Index of {len(taxonomy)} nodes written to {args.index} ({size} bytes)")
+        sys.exit()
+
+    if not os.path.exists(args.index):
+        sys.exit(f"Error: {args.index} not found, run `campaign_index.py build` first.")
+    with CampaignIndex(args.index) as index:
+        if args.command == 'lookup':
+            if len(args.names) > 3:
+                sys.exit("Error: at most Type, SubType and Detail.")
+            entry = index.lookup(*args.names, fuzzy=args.fuzzy)
+            if entry is None:
+                sys.exit("Not found.")
+            print(f"{' > '.join(entry.path)}: {entry.campaign_name} (score {entry.score:.2f})")
+        elif args.command == 'prefix':
+            for entry in index.prefix(args.text, args.level, args.limit):
+                print(f"{' > '.join(entry.path)}: {entry.campaign_name}")
+        else:
+            with open(args.csv_file, 'r', encoding='utf-8-sig', newline='') as source:
+                out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+                try:
+                    rows, unresolved = resolve_csv(index, source, out, args.fuzzy)
+                except ValueError as exc:
+                    sys.exit(f"Error: {exc}")
+                finally:
+                    if args.output:
+                        out.close()
+            print(f"{rows} row(s) resolved, {unresolved} without a campaign", file=sys.stderr)
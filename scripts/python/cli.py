@@ -0,0 +1,212 @@
+import os
+import sys
+
+# Only os and sys are imported up front: every command imports what it needs
+# when it runs, so `cli.py build --check` on unchanged inputs stays within
+# a few milliseconds of a bare interpreter start.
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Subcommand -> (module run as __main__, description)
+COMMANDS = {
+    'json': ('json_generator', "CSV export -> real.json"),
+    'merge': ('csv_merge', "merge several CSV exports (and real.json) into one real.json"),
+    'picklists': ('generate_picklist_metadata', "real.json -> Campaign picklist metadata (deploy_package)"),
+    'records': ('create_metadata_records', "real.json -> custom metadata records (deploy_pkg)"),
+    'pipeline': ('pipeline', "CSV -> every output in one pass"),
+    'watch': ('watch', "regenerate both packages on every save of real.json (or the CSV)"),
+    'validate': ('validation', "check real.json against the Salesforce limits"),
+    'split': ('package_planner', "split a generated package into deploy batches within the API limits"),
+    'verify': ('verify_package', "parse the generated packages back and compare them with real.json"),
+    'diff': ('metadata_diff', "delta package against force-app"),
+    'mock-deploy': ('mock_deploy', "local mock Metadata API deploy server: limits, latency, throughput"),
+    'expand': ('campaign_expansion', "Bulk API Campaign CSVs over Hebrew years"),
+    'index': ('campaign_index', "binary campaign lookup index: build, lookup, prefix, resolve"),
+    'batch': ('batch', "build many tenant taxonomies in parallel"),
+    'bench': ('benchmark', "benchmark every stage"),
+}
+
+# Commands implemented here rather than by one of the scripts
+BUILTIN_COMMANDS = {
+    'build': "picklists + records in one process (--check: skip when inputs are unchanged)",
+    'startup': "measure the CLI start time against its budget",
+}
+
+# Remembers the inputs of the last successful `build`, for --check
+STAMP_FILE = '.build_stamp.json'
+STAMP_VERSION = 1
+
+# Median extra startup time of `cli.py --version` over a bare interpreter
+STARTUP_BUDGET_MS = 30
+STARTUP_RUNS = 15
+
+USAGE = """usage: cli.py <command> [options]
+
+{commands}
+
+Run `cli.py <command> --help` for the options of a command."""
+
+# ---------------------------------------------------------
+# CHANGE DETECTION
+# ---------------------------------------------------------
+
+def _sha1(path):
+    import hashlib
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def build_inputs(input_file):
+    """Everything a build depends on: the taxonomy and the generator code."""
+    scripts = sorted(os.path.join(SCRIPT_DIR, name) for name in os.listdir(SCRIPT_DIR) if name.endswith('.py'))
+    return [os.path.abspath(input_file)] + scripts
+
+def inputs_unchanged(stamp_file, inputs, outputs):
+    """
+    True when `inputs` match the stamp of the last build and the `outputs`
+    still exist. Files are compared by size and mtime; a file is only
+    hashed when its mtime moved (e.g. after a checkout).
+    """
+    import json
+    try:
+        with open(stamp_file, 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    recorded = stamp.get('inputs', {})
+    if stamp.get('version') != STAMP_VERSION or sorted(recorded) != sorted(inputs):
+        return False
+    if not all(os.path.isdir(path) for path in outputs):
+        return False
+    for path in inputs:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        size, mtime_ns, digest = recorded[path]
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns != mtime_ns and _sha1(path) != digest:
+            return False
+    return True
+
+def write_stamp(stamp_file, inputs):
+    import json
+    entries = {}
+    for path in inputs:
+        stat = os.stat(path)
+        entries[path] = [stat.st_size, stat.st_mtime_ns, _sha1(path)]
+    with open(stamp_file, 'w', encoding='utf-8') as f:
+        json.dump({'version': STAMP_VERSION, 'inputs': entries}, f, indent=2)
+
+# ---------------------------------------------------------
+# COMMANDS
+# ---------------------------------------------------------
+
+def run_module(command, argv):
+    """Runs the script behind `command` as if it was started directly."""
+    import runpy
+    module, _ = COMMANDS[command]
+    sys.argv = [os.path.join(SCRIPT_DIR, f"{module}.py")] + argv
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+def run_build(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='cli.py build',
+                                     description="Generate deploy_package and deploy_pkg from real.json")
+    parser.add_argument('--check', action='store_true',
+                        help="exit at once when real.json and the scripts are unchanged since the last build")
+    parser.add_argument('--input', default='real.json')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--incremental', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        sys.exit(f"Error: {args.input} not found.")
+    inputs = build_inputs(args.input)
+
+    if args.check and inputs_unchanged(STAMP_FILE, inputs, ('deploy_package', 'deploy_pkg')):
+        print("Up to date.")
+        return
+
+    # Imported only now: --check should not pay for them
+    import create_metadata_records
+    import generate_picklist_metadata
+    from taxonomy import load_taxonomy
+    from validation import ValidationError, check_taxonomy
+
+    taxonomy = load_taxonomy(args.input)
+    try:
+        # Both packages are checked before either is written
+        check_taxonomy(taxonomy, create_metadata_records.record_for_node, create_metadata_records.record_label)
+    except ValidationError as exc:
+        exc.report.print(file=sys.stderr)
+        sys.exit(f"\nFailed: {len(exc.report.errors)} validation error(s), nothing was written.")
+    generate_picklist_metadata.process_json_and_generate_files(
+        taxonomy, args.incremental, validate=False, input_file=args.input)
+    create_metadata_records.process_json(
+        taxonomy, args.incremental, args.workers, validate=False, input_file=args.input)
+    write_stamp(STAMP_FILE, inputs)
+
+def run_startup(argv):
+    """Measures `cli.py --version` against a bare interpreter; exits 1 over budget."""
+    import argparse
+    import statistics
+    import subprocess
+    import time
+    parser = argparse.ArgumentParser(prog='cli.py startup')
+    parser.add_argument('--runs', type=int, default=STARTUP_RUNS)
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    def median_ms(command):
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    bare = median_ms([sys.executable, '-c', 'pass'])
+    cli = median_ms([sys.executable, os.path.abspath(__file__), '--version'])
+    overhead = cli - bare
+    print(f"python: {bare:.1f} ms, cli.py: {cli:.1f} ms, overhead: {overhead:.1f} ms "
+          f"(budget {args.budget_ms:.0f} ms)")
+    if overhead > args.budget_ms:
+        sys.exit(1)
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+def main(argv):
+    if not argv or argv[0] in ('-h', '--help', 'help'):
+        descriptions = dict(BUILTIN_COMMANDS, **{name: description for name, (_, description) in COMMANDS.items()})
+        width = max(len(name) for name in descriptions)
+        commands = "\n".join(f"  {name:<{width + 2}}{description}" for name, description in descriptions.items())
+        print(USAGE.format(commands=commands))
+        return
+    if argv[0] == '--version':
+        print("cli.py 1")
+        return
+
+    command, rest = argv[0], argv[1:]
+    if command == 'build':
+        run_build(rest)
+    elif command == 'startup':
+        run_startup(rest)
+    elif command in COMMANDS:
+        run_module(command, rest)
+    else:
+        sys.exit(f"Unknown command '{command}'. Run `cli.py --help` for the list.")
+
+if __name__ == "__main__":
+    # The scripts import each other by module name
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    main(sys.argv[1:])
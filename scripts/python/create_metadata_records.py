@@ -1,7 +1,19 @@
-import json
+import argparse
+import contextlib
 import os
 import re
-import xml.sax.saxutils
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import hierarchy
+import instrumentation
+from hierarchy import SCHEMA
+from manifest import HashingWriter, Manifest, hash_content, hash_inputs
+from package_output import DirectoryOutput, open_archive
+from renderers import MdtRecordRenderer, escape_value, render_to_string
+from taxonomy import load_taxonomy
+from validation import LABEL_MAX_LENGTH, ValidationError, check_taxonomy
 
 # ---------------------------------------------------------
 # CONFIGURATION
@@ -10,48 +22,40 @@ INPUT_FILE = 'real.json'
 ROOT_DIR = 'deploy_pkg'
 OBJECTS_DIR = os.path.join(ROOT_DIR, 'objects')
 RECORDS_DIR = os.path.join(ROOT_DIR, 'customMetadata')
+# Folder of the record files inside ROOT_DIR (computed once, not per record)
+RECORDS_REL_DIR = os.path.relpath(RECORDS_DIR, ROOT_DIR)
 
 MDT_OBJECT_NAME = 'Financial_Campaign_Config__mdt' 
 MDT_FILENAME_PREFIX = 'Financial_Campaign_Config'
+RECORD_RENDERER = MdtRecordRenderer(MDT_OBJECT_NAME)
+
+# Parallel record writing: pending writes per worker before we wait for the
+# oldest one (keeps memory bounded on very large taxonomies).
+PENDING_WRITES_PER_WORKER = 4
 
 # ---------------------------------------------------------
 # TEMPLATES
 # ---------------------------------------------------------
 
-# The definition of the object and its fields
-OBJECT_XML_CONTENT = f"""<?xml version="1.0" encoding="UTF-8"?>
-<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">
-    <label>Financial Campaign Config</label>
-    <pluralLabel>Financial Campaign Configs</pluralLabel>
-    <visibility>Public</visibility>
-    <fields>
-        <fullName>Type__c</fullName>
-        <externalId>false</externalId>
-        <label>Type</label>
-        <length>255</length>
-        <required>false</required>
-        <type>Text</type>
-        <unique>false</unique>
-    </fields>
-    <fields>
-        <fullName>SubType__c</fullName>
+# One Text field per level of the hierarchy (see hierarchy.SCHEMA)
+LEVEL_FIELD_XML = """    <fields>
+        <fullName>{field}</fullName>
         <externalId>false</externalId>
-        <label>Sub Type</label>
+        <label>{label}</label>
         <length>255</length>
         <required>false</required>
         <type>Text</type>
         <unique>false</unique>
     </fields>
-    <fields>
-        <fullName>Detail__c</fullName>
-        <externalId>false</externalId>
-        <label>Detail</label>
-        <length>255</length>
-        <required>false</required>
-        <type>Text</type>
-        <unique>false</unique>
-    </fields>
-    <fields>
+"""
+
+# The definition of the object and its fields
+OBJECT_XML_CONTENT = f"""<?xml version="1.0" encoding="UTF-8"?>
+<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">
+    <label>Financial Campaign Config</label>
+    <pluralLabel>Financial Campaign Configs</pluralLabel>
+    <visibility>Public</visibility>
+{''.join(LEVEL_FIELD_XML.format(field=level.record_field, label=level.field_label) for level in SCHEMA)}    <fields>
         <fullName>Campaign_Name__c</fullName>
         <externalId>false</externalId>
         <label>Campaign Name Format</label>
@@ -74,15 +78,13 @@ OBJECT_XML_CONTENT = f"""<?xml version="1.0" encoding="UTF-8"?>
 # HELPERS
 # ---------------------------------------------------------
 
-def ensure_dirs():
-    if not os.path.exists(OBJECTS_DIR):
-        os.makedirs(OBJECTS_DIR)
-    if not os.path.exists(RECORDS_DIR):
-        os.makedirs(RECORDS_DIR)
+def ensure_dirs(root_dir=ROOT_DIR):
+    for directory in (os.path.join(root_dir, 'objects'), os.path.join(root_dir, 'customMetadata')):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
 
 def escape_xml(value):
-    if value is None: return ""
-    return xml.sax.saxutils.escape(str(value), {"'": "&apos;", "\"": "&quot;"})
+    return escape_value(value)
 
 def sanitize_developer_name(text):
     # Alphanumeric and underscores only, no double underscores
@@ -91,134 +93,242 @@ def sanitize_developer_name(text):
     return clean.strip('_')
 
 def create_mdt_record_xml(label, values):
-    lines = []
-    lines.append('<?xml version="1.0" encoding="UTF-8"?>')
-    lines.append(f'<CustomMetadata xmlns="http://soap.sforce.com/2006/04/metadata" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:type="{MDT_OBJECT_NAME}">')
-    lines.append(f'    <label>{escape_xml(label)}</label>')
-    lines.append(f'    <protected>false</protected>')
-    
-    for field_api, val in values.items():
-        lines.append('    <values>')
-        lines.append(f'        <field>{field_api}</field>')
-        if isinstance(val, bool):
-            xsi_type = "xsd:boolean"
-            val_str = str(val).lower()
-        else:
-            xsi_type = "xsd:string"
-            val_str = escape_xml(val)
-        lines.append(f'        <value xsi:type="{xsi_type}">{val_str}</value>')
-        lines.append('    </values>')
-
-    lines.append('</CustomMetadata>')
-    return "\n".join(lines)
+    return render_to_string(RECORD_RENDERER.render, label, values)
 
-def generate_object_file():
+def generate_object_file(manifest=None, output=None):
     filename = f"{MDT_OBJECT_NAME}.object"
-    file_path = os.path.join(OBJECTS_DIR, filename)
-    with open(file_path, 'w', encoding='utf-8') as f:
+    rel_path = os.path.relpath(os.path.join(OBJECTS_DIR, filename), ROOT_DIR)
+    if manifest is not None:
+        node_hash = hash_inputs(OBJECT_XML_CONTENT)
+        if manifest.is_current(MDT_OBJECT_NAME, node_hash, rel_path):
+            return
+        manifest.record(MDT_OBJECT_NAME, node_hash, rel_path, hash_content(OBJECT_XML_CONTENT))
+    with (output or DirectoryOutput(ROOT_DIR)).open(rel_path) as f:
         f.write(OBJECT_XML_CONTENT)
     print(f"Generated Object Definition: {filename}")
 
-def generate_record_file(dev_name, label, field_data):
-    # Returns the full member name for package.xml (e.g., Object.Record)
+def record_member(dev_name):
+    """Full member name (e.g., Object.Record) and path of a record inside ROOT_DIR."""
     full_member_name = f"{MDT_FILENAME_PREFIX}.{dev_name}"
     filename = f"{full_member_name}.md-meta.xml"
-    file_path = os.path.join(RECORDS_DIR, filename)
-    
-    xml_content = create_mdt_record_xml(label, field_data)
+    return full_member_name, os.path.join(RECORDS_REL_DIR, filename)
+
+def generate_record_file(dev_name, label, field_data, manifest=None, output=None):
+    # Returns the full member name for package.xml (e.g., Object.Record)
+    full_member_name, rel_path = record_member(dev_name)
+
+    # Incremental mode: skip rendering entirely when the inputs are unchanged
+    if manifest is not None:
+        node_hash = hash_inputs(label, field_data)
+        if manifest.is_current(full_member_name, node_hash, rel_path):
+            return full_member_name
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(xml_content)
+    with (output or DirectoryOutput(ROOT_DIR)).open(rel_path) as f:
+        if manifest is None:
+            RECORD_RENDERER.render(f, label, field_data)
+        else:
+            out = HashingWriter(f)
+            RECORD_RENDERER.render(out, label, field_data)
+            manifest.record(full_member_name, node_hash, rel_path, out.hexdigest())
     
     return full_member_name
 
-def generate_package_xml(members):
+class RecordWriteError(Exception):
+    """Raised after a parallel write when one or more record files failed."""
+
+    def __init__(self, errors):
+        self.errors = errors  # List of (dev_name, exception)
+        details = "; ".join(f"{dev_name}: {exc}" for dev_name, exc in errors[:10])
+        more = f" (and {len(errors) - 10} more)" if len(errors) > 10 else ""
+        super().__init__(f"{len(errors)} record file(s) failed: {details}{more}")
+
+def write_records_parallel(record_jobs, workers, manifest=None, output=None):
+    """
+    Renders and writes record files on a bounded pool of threads.
+
+    :param record_jobs: Iterable of (dev_name, label, field_data).
+    :param workers: Number of writer threads.
+    :return: Full member names, in the order of record_jobs.
+    :raises RecordWriteError: once every job has run, if any of them failed.
+    """
+    members = []
+    errors = []
+    pending = deque()
+    max_pending = workers * PENDING_WRITES_PER_WORKER
+
+    def collect(dev_name, future):
+        try:
+            members.append(future.result())
+        except Exception as exc:
+            errors.append((dev_name, exc))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for dev_name, label, field_data in record_jobs:
+            future = pool.submit(generate_record_file, dev_name, label, field_data, manifest, output)
+            pending.append((dev_name, future))
+            if len(pending) >= max_pending:
+                collect(*pending.popleft())
+        while pending:
+            collect(*pending.popleft())
+
+    if errors:
+        raise RecordWriteError(errors)
+    return members
+
+def package_xml(members, include_object=True):
+    """package.xml content listing the object definition (optional) and the record members."""
     lines = []
     lines.append('<?xml version="1.0" encoding="UTF-8"?>')
     lines.append('<Package xmlns="http://soap.sforce.com/2006/04/metadata">')
     
     # Add the Custom Object definition
-    lines.append('    <types>')
-    lines.append(f'        <members>{MDT_OBJECT_NAME}</members>')
-    lines.append('        <name>CustomObject</name>')
-    lines.append('    </types>')
+    if include_object:
+        lines.append('    <types>')
+        lines.append(f'        <members>{MDT_OBJECT_NAME}</members>')
+        lines.append('        <name>CustomObject</name>')
+        lines.append('    </types>')
     
     # Add the Custom Metadata Records
-    lines.append('    <types>')
-    for m in sorted(members):
-        lines.append(f'        <members>{m}</members>')
-    lines.append('        <name>CustomMetadata</name>')
-    lines.append('    </types>')
+    if members:
+        lines.append('    <types>')
+        for m in sorted(members):
+            lines.append(f'        <members>{m}</members>')
+        lines.append('        <name>CustomMetadata</name>')
+        lines.append('    </types>')
     
     lines.append('    <version>58.0</version>')
     lines.append('</Package>')
-    
-    with open(os.path.join(ROOT_DIR, 'package.xml'), 'w', encoding='utf-8') as f:
-        f.write("\n".join(lines))
+    return "\n".join(lines)
+
+def generate_package_xml(members, include_object=True, output=None):
+    with (output or DirectoryOutput(ROOT_DIR)).open('package.xml') as f:
+        f.write(package_xml(members, include_object))
     print("Generated package.xml")
 
 # ---------------------------------------------------------
 # MAIN LOGIC
 # ---------------------------------------------------------
 
-def process_json():
-    if not os.path.exists(INPUT_FILE):
-        print(f"Error: {INPUT_FILE} not found.")
-        return
+def record_label(node):
+    """Label of the record for one taxonomy node, before it is cut to LABEL_MAX_LENGTH."""
+    return hierarchy.record_label(node.path)
 
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def record_for_node(node):
+    """
+    Builds the DeveloperName, label and field values of the record for one
+    taxonomy node: one field per level (empty below the node's level).
+    """
+    path = node.path
+    dev_name = sanitize_developer_name(hierarchy.developer_name_source(path))
+    label = hierarchy.record_label(path)[:LABEL_MAX_LENGTH]
 
-    ensure_dirs()
-    generate_object_file()
+    fields = {level.record_field: name for level, name in zip(SCHEMA, hierarchy.padded(path))}
+    fields['Campaign_Name__c'] = node.campaign_name
+    fields['Has_Year__c'] = node.connected_to_year
+    return dev_name, label, fields
+
+def process_json(taxonomy=None, incremental=False, workers=1, output=None, validate=True, root_dir=ROOT_DIR,
+                 input_file=INPUT_FILE):
+    """
+    :param taxonomy: Already loaded Taxonomy (defaults to loading `input_file`).
+    :param incremental: Only re-render records whose inputs changed since the
+        last incremental run and delete orphaned record files. The changed
+        records and a destructiveChanges.xml of the removed ones are also
+        written to a delta package next to `root_dir` (see Manifest.write_delta).
+    :param workers: Number of threads writing record files (1 = serial).
+    :param output: Where members are written (see package_output); defaults
+        to files under ROOT_DIR.
+    :param validate: Check DeveloperName collisions and Salesforce limits
+        before writing anything (raises ValidationError).
+    :param root_dir: Package folder (written when no output is given, and
+        home of the incremental manifest).
+    :param input_file: real.json-shaped taxonomy read when no taxonomy is given.
+    """
+    if taxonomy is None:
+        if not os.path.exists(input_file):
+            print(f"Error: {input_file} not found.")
+            return
+        taxonomy = load_taxonomy(input_file)
+    instrumentation.count_taxonomy(taxonomy)
+
+    if validate:
+        with instrumentation.stage('validate'):
+            check_taxonomy(taxonomy, record_for_node, record_label, picklists=False)
+
+    if output is None:
+        ensure_dirs(root_dir)
+        output = DirectoryOutput(root_dir)
+    if incremental and not isinstance(output, DirectoryOutput):
+        raise ValueError("Incremental mode needs a directory output (it compares files on disk).")
+    manifest = Manifest(root_dir) if incremental else None
+    # Times every render / write when profiling (the same output otherwise)
+    files_output = instrumentation.profile_output(output)
+    generate_object_file(manifest, files_output)
     
-    generated_members = []
-
-    # TRAVERSAL
-    for type_node in data:
-        type_name = type_node.get('name', '')
-        
-        # LEVEL 1
-        if type_node.get('independentEntry') is True:
-            dev_name = sanitize_developer_name(type_name)
-            label = type_name[:40]
-            fields = {
-                'Type__c': type_name, 'SubType__c': '', 'Detail__c': '',
-                'Campaign_Name__c': type_node.get('campaignName', ''),
-                'Has_Year__c': type_node.get('connectedToYear', False)
-            }
-            generated_members.append(generate_record_file(dev_name, label, fields))
-
-        # LEVEL 2
-        if 'subtypes' in type_node:
-            for sub_node in type_node['subtypes']:
-                sub_name = sub_node.get('name', '')
-                if sub_node.get('independentEntry') is True:
-                    dev_name = sanitize_developer_name(f"{type_name}_{sub_name}")
-                    label = f"{type_name} - {sub_name}"[:40]
-                    fields = {
-                        'Type__c': type_name, 'SubType__c': sub_name, 'Detail__c': '',
-                        'Campaign_Name__c': sub_node.get('campaignName', ''),
-                        'Has_Year__c': sub_node.get('connectedToYear', False)
-                    }
-                    generated_members.append(generate_record_file(dev_name, label, fields))
-
-                # LEVEL 3
-                if 'details' in sub_node:
-                    for detail_node in sub_node['details']:
-                        detail_name = detail_node.get('name', '')
-                        if detail_node.get('independentEntry') is True:
-                            dev_name = sanitize_developer_name(f"{type_name}_{sub_name}_{detail_name}")
-                            label = f"{sub_name} - {detail_name}"[:40]
-                            fields = {
-                                'Type__c': type_name, 'SubType__c': sub_name, 'Detail__c': detail_name,
-                                'Campaign_Name__c': detail_node.get('campaignName', ''),
-                                'Has_Year__c': detail_node.get('connectedToYear', False)
-                            }
-                            generated_members.append(generate_record_file(dev_name, label, fields))
-
-    generate_package_xml(generated_members)
-    print(f"\nSuccess! Deployment package created in folder: '{ROOT_DIR}'")
+    # TRAVERSAL (pre-order: Type, its SubTypes, their Details)
+    record_jobs = (record_for_node(node) for node in taxonomy.iter_entries())
+
+    if workers > 1:
+        generated_members = write_records_parallel(record_jobs, workers, manifest, files_output)
+    else:
+        generated_members = []
+        for dev_name, label, fields in record_jobs:
+            generated_members.append(generate_record_file(dev_name, label, fields, manifest, files_output))
+
+    # The package folder always holds the full package; an incremental run
+    # also writes the delta next to it
+    generate_package_xml(generated_members, output=files_output)
+    if manifest is not None:
+        removed = manifest.remove_orphans()
+        changed = [m for m in manifest.changed if m != MDT_OBJECT_NAME]
+        unchanged = [m for m in manifest.unchanged if m != MDT_OBJECT_NAME]
+        delta_dir = manifest.write_delta(
+            package_xml(changed, include_object=MDT_OBJECT_NAME in manifest.changed),
+            package_xml(removed, include_object=False) if removed else None)
+        manifest.save()
+        print(f"Incremental: {len(changed)} changed, {len(unchanged)} unchanged, {len(removed)} removed "
+              f"(delta package in '{delta_dir}')")
+        for member in removed:
+            print(f"Removed orphaned record: {member}")
+
+    if isinstance(output, DirectoryOutput):
+        print(f"\nSuccess! Deployment package created in folder: '{root_dir}'")
+    else:
+        print(f"\nSuccess! Deployment package '{root_dir}' written to archive")
 
 if __name__ == "__main__":
-    process_json()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate Financial_Campaign_Config custom metadata records from real.json")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only rewrite records that changed since the last incremental run, and write "
+                             "them to a <output-dir>_delta package")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of threads writing record files (default: 1, serial)")
+    parser.add_argument('--zip', metavar='PATH', help="write a deploy-ready zip instead of the folder")
+    parser.add_argument('--tar', metavar='PATH', help="write a tar stream instead of the folder ('-' for stdout)")
+    parser.add_argument('--single-package', action='store_true',
+                        help="put package.xml at the archive root instead of under the deploy_pkg folder")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="skip the DeveloperName collision / Salesforce limit checks")
+    parser.add_argument('--input', default=INPUT_FILE, help=f"taxonomy JSON file (default: {INPUT_FILE})")
+    parser.add_argument('--output-dir', default=ROOT_DIR, help=f"package folder (default: {ROOT_DIR})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+
+    archive = open_archive(args.zip, args.tar)
+    output = archive.package('' if args.single_package else args.output_dir) if archive else None
+    # Keep stdout clean when it carries the tar stream
+    log = contextlib.redirect_stdout(sys.stderr) if args.tar == '-' else contextlib.nullcontext()
+    try:
+        with log, instrumentation.session(args, 'create_metadata_records'):
+            process_json(incremental=args.incremental, workers=args.workers, output=output,
+                         validate=not args.no_validate, root_dir=args.output_dir, input_file=args.input)
+    except ValidationError as exc:
+        exc.report.print(file=sys.stderr)
+        raise SystemExit(f"\nFailed: {len(exc.report.errors)} validation error(s), nothing was written.")
+    except RecordWriteError as exc:
+        for dev_name, error in exc.errors:
+            print(f"Error writing {dev_name}: {error}", file=sys.stderr)
+        raise SystemExit(f"\nFailed: {len(exc.errors)} record file(s) could not be written.")
+    finally:
+        if archive:
+            archive.close()
@@ -0,0 +1,322 @@
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from hierarchy import CHILD_KEYS, COLUMNS, DEPTH, LEVELS, NAME_COLUMN, YEAR_COLUMN, padded, row_path
+from json_generator import write_type_object
+from taxonomy import iter_raw_types
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# Rows sorted in memory at a time; larger inputs are spilled to sorted runs
+# on disk and merged.
+DEFAULT_CHUNK_ROWS = 200000
+
+CSV_COLUMNS = COLUMNS + (YEAR_COLUMN, NAME_COLUMN)
+
+# Rank of the existing real.json: every CSV export overrides it
+BASE_RANK = 0
+
+# Messages printed per kind on the command line
+MAX_PRINTED = 50
+
+# ---------------------------------------------------------
+# READING
+# ---------------------------------------------------------
+# Every input becomes a stream of records:
+#   [name per level (hierarchy.padded), source rank, row number,
+#    campaignName, connectedToYear, is entry]
+# Sorting on the names, rank and row groups the records of a node together,
+# with the record that wins (latest source, then latest row) last.
+RANK, ROW, CAMPAIGN_NAME, CONNECTED_TO_YEAR, ENTRY = range(DEPTH, DEPTH + 5)
+
+def _record(key, rank, row, campaign_name, connected_to_year, entry=True):
+    return list(key) + [rank, row, campaign_name, connected_to_year, entry]
+
+def iter_base_records(path):
+    """Records of an existing real.json (streamed, see taxonomy.iter_raw_types)."""
+    row = 0
+    for raw_type in iter_raw_types(path):
+        stack = [(raw_type, ())]
+        while stack:
+            raw, parent_names = stack.pop()
+            names = parent_names + ((raw.get('name') or '').strip(),)
+            key = padded(names)
+            entry = raw.get('independentEntry') is True
+            yield _record(key, BASE_RANK, row, raw.get('campaignName', '') if entry else '',
+                          raw.get('connectedToYear', False) if entry else False, entry)
+            row += 1
+            child_key = CHILD_KEYS.get(LEVELS[len(names) - 1])
+            if child_key:
+                for child in reversed(raw.get(child_key) or []):
+                    stack.append((child, names))
+
+def iter_csv_records(path, rank, problems):
+    """
+    Records of one CSV export, with the rules of json_generator.build_tree.
+
+    :param problems: List the rows that cannot be placed are reported to.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in CSV_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+        for row in reader:
+            try:
+                names = row_path(row)
+            except ValueError as exc:
+                problems.append(f"{path}:{reader.line_num}: {exc}, skipped")
+                continue
+            if not names:
+                problems.append(f"{path}:{reader.line_num}: row without a {COLUMNS[0]} skipped")
+                continue
+            connected_to_year = row[YEAR_COLUMN].strip().lower() == 'yes'
+            yield _record(padded(names), rank, reader.line_num, row[NAME_COLUMN].strip(), connected_to_year)
+
+# ---------------------------------------------------------
+# EXTERNAL SORT
+# ---------------------------------------------------------
+
+def _sort_key(record):
+    return record[:CAMPAIGN_NAME]
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+def sorted_records(records, chunk_rows=DEFAULT_CHUNK_ROWS, tmp_dir=None):
+    """
+    Sorts records in bounded memory: chunks of `chunk_rows` are sorted and
+    spilled to temporary run files, which are then merged lazily.
+
+    :return: Generator of records in key order.
+    :raises ValueError: when chunk_rows is below 1.
+    """
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be at least 1")
+    runs = []
+    with tempfile.TemporaryDirectory(prefix='csv_merge_', dir=tmp_dir) as run_dir:
+        while True:
+            chunk = list(itertools.islice(records, chunk_rows))
+            if not chunk:
+                break
+            chunk.sort(key=_sort_key)
+            if not runs and len(chunk) < chunk_rows:
+                # Everything fit in one chunk: no need to touch the disk
+                yield from chunk
+                return
+            path = os.path.join(run_dir, f'run{len(runs):05d}.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                for record in chunk:
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    f.write('\n')
+            runs.append(path)
+            del chunk
+        yield from heapq.merge(*(_read_run(path) for path in runs), key=_sort_key)
+
+# ---------------------------------------------------------
+# MERGE
+# ---------------------------------------------------------
+
+class MergeReport:
+    """
+    :ivar added: Keys that became entries.
+    :ivar updated: (key, old (campaignName, connectedToYear), new) of changed entries.
+    :ivar conflicts: (key, [(source, row, campaignName, connectedToYear), ...])
+        of nodes the exports disagree on; the last one listed wins.
+    :ivar problems: Rows that were skipped.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.unchanged = 0
+        self.conflicts = []
+        self.problems = []
+
+    def as_dict(self):
+        return {
+            'added': [list(key) for key in self.added],
+            'updated': [{'key': list(key), 'old': list(old), 'new': list(new)} for key, old, new in self.updated],
+            'unchanged': self.unchanged,
+            'conflicts': [{'key': list(key), 'values': [list(v) for v in values]} for key, values in self.conflicts],
+            'problems': self.problems,
+        }
+
+    def print(self, file=sys.stdout, limit=MAX_PRINTED):
+        def path(key):
+            return ' > '.join(name for name in key if name)
+        for key, values in self.conflicts[:limit]:
+            choices = "; ".join(f"{source}:{row} {name!r}{' (year)' if year else ''}"
+                                for source, row, name, year in values)
+            print(f"Conflict: {path(key)}: {choices}", file=file)
+        for key, old, new in self.updated[:limit]:
+            print(f"Updated:  {path(key)}: {old[0]!r} -> {new[0]!r}"
+                  + (f", connectedToYear {old[1]} -> {new[1]}" if old[1] != new[1] else ""), file=file)
+        for key in self.added[:limit]:
+            print(f"Added:    {path(key)}", file=file)
+        for problem in self.problems[:limit]:
+            print(f"Skipped:  {problem}", file=file)
+        print(f"\n{len(self.added)} added, {len(self.updated)} updated, {self.unchanged} unchanged, "
+              f"{len(self.conflicts)} conflict(s), {len(self.problems)} skipped row(s)", file=file)
+
+
+def merge_nodes(records, source_names, report):
+    """
+    Resolves the sorted records of every node.
+
+    :return: Generator of (key, entry, campaignName, connectedToYear) in key order.
+    """
+    for key, group in itertools.groupby(records, key=lambda r: tuple(r[:DEPTH])):
+        base = None
+        updates = []
+        for record in group:
+            if record[RANK] == BASE_RANK:
+                base = record
+            elif record[ENTRY]:
+                updates.append(record)
+
+        if not updates:
+            entry = base[ENTRY]
+            yield key, entry, base[CAMPAIGN_NAME], base[CONNECTED_TO_YEAR]
+            if entry:
+                report.unchanged += 1
+            continue
+
+        winner = updates[-1]
+        if len({(r[CAMPAIGN_NAME], r[CONNECTED_TO_YEAR]) for r in updates}) > 1:
+            report.conflicts.append((key, [(source_names[r[RANK]], r[ROW], r[CAMPAIGN_NAME], r[CONNECTED_TO_YEAR])
+                                           for r in updates]))
+        new = (winner[CAMPAIGN_NAME], winner[CONNECTED_TO_YEAR])
+        if base is None or not base[ENTRY]:
+            report.added.append(key)
+        elif (base[CAMPAIGN_NAME], base[CONNECTED_TO_YEAR]) != new:
+            report.updated.append((key, (base[CAMPAIGN_NAME], base[CONNECTED_TO_YEAR]), new))
+        else:
+            report.unchanged += 1
+        yield key, True, winner[CAMPAIGN_NAME], winner[CONNECTED_TO_YEAR]
+
+def _node(name, level, entry, campaign_name, connected_to_year):
+    node = {"name": name, "type": level, "independentEntry": entry}
+    if entry:
+        node["campaignName"] = campaign_name
+        node["connectedToYear"] = connected_to_year
+    return node
+
+def iter_merged_types(nodes):
+    """
+    Folds merged nodes (in key order) into real.json Type objects, one Type
+    at a time.
+    """
+    # Objects along the path of the last node, top level first
+    open_path = []
+    for names, entry, campaign_name, connected_to_year in nodes:
+        depth = DEPTH
+        while depth > 1 and not names[depth - 1]:
+            depth -= 1
+        # Parents sort before their children: keep the open objects this
+        # node shares its path with, and close the others
+        shared = 0
+        while shared < min(len(open_path), depth - 1) and open_path[shared]["name"] == names[shared]:
+            shared += 1
+        if shared == 0 and open_path:
+            yield open_path[0]
+        del open_path[shared:]
+        # Ancestors only known from their children are not entries themselves
+        for level_depth in range(shared, depth):
+            is_node = level_depth == depth - 1
+            obj = _node(names[level_depth], LEVELS[level_depth], entry and is_node, campaign_name, connected_to_year)
+            if open_path:
+                parent = open_path[-1]
+                parent.setdefault(CHILD_KEYS[parent["type"]], []).append(obj)
+            open_path.append(obj)
+    if open_path:
+        yield open_path[0]
+
+def merge_sources(csv_files, base=None, output=None, chunk_rows=DEFAULT_CHUNK_ROWS, tmp_dir=None):
+    """
+    Merges CSV exports into a taxonomy: rows of later files override earlier
+    ones, and every file overrides `base`. Nodes are written sorted by path
+    (Type, SubType, Detail...), so the result does not depend on row order.
+
+    :param csv_files: CSV exports, lowest priority first.
+    :param base: Existing real.json to upsert into (optional).
+    :param output: Writable text handle for the merged real.json (None only
+        reports).
+    :return: MergeReport
+    """
+    report = MergeReport()
+    source_names = {BASE_RANK: base}
+    streams = [iter_base_records(base)] if base else []
+    for rank, path in enumerate(csv_files, start=1):
+        source_names[rank] = path
+        streams.append(iter_csv_records(path, rank, report.problems))
+
+    nodes = merge_nodes(sorted_records(itertools.chain(*streams), chunk_rows, tmp_dir), source_names, report)
+    first = True
+    for type_obj in iter_merged_types(nodes):
+        if output is not None:
+            write_type_object(type_obj, output, first)
+        first = False
+    if output is not None:
+        output.write("[]" if first else "\n]")
+    return report
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge several campaign CSV exports (and an existing real.json) "
+                                                 "into one real.json")
+    parser.add_argument('csv_files', nargs='+', help="CSV exports; later files win over earlier ones")
+    parser.add_argument('--base', help="existing real.json to upsert into (every CSV wins over it)")
+    parser.add_argument('-o', '--output', help="merged JSON file (may be the --base file); defaults to stdout")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"rows sorted in memory at a time (default: {DEFAULT_CHUNK_ROWS})")
+    parser.add_argument('--tmp-dir', help="where sorted runs are spilled (default: system temp)")
+    parser.add_argument('--report', metavar='PATH', help="also write the merge report as JSON")
+    parser.add_argument('--strict', action='store_true', help="write nothing when the exports conflict")
+    args = parser.parse_args()
+
+    for path in args.csv_files + ([args.base] if args.base else []):
+        if not os.path.exists(path):
+            sys.exit(f"Error: {path} not found.")
+    if args.chunk_rows < 1:
+        sys.exit("Error: --chunk-rows must be at least 1.")
+
+    # Written to a temporary file first: the output may be the base file,
+    # which is still being read, and --strict must not write on conflicts
+    directory = os.path.dirname(os.path.abspath(args.output)) if args.output else args.tmp_dir
+    handle, tmp_path = tempfile.mkstemp(prefix='.merge_', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as out:
+            report = merge_sources(args.csv_files, args.base, out, args.chunk_rows, args.tmp_dir)
+        if not (args.strict and report.conflicts):
+            if args.output:
+                os.replace(tmp_path, args.output)
+            else:
+                with open(tmp_path, 'r', encoding='utf-8') as f:
+                    shutil.copyfileobj(f, sys.stdout)
+                sys.stdout.write("\n")
+    except ValueError as exc:
+        sys.exit(f"Error: {exc}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    report.print(file=sys.stderr)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report.as_dict(), f, indent=2, ensure_ascii=False)
+    if args.strict and report.conflicts:
+        sys.exit("\nFailed: the exports conflict, nothing was written.")
@@ -0,0 +1,120 @@
+def _to_bitset(ids):
+    """Int with the bits at `ids` set."""
+    if not ids:
+        return 0
+    bits = bytearray((max(ids) >> 3) + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class DependencyMatrix:
+    """
+    Which controlling (parent) picklist values enable which dependent (child)
+    values.
+
+    Every value gets an integer id in sorted order, and every child row is an
+    int used as a bitset of parent ids (columns are kept the same way for the
+    reverse lookup). Sorting therefore happens once for the whole field:
+    walking the set bits of a row yields the parents already in sorted order.
+    """
+
+    def __init__(self, parent_values, child_values):
+        self.parent_values = sorted(parent_values)
+        self.child_values = sorted(child_values)
+        self.parent_ids = {value: i for i, value in enumerate(self.parent_values)}
+        self.child_ids = {value: i for i, value in enumerate(self.child_values)}
+        self.rows = [0] * len(self.child_values)     # child id -> bitset of parent ids
+        self.columns = [0] * len(self.parent_values)  # parent id -> bitset of child ids
+
+    @classmethod
+    def from_taxonomy(cls, taxonomy, level):
+        """Builds the matrix of `level` values against the values of their parent level."""
+        nodes = taxonomy.by_level[level]
+        pairs = [(n.name, n.parent.name) for n in nodes if n.name and n.parent is not None and n.parent.name]
+        return cls.from_pairs(pairs, child_values=taxonomy.values(level))
+
+    @classmethod
+    def from_pairs(cls, pairs, child_values=None):
+        """
+        :param pairs: Iterable of (child value, parent value) edges.
+        :param child_values: All child values, including ones without a parent
+            (defaults to the children found in `pairs`).
+        """
+        pairs = list(pairs)
+        if child_values is None:
+            child_values = {child for child, _ in pairs}
+        matrix = cls({parent for _, parent in pairs}, child_values)
+
+        # Collect the set bits first and turn each row / column into an int
+        # once; OR-ing bit by bit would copy the growing int on every edge.
+        row_bits = [[] for _ in matrix.child_values]
+        column_bits = [[] for _ in matrix.parent_values]
+        for child, parent in pairs:
+            child_id = matrix.child_ids[child]
+            parent_id = matrix.parent_ids[parent]
+            row_bits[child_id].append(parent_id)
+            column_bits[parent_id].append(child_id)
+        matrix.rows = [_to_bitset(ids) for ids in row_bits]
+        matrix.columns = [_to_bitset(ids) for ids in column_bits]
+        return matrix
+
+    def add(self, child, parent):
+        child_id = self.child_ids[child]
+        parent_id = self.parent_ids[parent]
+        self.rows[child_id] |= 1 << parent_id
+        self.columns[parent_id] |= 1 << child_id
+
+    # ---------------------------------------------------------
+    # QUERIES
+    # ---------------------------------------------------------
+
+    @staticmethod
+    def _iter_bits(bits):
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def parents_of(self, child):
+        """Controlling values that enable `child`, sorted."""
+        child_id = self.child_ids.get(child)
+        if child_id is None:
+            return []
+        return [self.parent_values[i] for i in self._iter_bits(self.rows[child_id])]
+
+    def children_of(self, parent):
+        """Dependent values that `parent` enables, sorted."""
+        parent_id = self.parent_ids.get(parent)
+        if parent_id is None:
+            return []
+        return [self.child_values[i] for i in self._iter_bits(self.columns[parent_id])]
+
+    def enables(self, parent, child):
+        child_id = self.child_ids.get(child)
+        parent_id = self.parent_ids.get(parent)
+        if child_id is None or parent_id is None:
+            return False
+        return bool(self.rows[child_id] >> parent_id & 1)
+
+    def parent_count(self, child):
+        child_id = self.child_ids.get(child)
+        return 0 if child_id is None else bin(self.rows[child_id]).count('1')
+
+    # Dict-like access, so the matrix can stand in for the old
+    # { 'ChildValue': {'ParentValue1', ...} } dependency maps.
+
+    def get(self, child, default=None):
+        parents = self.parents_of(child)
+        return parents if parents else default
+
+    def __contains__(self, child):
+        child_id = self.child_ids.get(child)
+        return child_id is not None and self.rows[child_id] != 0
+
+    def __len__(self):
+        return sum(1 for row in self.rows if row)
+
+    def to_dict(self):
+        """{ 'ChildValue': ['ParentValue1', ...] } for children with at least one parent."""
+        return {child: self.parents_of(child) for child, row in zip(self.child_values, self.rows) if row}
@@ -1,7 +1,17 @@
-import json
+import argparse
+import contextlib
 import os
-import xml.sax.saxutils
-from collections import defaultdict
+import sys
+
+import instrumentation
+from dependency_matrix import DependencyMatrix
+from hierarchy import PARENT_LEVELS, SCHEMA
+from manifest import HashingWriter, Manifest, hash_inputs
+from package_output import DirectoryOutput, open_archive
+from renderers import (escape_text, render_custom_field, render_global_valueset, render_standard_valueset,
+                       render_to_string)
+from taxonomy import load_taxonomy
+from validation import ValidationError, check_taxonomy
 
 # ---------------------------------------------------------
 # CONFIGURATION
@@ -9,19 +19,34 @@ from collections import defaultdict
 INPUT_FILE = 'real.json'
 OUTPUT_DIR = 'deploy_package'
 
-# Field API Names
-FIELD_TYPE_API = 'Type'          # Standard Field (Controller for SubType)
-FIELD_SUBTYPE = 'SubType__c'     # Custom Field (Dependent on Type, Controller for Detail)
-FIELD_DETAIL = 'Detail__c'       # Custom Field (Dependent on SubType)
+# Field API Names (see hierarchy.SCHEMA, which drives every level)
+FIELD_TYPE_API = SCHEMA[0].picklist_field   # Standard Field 'Type' (Controller for SubType)
+FIELD_SUBTYPE = SCHEMA[1].picklist_field    # 'SubType__c' (Dependent on Type, Controller for Detail)
+FIELD_DETAIL = SCHEMA[2].picklist_field     # 'Detail__c' (Dependent on SubType)
+
+STANDARD_VAL_SET = SCHEMA[0].standard_value_set # 'CampaignType', metadata type for Campaign.Type
+
+# GlobalValueSet (name, label) of each dependent field in --global-value-sets
+# mode; fields with exactly the same values share the set of the first one.
+# The mode is for orgs where the dependent fields are not deployed yet:
+# Salesforce cannot move the values of an existing picklist field to a
+# global value set (or back), so switching a deployed field fails.
+GLOBAL_VALUE_SETS = {level.picklist_field: level.global_value_set for level in SCHEMA if level.global_value_set}
+GLOBAL_VALUE_SET_SUFFIX = '.globalValueSet-meta.xml'
 
-STANDARD_VAL_SET = 'CampaignType' # Metadata type for Campaign.Type
+# Metadata type of the files under each top folder of the package
+METADATA_FOLDERS = {
+    'objects': 'CustomField',
+    'globalValueSets': 'GlobalValueSet',
+    'standardValueSets': 'StandardValueSet',
+}
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
 def escape_xml(value):
-    return xml.sax.saxutils.escape(value)
+    return escape_text(value)
 
 def create_custom_field_xml(field_api_name, all_values, controlling_field=None, dependency_map=None):
     """
@@ -32,168 +57,291 @@ def create_custom_field_xml(field_api_name, all_values, controlling_field=None,
     :param controlling_field: The API name of the parent field (e.g., Type).
     :param dependency_map: Dict { 'ChildValue': {'ParentValue1', 'ParentValue2'} }
     """
-    label = field_api_name.replace('__c', '')
-    
-    lines = []
-    lines.append('<?xml version="1.0" encoding="UTF-8"?>')
-    lines.append('<CustomField xmlns="http://soap.sforce.com/2006/04/metadata">')
-    lines.append(f'    <fullName>{field_api_name}</fullName>')
-    lines.append(f'    <label>{label}</label>')
-    lines.append('    <type>Picklist</type>')
-    lines.append('    <valueSet>')
-    
-    # 1. Define the Controlling Field (if applicable)
-    if controlling_field:
-        lines.append(f'        <controllingField>{controlling_field}</controllingField>')
-
-    lines.append('        <valueSetDefinition>')
-    lines.append('            <sorted>false</sorted>')
-    
-    # 2. Define All Possible Values
-    sorted_values = sorted(list(all_values))
-    for val in sorted_values:
-        clean_val = escape_xml(val)
-        lines.append('            <value>')
-        lines.append(f'                <fullName>{clean_val}</fullName>')
-        lines.append('                <default>false</default>')
-        lines.append(f'                <label>{clean_val}</label>')
-        lines.append('            </value>')
-    lines.append('        </valueSetDefinition>')
-
-    # 3. Define Dependency Mappings (ValueSettings)
-    # This maps which Controlling Values enable which Dependent Value
-    if controlling_field and dependency_map:
-        for child_val in sorted_values:
-            # Only create settings if this child has parents defined in the map
-            if child_val in dependency_map and dependency_map[child_val]:
-                clean_child = escape_xml(child_val)
-                lines.append('        <valueSettings>')
-                lines.append(f'            <valueName>{clean_child}</valueName>')
-                
-                # List all parent values that enable this child
-                for parent_val in sorted(list(dependency_map[child_val])):
-                    lines.append(f'            <controllingFieldValue>{escape_xml(parent_val)}</controllingFieldValue>')
-                
-                lines.append('        </valueSettings>')
-
-    lines.append('    </valueSet>')
-    lines.append('</CustomField>')
-    return "\n".join(lines)
+    return render_to_string(render_custom_field, field_api_name, all_values, controlling_field, dependency_map)
 
 def create_standard_valueset_xml(values_set):
     """
     Generates XML for Standard Value Sets (CampaignType).
     Standard fields act as controllers but don't usually store dependency info inside themselves.
     """
+    return render_to_string(render_standard_valueset, values_set)
+
+def create_package_xml(field_members, valueset_members, global_members=()):
     lines = []
     lines.append('<?xml version="1.0" encoding="UTF-8"?>')
-    lines.append('<StandardValueSet xmlns="http://soap.sforce.com/2006/04/metadata">')
-    lines.append('    <sorted>false</sorted>')
-    
-    for val in sorted(list(values_set)):
-        clean_val = escape_xml(val)
-        lines.append('    <standardValue>')
-        lines.append(f'        <fullName>{clean_val}</fullName>')
-        lines.append('        <default>false</default>')
-        lines.append(f'        <label>{clean_val}</label>')
-        lines.append('    </standardValue>')
-        
-    lines.append('</StandardValueSet>')
+    lines.append('<Package xmlns="http://soap.sforce.com/2006/04/metadata">')
+    if field_members:
+        lines.append('    <types>')
+        for m in field_members:
+            lines.append(f'        <members>{m}</members>')
+        lines.append('        <name>CustomField</name>')
+        lines.append('    </types>')
+    if global_members:
+        lines.append('    <types>')
+        for m in global_members:
+            lines.append(f'        <members>{m}</members>')
+        lines.append('        <name>GlobalValueSet</name>')
+        lines.append('    </types>')
+    if valueset_members:
+        lines.append('    <types>')
+        for m in valueset_members:
+            lines.append(f'        <members>{m}</members>')
+        lines.append('        <name>StandardValueSet</name>')
+        lines.append('    </types>')
+    lines.append('    <version>58.0</version>')
+    lines.append('</Package>')
     return "\n".join(lines)
 
-def process_json_and_generate_files():
-    if not os.path.exists(INPUT_FILE):
-        print(f"Error: {INPUT_FILE} not found.")
-        return
-
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    # Sets to store unique values for definition
-    type_values = set()
-    subtype_values = set()
-    detail_values = set()
-
-    # Maps for dependencies: Key = Child Value, Value = Set of Parent Values
-    # We use sets because a specific SubType might appear under multiple Types in the JSON
-    subtype_dependency_map = defaultdict(set) # Maps SubType -> {Type A, Type B}
-    detail_dependency_map = defaultdict(set)  # Maps Detail -> {SubType 1, SubType 2}
-
-    # --- Parse JSON to build sets and maps ---
-    for level1 in data:
-        t_name = level1.get('name')
-        if t_name:
-            type_values.add(t_name)
-        
-        if 'subtypes' in level1:
-            for level2 in level1['subtypes']:
-                st_name = level2.get('name')
-                if st_name:
-                    subtype_values.add(st_name)
-                    # Map this SubType to its parent Type
-                    if t_name:
-                        subtype_dependency_map[st_name].add(t_name)
-                
-                if 'details' in level2:
-                    for level3 in level2['details']:
-                        d_name = level3.get('name')
-                        if d_name:
-                            detail_values.add(d_name)
-                            # Map this Detail to its parent SubType
-                            if st_name:
-                                detail_dependency_map[d_name].add(st_name)
+def write_metadata_file(rel_path, member, render, inputs, manifest=None, output=None):
+    """
+    Renders and writes one file of the package.
+
+    :param rel_path: Path of the file inside OUTPUT_DIR.
+    :param member: package.xml member name of the file (e.g., Campaign.SubType__c).
+    :param render: Callable streaming the XML content to the handle it is given.
+    :param inputs: Everything the content is rendered from (hashed in incremental mode).
+    :param manifest: Manifest of the last incremental run; when the inputs are
+        unchanged the file is neither rendered nor rewritten.
+    :param output: Where the file is written (see package_output); defaults
+        to OUTPUT_DIR.
+    """
+    if manifest is not None:
+        node_hash = hash_inputs(*inputs)
+        if manifest.is_current(member, node_hash, rel_path):
+            return
+    with (output or DirectoryOutput(OUTPUT_DIR)).open(rel_path) as f:
+        if manifest is None:
+            render(f)
+        else:
+            out = HashingWriter(f)
+            render(out)
+            manifest.record(member, node_hash, rel_path, out.hexdigest())
+
+def shared_value_sets(vocabularies):
+    """
+    Assigns a GlobalValueSet to every dependent field; fields with the same
+    vocabulary share one set, so it is written (and extended) only once.
+    Fields whose values merely overlap keep sets of their own: a field
+    using a set offers every value of it.
+
+    :param vocabularies: Dict { field API name: set of values }, in field order.
+    :return: (Dict { field: set name }, Dict { set name: (label, values) })
+    """
+    names_by_values = {}
+    assignments = {}
+    value_sets = {}
+    for field, values in vocabularies.items():
+        key = frozenset(values)
+        if key not in names_by_values:
+            name, label = GLOBAL_VALUE_SETS[field]
+            names_by_values[key] = name
+            value_sets[name] = (label, values)
+        assignments[field] = names_by_values[key]
+    return assignments, value_sets
+
+def picklist_files(taxonomy, global_value_sets=False):
+    """
+    Describes every file of the package (package.xml aside) without rendering it.
+
+    :param global_value_sets: Move the values of the dependent fields to
+        GlobalValueSets the fields reference (see shared_value_sets); the
+        dependencies stay on the fields. Only for orgs where the fields do
+        not exist yet (see GLOBAL_VALUE_SETS).
+    :return: List of (rel_path, member, render, inputs), as taken by write_metadata_file.
+    """
+    files = []
+    value_set_names = {}
+    if global_value_sets:
+        value_set_names, value_sets = shared_value_sets(
+            {level.picklist_field: taxonomy.values(level.name) for level in SCHEMA if level.global_value_set})
+        for name, (label, values) in value_sets.items():
+            files.append((
+                os.path.join('globalValueSets', f'{name}{GLOBAL_VALUE_SET_SUFFIX}'),
+                name,
+                lambda out, label=label, values=values: render_global_valueset(out, label, values),
+                (name, label, values),
+            ))
+
+    for level in SCHEMA:
+        # Sets to store unique values for definition
+        values = taxonomy.values(level.name)
+        if level.standard_value_set:
+            # Standard field (Campaign.Type): a Standard Value Set, no dependencies here
+            files.append((
+                os.path.join('standardValueSets', f'{level.standard_value_set}.standardValueSet-meta.xml'),
+                level.standard_value_set,
+                lambda out, values=values: render_standard_valueset(out, values),
+                (values,),
+            ))
+            continue
+
+        # Custom field dependent on the level above. Dependency matrix: which
+        # Parent Values enable each Child Value (a SubType might appear under
+        # multiple Types in the JSON: SubType -> {Type A, Type B})
+        field_api_name = level.picklist_field
+        controlling_field = PARENT_LEVELS[level.name].picklist_field
+        dependency_map = DependencyMatrix.from_taxonomy(taxonomy, level.name)
+        value_set_name = value_set_names.get(field_api_name)
+        files.append((
+            os.path.join('objects', 'Campaign', 'fields', f'{field_api_name}.field-meta.xml'),
+            f'Campaign.{field_api_name}',
+            lambda out, field_api_name=field_api_name, values=values, controlling_field=controlling_field,
+                   dependency_map=dependency_map, value_set_name=value_set_name: render_custom_field(
+                out,
+                field_api_name=field_api_name,
+                all_values=values,
+                controlling_field=controlling_field,
+                dependency_map=dependency_map,
+                value_set_name=value_set_name
+            ),
+            # The value set name is only part of the inputs when set, so the
+            # hashes of the default layout stay the same
+            (field_api_name, values, controlling_field, dependency_map) + ((value_set_name,) if value_set_name else ()),
+        ))
+    return files
+
+def remove_stale_value_sets(output_dir, keep):
+    """
+    Deletes the GlobalValueSet files of a package folder that this run did
+    not generate, e.g. after --global-value-sets was turned off or a set was
+    renamed.
+
+    :param keep: Names of the sets generated this run.
+    :return: Sorted list of removed set names.
+    """
+    folder = os.path.join(output_dir, 'globalValueSets')
+    if not os.path.isdir(folder):
+        return []
+    removed = []
+    for file_name in sorted(os.listdir(folder)):
+        name = file_name[:-len(GLOBAL_VALUE_SET_SUFFIX)]
+        if file_name.endswith(GLOBAL_VALUE_SET_SUFFIX) and name not in keep:
+            os.remove(os.path.join(folder, file_name))
+            removed.append(name)
+    if not os.listdir(folder):
+        os.rmdir(folder)
+    return removed
+
+def process_json_and_generate_files(taxonomy=None, incremental=False, output=None, validate=True,
+                                    output_dir=OUTPUT_DIR, input_file=INPUT_FILE, global_value_sets=False):
+    """
+    :param taxonomy: Already loaded Taxonomy (defaults to loading `input_file`).
+    :param incremental: Only re-render fields / value sets whose values or
+        dependencies changed since the last incremental run, and also write
+        those, with a destructiveChanges.xml of the value sets no longer
+        generated, to a delta package next to `output_dir` (see
+        Manifest.write_delta).
+    :param output: Where the files are written (see package_output); defaults
+        to files under OUTPUT_DIR.
+    :param validate: Check picklist value collisions and Salesforce limits
+        before writing anything (raises ValidationError).
+    :param output_dir: Package folder (written when no output is given, and
+        home of the incremental manifest).
+    :param input_file: real.json-shaped taxonomy read when no taxonomy is given.
+    :param global_value_sets: Write the values of the dependent fields as
+        GlobalValueSets the fields reference (see picklist_files). Sets left
+        over from an earlier run are deleted from the folder either way.
+    """
+    if taxonomy is None:
+        if not os.path.exists(input_file):
+            print(f"Error: {input_file} not found.")
+            return
+        taxonomy = load_taxonomy(input_file)
+    instrumentation.count_taxonomy(taxonomy)
+
+    if validate:
+        with instrumentation.stage('validate'):
+            check_taxonomy(taxonomy)
 
     # --- File Generation ---
-    fields_dir = os.path.join(OUTPUT_DIR, 'objects', 'Campaign', 'fields')
-    svs_dir = os.path.join(OUTPUT_DIR, 'standardValueSets')
-    
-    ensure_dir(fields_dir)
-    ensure_dir(svs_dir)
-
-    # 1. Write Standard Value Set (Type) - No dependencies here
-    with open(os.path.join(svs_dir, f'{STANDARD_VAL_SET}.standardValueSet-meta.xml'), 'w', encoding='utf-8') as f:
-        f.write(create_standard_valueset_xml(type_values))
-
-    # 2. Write SubType__c (Dependent on Type)
-    with open(os.path.join(fields_dir, f'{FIELD_SUBTYPE}.field-meta.xml'), 'w', encoding='utf-8') as f:
-        xml_content = create_custom_field_xml(
-            field_api_name=FIELD_SUBTYPE,
-            all_values=subtype_values,
-            controlling_field=FIELD_TYPE_API, # 'Type'
-            dependency_map=subtype_dependency_map
-        )
-        f.write(xml_content)
-
-    # 3. Write Detail__c (Dependent on SubType__c)
-    with open(os.path.join(fields_dir, f'{FIELD_DETAIL}.field-meta.xml'), 'w', encoding='utf-8') as f:
-        xml_content = create_custom_field_xml(
-            field_api_name=FIELD_DETAIL,
-            all_values=detail_values,
-            controlling_field=FIELD_SUBTYPE, # 'SubType__c'
-            dependency_map=detail_dependency_map
-        )
-        f.write(xml_content)
-
-    # 4. Generate package.xml
-    package_xml = """<?xml version="1.0" encoding="UTF-8"?>
-<Package xmlns="http://soap.sforce.com/2006/04/metadata">
-    <types>
-        <members>Campaign.SubType__c</members>
-        <members>Campaign.Detail__c</members>
-        <name>CustomField</name>
-    </types>
-    <types>
-        <members>CampaignType</members>
-        <name>StandardValueSet</name>
-    </types>
-    <version>58.0</version>
-</Package>"""
-    
-    with open(os.path.join(OUTPUT_DIR, 'package.xml'), 'w', encoding='utf-8') as f:
-        f.write(package_xml)
+    if output is None:
+        fields_dir = os.path.join(output_dir, 'objects', 'Campaign', 'fields')
+        svs_dir = os.path.join(output_dir, 'standardValueSets')
+
+        ensure_dir(fields_dir)
+        ensure_dir(svs_dir)
+        output = DirectoryOutput(output_dir)
+    if incremental and not isinstance(output, DirectoryOutput):
+        raise ValueError("Incremental mode needs a directory output (it compares files on disk).")
 
-    print(f"Success! Metadata generated in '{OUTPUT_DIR}'")
-    print(f"Dependencies mapped: Type->SubType and SubType->Detail")
+    manifest = Manifest(output_dir) if incremental else None
+    # Times every render / write when profiling (the same output otherwise)
+    files_output = instrumentation.profile_output(output)
+
+    # 1-3. CampaignType value set and one dependent field per lower level
+    with instrumentation.stage('index'):
+        files = picklist_files(taxonomy, global_value_sets)
+    members_by_type = {metadata_type: [] for metadata_type in METADATA_FOLDERS.values()}
+    for rel_path, member, render, inputs in files:
+        write_metadata_file(rel_path, member, render, inputs, manifest, files_output)
+        members_by_type[METADATA_FOLDERS[rel_path.split(os.sep)[0]]].append(member)
+
+    # 4. Generate package.xml (always the full package; the changed members
+    # go to the delta package in incremental mode)
+    with files_output.open('package.xml') as f:
+        f.write(create_package_xml(members_by_type['CustomField'], members_by_type['StandardValueSet'],
+                                   members_by_type['GlobalValueSet']))
+    removed = {metadata_type: [] for metadata_type in METADATA_FOLDERS.values()}
+    if manifest is not None:
+        for member in manifest.remove_orphans():
+            removed[METADATA_FOLDERS[manifest.previous[member]['path'].split(os.sep)[0]]].append(member)
+    if isinstance(output, DirectoryOutput):
+        # Sets of a --global-value-sets run the manifest does not know about
+        stale = remove_stale_value_sets(output.root, members_by_type['GlobalValueSet'])
+        removed['GlobalValueSet'] = sorted(set(removed['GlobalValueSet']).union(stale))
+    for name in removed['GlobalValueSet']:
+        print(f"Removed stale GlobalValueSet: {name}")
+
+    if manifest is not None:
+        changed = {metadata_type: [m for m in members if m in manifest.changed]
+                   for metadata_type, members in members_by_type.items()}
+        destructive = any(removed.values())
+        delta_dir = manifest.write_delta(
+            create_package_xml(changed['CustomField'], changed['StandardValueSet'], changed['GlobalValueSet']),
+            create_package_xml(removed['CustomField'], removed['StandardValueSet'], removed['GlobalValueSet'])
+            if destructive else None)
+        manifest.save()
+        print(f"Incremental: {len(manifest.changed)} changed, {len(manifest.unchanged)} unchanged, "
+              f"{sum(len(members) for members in removed.values())} removed (delta package in '{delta_dir}')")
+
+    if isinstance(output, DirectoryOutput):
+        print(f"Success! Metadata generated in '{output_dir}'")
+    else:
+        print(f"Success! Metadata '{output_dir}' written to archive")
+    print("Dependencies mapped: " + " and ".join(f"{parent.column}->{child.column}"
+                                                   for parent, child in zip(SCHEMA, SCHEMA[1:])))
 
 if __name__ == "__main__":
-    process_json_and_generate_files()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate Campaign Type/SubType/Detail picklist metadata from real.json")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only rewrite fields that changed since the last incremental run, and write "
+                             "them to a <output-dir>_delta package")
+    parser.add_argument('--zip', metavar='PATH', help="write a deploy-ready zip instead of the folder")
+    parser.add_argument('--tar', metavar='PATH', help="write a tar stream instead of the folder ('-' for stdout)")
+    parser.add_argument('--single-package', action='store_true',
+                        help="put package.xml at the archive root instead of under the deploy_package folder")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="skip the picklist value / Salesforce limit checks")
+    parser.add_argument('--global-value-sets', action='store_true',
+                        help="write the dependent field values once as GlobalValueSets the fields reference "
+                             "(new orgs only: deployed fields cannot be switched to a global value set)")
+    parser.add_argument('--input', default=INPUT_FILE, help=f"taxonomy JSON file (default: {INPUT_FILE})")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help=f"package folder (default: {OUTPUT_DIR})")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+
+    archive = open_archive(args.zip, args.tar)
+    output = archive.package('' if args.single_package else args.output_dir) if archive else None
+    # Keep stdout clean when it carries the tar stream
+    log = contextlib.redirect_stdout(sys.stderr) if args.tar == '-' else contextlib.nullcontext()
+    try:
+        with log, instrumentation.session(args, 'generate_picklist_metadata'):
+            process_json_and_generate_files(incremental=args.incremental, output=output,
+                                            validate=not args.no_validate, output_dir=args.output_dir,
+                                            input_file=args.input, global_value_sets=args.global_value_sets)
+    except ValidationError as exc:
+        exc.report.print(file=sys.stderr)
+        raise SystemExit(f"\nFailed: {len(exc.report.errors)} validation error(s), nothing was written.")
+    finally:
+        if archive:
+            archive.close()
\ No newline at end of file
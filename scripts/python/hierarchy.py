@@ -0,0 +1,160 @@
+import operator
+import sys
+
+# ---------------------------------------------------------
+# LEVEL SCHEMA
+# ---------------------------------------------------------
+# The campaign hierarchy, top to bottom. Everything that depends on the
+# number of levels (CSV parsing, real.json nesting, picklist fields and their
+# dependencies, record fields, labels and DeveloperNames) is driven by
+# SCHEMA: adding a level is one more Level here, plus its column in the CSV
+# export and its fields in the org.
+
+class Level:
+    """
+    One level of the hierarchy.
+
+    :ivar name: Level name, as written in the "type" key of real.json.
+    :ivar column: CSV export column holding the names of this level.
+    :ivar json_key: real.json key listing the nodes of this level under
+        their parent (None for the top level).
+    :ivar picklist_field: Campaign field API name; every level below the top
+        is a picklist dependent on the level above.
+    :ivar standard_value_set: Standard value set of a standard picklist field
+        (the top level, Campaign.Type); custom fields have none.
+    :ivar global_value_set: (name, label) of the GlobalValueSet of a custom
+        field in --global-value-sets mode.
+    :ivar record_field: Text field of the custom metadata record.
+    :ivar field_label: Label of record_field.
+    :ivar label_names: Number of trailing path names joined into a record
+        label (e.g. 2: "SubType - Detail").
+    """
+    __slots__ = ('name', 'column', 'json_key', 'picklist_field', 'standard_value_set', 'global_value_set',
+                 'record_field', 'field_label', 'label_names')
+
+    def __init__(self, name, column, json_key, picklist_field, record_field, field_label,
+                 standard_value_set=None, global_value_set=None, label_names=2):
+        self.name = name
+        self.column = column
+        self.json_key = json_key
+        self.picklist_field = picklist_field
+        self.standard_value_set = standard_value_set
+        self.global_value_set = global_value_set
+        self.record_field = record_field
+        self.field_label = field_label
+        self.label_names = label_names
+
+    def __repr__(self):
+        return f"Level({self.name!r})"
+
+
+SCHEMA = (
+    Level('type', 'Type', None, 'Type', 'Type__c', 'Type',
+          standard_value_set='CampaignType'),
+    Level('subtype', 'SubType', 'subtypes', 'SubType__c', 'SubType__c', 'Sub Type',
+          global_value_set=('Campaign_SubType', 'Campaign SubType')),
+    Level('detail', 'Detail', 'details', 'Detail__c', 'Detail__c', 'Detail',
+          global_value_set=('Campaign_Detail', 'Campaign Detail')),
+)
+
+# Columns of the CSV export besides the level columns
+YEAR_COLUMN = 'Connected to a Year'
+NAME_COLUMN = 'Campaign Name'
+
+# Record DeveloperNames join the whole path, labels the last label_names names
+DEVELOPER_NAME_SEPARATOR = '_'
+LABEL_SEPARATOR = ' - '
+
+# Derived views of SCHEMA
+DEPTH = len(SCHEMA)
+LEVELS = tuple(level.name for level in SCHEMA)
+COLUMNS = tuple(level.column for level in SCHEMA)
+_row_names = operator.itemgetter(*COLUMNS) if DEPTH > 1 else (lambda row: (row[COLUMNS[0]],))
+LEVELS_BY_NAME = {level.name: level for level in SCHEMA}
+# JSON key holding the children of each level
+CHILD_KEYS = {parent.name: child.json_key for parent, child in zip(SCHEMA, SCHEMA[1:])}
+# Level each one depends on (the picklist field that controls it)
+PARENT_LEVELS = {child.name: parent for parent, child in zip(SCHEMA, SCHEMA[1:])}
+
+# ---------------------------------------------------------
+# PATHS
+# ---------------------------------------------------------
+
+def padded(path):
+    """('General', 'Seforim') -> ('General', 'Seforim', ''): one name per level."""
+    return tuple(path) + ('',) * (DEPTH - len(path))
+
+def row_path(row):
+    """
+    Names of a CSV row, top level first, with the empty trailing levels cut
+    ('General,,' -> ['General']).
+
+    :raises ValueError: when a level is empty but one below it is not.
+    """
+    names = list(map(str.strip, _row_names(row)))
+    while names and not names[-1]:
+        names.pop()
+    if '' in names:
+        missing = COLUMNS[names.index('')]
+        raise ValueError(f"{COLUMNS[len(names) - 1]} '{names[-1]}' without a {missing}")
+    return names
+
+def record_label(path):
+    """('Kibudim', 'Sukkos', 'Aliyah') -> 'Sukkos - Aliyah' (see Level.label_names)."""
+    return LABEL_SEPARATOR.join(path[-SCHEMA[len(path) - 1].label_names:])
+
+def developer_name_source(path):
+    """Unsanitized DeveloperName of a record: the whole path."""
+    return DEVELOPER_NAME_SEPARATOR.join(path)
+
+# ---------------------------------------------------------
+# TREE BUILDING
+# ---------------------------------------------------------
+# CSV rows are folded into a tree of [real.json object, {name: child node}]
+# nodes; the lists of children are only attached to the objects when the
+# tree is written out, so they always come after the entry keys. Both steps
+# are iterative and level-agnostic.
+
+def fold_rows(rows, tree=None):
+    """
+    Folds CSV rows into the tree, one row at a time: creates the missing
+    nodes along the row's path (see row_path) and makes the last one an
+    entry. Only one entry is kept per path (the last row wins).
+
+    :return: The tree, { top level name: node }.
+    """
+    tree = {} if tree is None else tree
+    for row in rows:
+        children = tree
+        node = None
+        for name, level in zip(row_path(row), LEVELS):
+            node = children.get(name)
+            if node is None:
+                name = sys.intern(name)
+                node = children[name] = [{"name": name, "type": level, "independentEntry": False}, {}]
+            children = node[1]
+        obj = node[0]
+        obj["independentEntry"] = True
+        obj["campaignName"] = row[NAME_COLUMN].strip()
+        obj["connectedToYear"] = row[YEAR_COLUMN].lower() == 'yes'
+    return tree
+
+def tree_object(root):
+    """Returns the real.json object of one top level node of the tree, its children attached."""
+    stack = [root]
+    while stack:
+        obj, children = stack.pop()
+        if children:
+            obj[CHILD_KEYS[obj["type"]]] = [child[0] for child in children.values()]
+            stack.extend(children.values())
+    return root[0]
+
+def count_levels(tree):
+    """Node counts per level of a tree: { 'type': 3, 'subtype': 12, ... }."""
+    counts = dict.fromkeys(LEVELS, 0)
+    stack = list(tree.values())
+    while stack:
+        obj, children = stack.pop()
+        counts[obj["type"]] += 1
+        stack.extend(children.values())
+    return counts
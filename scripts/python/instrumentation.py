@@ -0,0 +1,223 @@
+import contextlib
+import cProfile
+import heapq
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# Number of slowest file renders listed in the report.
+DEFAULT_TOP = 10
+
+# ---------------------------------------------------------
+# PROFILER
+# ---------------------------------------------------------
+# Instrumentation is off unless a script runs with --profile, --trace-json or
+# --cprofile: stage() is then a bare context manager and outputs are not
+# wrapped, so normal runs pay (almost) nothing for it.
+
+class Profiler:
+    """
+    Collects wall time per stage (parse, index, validate, render, write...),
+    node counts per level, files / bytes written and the slowest renders.
+
+    Stages can be entered from several threads (parallel record writing);
+    their times are then summed over the threads.
+    """
+
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.started = time.perf_counter()
+        self.stages = {}   # name -> seconds
+        self.nodes = {}    # level -> count
+        self.files = 0
+        self.bytes = 0
+        self.renders = []  # min-heap of (seconds, rel_path), at most `top` long
+        self.events = []   # stage spans, Chrome trace format
+        self._lock = threading.Lock()
+
+    def add_time(self, name, seconds, start=None):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            if start is not None:
+                self.events.append({
+                    'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                    'ts': round((start - self.started) * 1e6), 'dur': round(seconds * 1e6),
+                })
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, start)
+
+    def count_nodes(self, level, count):
+        with self._lock:
+            self.nodes[level] = self.nodes.get(level, 0) + count
+
+    def count_file(self, size):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    def record_file(self, rel_path, size, render_seconds, write_seconds):
+        self.count_file(size)
+        with self._lock:
+            self.stages['render'] = self.stages.get('render', 0.0) + render_seconds
+            self.stages['write'] = self.stages.get('write', 0.0) + write_seconds
+            entry = (render_seconds, rel_path)
+            if len(self.renders) < self.top:
+                heapq.heappush(self.renders, entry)
+            elif entry > self.renders[0]:
+                heapq.heapreplace(self.renders, entry)
+
+    def report(self):
+        """Machine-readable summary (also the body of --trace-json)."""
+        return {
+            'total_seconds': time.perf_counter() - self.started,
+            'stages': dict(self.stages),
+            'nodes': dict(self.nodes),
+            'files': self.files,
+            'bytes': self.bytes,
+            'slowest_renders': [{'file': path, 'seconds': seconds}
+                                for seconds, path in sorted(self.renders, reverse=True)],
+        }
+
+    def print_report(self, file=sys.stderr):
+        report = self.report()
+        print(f"\n--- Profile ({report['total_seconds']:.3f}s total) ---", file=file)
+        for name, seconds in report['stages'].items():
+            print(f"  {name:<12} {seconds:9.4f}s", file=file)
+        if report['nodes']:
+            print("  nodes:       " + ", ".join(f"{level} {count}" for level, count in report['nodes'].items()),
+                  file=file)
+        print(f"  written:     {report['files']} file(s), {report['bytes']} bytes", file=file)
+        if report['slowest_renders']:
+            print("  slowest renders:", file=file)
+            for entry in report['slowest_renders']:
+                print(f"    {entry['seconds'] * 1000:8.3f} ms  {entry['file']}", file=file)
+
+
+class _ProfiledHandle(io.StringIO):
+    # Buffers a file while it renders, then times the write to the real handle
+    def __init__(self, profiler, output, rel_path):
+        super().__init__()
+        self.profiler = profiler
+        self.output = output
+        self.rel_path = rel_path
+        self.started = time.perf_counter()
+        self.failed = False
+
+    def __exit__(self, exc_type, exc, tb):
+        # A render that raised must not leave a truncated file in the package
+        self.failed = exc_type is not None
+        return super().__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if not self.closed and not self.failed:
+            content = self.getvalue()
+            rendered = time.perf_counter()
+            with self.output.open(self.rel_path) as f:
+                f.write(content)
+            written = time.perf_counter()
+            self.profiler.record_file(self.rel_path, len(content.encode('utf-8')),
+                                      rendered - self.started, written - rendered)
+        super().close()
+
+
+class CountingWriter:
+    """Wraps a text handle and counts the UTF-8 bytes written through it."""
+
+    def __init__(self, out):
+        self.out = out
+        self.bytes = 0
+
+    def write(self, text):
+        self.bytes += len(text.encode('utf-8'))
+        return self.out.write(text)
+
+
+class ProfiledOutput:
+    """Wraps an output (see package_output) to time every file it writes."""
+
+    def __init__(self, output, profiler):
+        self.output = output
+        self.profiler = profiler
+
+    def open(self, rel_path):
+        return _ProfiledHandle(self.profiler, self.output, rel_path)
+
+# ---------------------------------------------------------
+# ACTIVE PROFILER
+# ---------------------------------------------------------
+
+_active = None
+
+def active():
+    """The running Profiler, or None when instrumentation is off."""
+    return _active
+
+def stage(name):
+    """Times a block as stage `name` (no-op when instrumentation is off)."""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+def profile_output(output):
+    return ProfiledOutput(output, _active) if _active is not None and output is not None else output
+
+def count_taxonomy(taxonomy):
+    if _active is not None:
+        for level, nodes in taxonomy.by_level.items():
+            _active.count_nodes(level, len(nodes))
+
+# ---------------------------------------------------------
+# COMMAND LINE
+# ---------------------------------------------------------
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help="print time per stage, node counts, bytes written and the slowest renders to stderr")
+    parser.add_argument('--trace-json', metavar='PATH',
+                        help="write the profile as JSON (loads in chrome://tracing / Perfetto)")
+    parser.add_argument('--cprofile', metavar='PATH', help="also dump cProfile stats (pstats format)")
+    parser.add_argument('--profile-top', type=int, default=DEFAULT_TOP, metavar='N',
+                        help=f"number of slowest renders to report (default: {DEFAULT_TOP})")
+
+@contextlib.contextmanager
+def session(args, script):
+    """
+    Runs the body of a script under the options of add_arguments(); reports
+    when the body ends (even on failure).
+    """
+    global _active
+    if not (args.profile or args.trace_json or args.cprofile):
+        yield None
+        return
+
+    _active = profiler = Profiler(args.profile_top)
+    cprofiler = cProfile.Profile() if args.cprofile else None
+    if cprofiler:
+        cprofiler.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofiler:
+            cprofiler.disable()
+            cprofiler.dump_stats(args.cprofile)
+        _active = None
+        if args.profile:
+            profiler.print_report()
+        if args.trace_json:
+            report = profiler.report()
+            report['script'] = script
+            report['traceEvents'] = profiler.events
+            with open(args.trace_json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
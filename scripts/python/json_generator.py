@@ -1,6 +1,11 @@
+import argparse
 import csv
 import json
 import io
+import sys
+
+import hierarchy
+import instrumentation
 
 # The CSV data provided
 csv_data = """Type,SubType,Detail,Connected to a Year,Campaign Name
@@ -88,100 +93,84 @@ Kibudim,Psicha Yearly,Vayikra,Yes,{year} - Psicha Vayikra
 Kibudim,Psicha Yearly,Bamidbar,Yes,{year} - Psicha Bamidbar
 Kibudim,Psicha Yearly,Devarim,Yes,{year} - Psicha Devorim"""
 
-def parse_csv_to_nested_json(csv_text):
-    reader = csv.DictReader(io.StringIO(csv_text))
-    
-    # Structure: { "Type_Name": { "data": {...}, "subtypes": { "Subtype_Name": { "data": {...}, "details": [...] } } } }
-    tree = {}
+def build_tree(rows):
+    """
+    Folds CSV rows (dicts with a column per level of hierarchy.SCHEMA,
+    Connected to a Year and Campaign Name) into the nested tree, one row at
+    a time (see hierarchy.fold_rows).
 
-    for row in reader:
-        type_name = row['Type'].strip()
-        subtype_name = row['SubType'].strip()
-        detail_name = row['Detail'].strip()
-        connected_year = True if row['Connected to a Year'].lower() == 'yes' else False
-        campaign_name = row['Campaign Name'].strip()
+    Only one entry is kept per distinct path (the last row wins), so memory
+    grows with the number of nodes, not with the number of rows.
+    """
+    return hierarchy.fold_rows(rows)
 
-        # 1. Handle Top Level (Type)
-        if type_name not in tree:
-            tree[type_name] = {
-                "name": type_name,
-                "type": "type",
-                "independentEntry": False, 
-                "subtypes": {} 
-            }
+def iter_type_objects(tree):
+    """Converts the tree into the real.json list format, one Type object at a time."""
+    for root in tree.values():
+        yield hierarchy.tree_object(root)
 
-        # If this row has NO subtype and NO detail, it is an independent entry for the Type
-        if not subtype_name and not detail_name:
-            tree[type_name]["independentEntry"] = True
-            tree[type_name]["campaignName"] = campaign_name
-            tree[type_name]["connectedToYear"] = connected_year
-            continue
+def write_type_object(type_obj, out, first):
+    """Writes one element of the real.json list (see write_nested_json)."""
+    out.write("[\n" if first else ",\n")
+    chunk = json.dumps(type_obj, indent=4)
+    out.write("    " + chunk.replace("\n", "\n    "))
 
-        # 2. Handle Second Level (SubType)
-        if subtype_name:
-            if subtype_name not in tree[type_name]["subtypes"]:
-                tree[type_name]["subtypes"][subtype_name] = {
-                    "name": subtype_name,
-                    "type": "subtype",
-                    "independentEntry": False,
-                    "details": []
-                }
-            
-            # If this row has NO detail, it is an independent entry for the SubType
-            if not detail_name:
-                tree[type_name]["subtypes"][subtype_name]["independentEntry"] = True
-                tree[type_name]["subtypes"][subtype_name]["campaignName"] = campaign_name
-                tree[type_name]["subtypes"][subtype_name]["connectedToYear"] = connected_year
-                continue
+def write_nested_json(type_objects, out):
+    """
+    Writes the Type objects to `out` as they are produced.
 
-        # 3. Handle Third Level (Detail)
-        if detail_name:
-            # Details are always leaves, so they are always independent entries
-            detail_obj = {
-                "name": detail_name,
-                "type": "detail",
-                "independentEntry": True,
-                "campaignName": campaign_name,
-                "connectedToYear": connected_year
-            }
-            tree[type_name]["subtypes"][subtype_name]["details"].append(detail_obj)
+    The result is identical to json.dumps(list, indent=4), but only one Type
+    object is serialized at a time.
+    """
+    first = True
+    for type_obj in type_objects:
+        write_type_object(type_obj, out, first)
+        first = False
+    out.write("[]" if first else "\n]")
+
+def parse_csv_to_nested_json(csv_text):
+    out = io.StringIO()
+    tree = build_tree(csv.DictReader(io.StringIO(csv_text)))
+    write_nested_json(iter_type_objects(tree), out)
+    return out.getvalue()
 
-    # Final pass: Convert dictionaries to lists
-    final_output = []
-    
-    for t_name, t_data in tree.items():
-        type_obj = {
-            "name": t_data["name"],
-            "type": t_data["type"],
-            "independentEntry": t_data["independentEntry"]
-        }
-        
-        if t_data["independentEntry"]:
-            type_obj["campaignName"] = t_data.get("campaignName")
-            type_obj["connectedToYear"] = t_data.get("connectedToYear")
+def convert_csv_stream(csv_file, out):
+    """Streams rows from an open CSV file into the nested JSON written to `out`."""
+    with instrumentation.stage('parse'):
+        tree = build_tree(csv.DictReader(csv_file))
+    profiler = instrumentation.active()
+    if profiler is not None:
+        for level, count in hierarchy.count_levels(tree).items():
+            profiler.count_nodes(level, count)
+    with instrumentation.stage('write'):
+        write_nested_json(iter_type_objects(tree), out)
 
-        subtypes_list = []
-        for st_name, st_data in t_data["subtypes"].items():
-            subtype_obj = {
-                "name": st_data["name"],
-                "type": st_data["type"],
-                "independentEntry": st_data["independentEntry"]
-            }
-            
-            if st_data["independentEntry"]:
-                subtype_obj["campaignName"] = st_data.get("campaignName")
-                subtype_obj["connectedToYear"] = st_data.get("connectedToYear")
-            
-            if st_data["details"]:
-                subtype_obj["details"] = st_data["details"]
-                
-            subtypes_list.append(subtype_obj)
-            
-        if subtypes_list:
-            type_obj["subtypes"] = subtypes_list
-            
-        final_output.append(type_obj)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the campaign CSV export into the nested real.json format")
+    parser.add_argument('input', nargs='?',
+                        help="CSV file to read ('-' for stdin); defaults to the built-in csv_data")
+    parser.add_argument('-o', '--output',
+                        help="JSON file to write; defaults to stdout")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
 
-    return json.dumps(final_output, indent=4)
+    if args.input is None:
+        csv_file = io.StringIO(csv_data)
+    elif args.input == '-':
+        csv_file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        csv_file = open(args.input, 'r', encoding='utf-8-sig', newline='')
 
-print(parse_csv_to_nested_json(csv_data))
\ No newline at end of file
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        with instrumentation.session(args, 'json_generator') as profiler:
+            target = out if profiler is None else instrumentation.CountingWriter(out)
+            convert_csv_stream(csv_file, target)
+            if profiler is not None:
+                profiler.count_file(target.bytes)
+    finally:
+        csv_file.close()
+        if out is not sys.stdout:
+            out.close()
+    if out is sys.stdout:
+        out.write("\n")
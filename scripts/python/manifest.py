@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 2
+# Folder of the delta package of an incremental run, next to the package
+# folder (e.g. deploy_pkg_delta)
+DELTA_SUFFIX = '_delta'
+
+# ---------------------------------------------------------
+# HASHING
+# ---------------------------------------------------------
+
+def _normalize(value):
+    # Sets (values, dependency maps) have no stable order, sort them first.
+    if hasattr(value, 'to_dict'):
+        return _normalize(value.to_dict())
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+def hash_inputs(*parts):
+    """Stable hash of everything a generated file is rendered from."""
+    payload = json.dumps(_normalize(parts), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def hash_content(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+class HashingWriter:
+    """Wraps a text handle and hashes everything written through it."""
+
+    def __init__(self, out):
+        self.out = out
+        self._hash = hashlib.sha1()
+
+    def write(self, text):
+        self._hash.update(text.encode('utf-8'))
+        return self.out.write(text)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+def hash_file(file_path):
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ---------------------------------------------------------
+# MANIFEST
+# ---------------------------------------------------------
+
+class Manifest:
+    """
+    Remembers, per package member, the hash of its inputs (node hash) and of
+    the file written for it (output hash), so an incremental run only
+    re-renders members whose inputs changed or whose file was touched.
+
+    The manifest lives next to the package folder (e.g. deploy_pkg.manifest.json)
+    so it never ends up in a deploy.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.path = os.path.normpath(root_dir) + MANIFEST_SUFFIX
+        self.previous = {}
+        self.entries = {}
+        self.changed = []
+        self.unchanged = []
+        # Members may be checked / recorded from several writer threads
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.previous = data.get('members', {})
+
+    def is_current(self, member, node_hash, rel_path):
+        """
+        True if `member` was generated from the same inputs last run and its
+        file is still exactly what we wrote. Current members are carried over.
+
+        Files are compared by size and mtime; a file is only hashed when its
+        mtime moved (e.g. after a checkout).
+        """
+        entry = self.previous.get(member)
+        if not entry or entry['node'] != node_hash or entry['path'] != rel_path:
+            return False
+        try:
+            stat = os.stat(os.path.join(self.root_dir, rel_path))
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns != entry['mtime']:
+            if hash_file(os.path.join(self.root_dir, rel_path)) != entry['output']:
+                return False
+            entry = dict(entry, mtime=stat.st_mtime_ns)
+        with self._lock:
+            self.entries[member] = entry
+            self.unchanged.append(member)
+        return True
+
+    def record(self, member, node_hash, rel_path, output_hash):
+        """Stores the hashes of a member that was (re-)rendered this run."""
+        entry = {
+            'node': node_hash,
+            'path': rel_path,
+            'output': output_hash,
+        }
+        with self._lock:
+            self.entries[member] = entry
+            self.changed.append(member)
+
+    def remove_orphans(self):
+        """
+        Deletes files of members that were generated last run but not this one.
+
+        :return: List of removed member names.
+        """
+        removed = []
+        for member, entry in self.previous.items():
+            if member in self.entries:
+                continue
+            file_path = os.path.join(self.root_dir, entry['path'])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            removed.append(member)
+        return sorted(removed)
+
+    @property
+    def delta_dir(self):
+        return os.path.normpath(self.root_dir) + DELTA_SUFFIX
+
+    def write_delta(self, package_xml, destructive_xml=None):
+        """
+        Writes the delta package of this run next to the package folder: a
+        copy of every changed member's file, `package_xml` listing them and,
+        when members were removed, `destructive_xml` as destructiveChanges.xml.
+        The package folder itself always keeps the full package.xml.
+
+        :return: The delta folder.
+        """
+        # Files of an earlier delta must never be deployed again
+        shutil.rmtree(self.delta_dir, ignore_errors=True)
+        for member in self.changed:
+            rel_path = self.entries[member]['path']
+            target = os.path.join(self.delta_dir, rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(self.root_dir, rel_path), target)
+        os.makedirs(self.delta_dir, exist_ok=True)
+        with open(os.path.join(self.delta_dir, 'package.xml'), 'w', encoding='utf-8') as f:
+            f.write(package_xml)
+        if destructive_xml is not None:
+            with open(os.path.join(self.delta_dir, 'destructiveChanges.xml'), 'w', encoding='utf-8') as f:
+                f.write(destructive_xml)
+        return self.delta_dir
+
+    def save(self):
+        # Size and mtime of the files written this run, now that they are closed
+        for member in self.changed:
+            entry = self.entries[member]
+            stat = os.stat(os.path.join(self.root_dir, entry['path']))
+            entry['size'] = stat.st_size
+            entry['mtime'] = stat.st_mtime_ns
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'members': self.entries}, f, indent=1, sort_keys=True)
@@ -0,0 +1,320 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import xml.etree.ElementTree as ET
+
+import create_metadata_records
+import generate_picklist_metadata
+from package_output import DirectoryOutput, open_archive
+from renderers import render_to_string
+from taxonomy import load_taxonomy
+from validation import ValidationError, check_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+INPUT_FILE = 'real.json'
+# The source-format project (or a retrieved snapshot with the same layout)
+TARGET_DIR = os.path.join('..', '..', 'force-app', 'main', 'default')
+OUTPUT_DIR = 'deploy_delta'
+API_VERSION = '58.0'
+
+XSI_NS = '{http://www.w3.org/2001/XMLSchema-instance}'
+
+# Top-level elements the generators write, per metadata type. Anything else
+# in an existing file (descriptions, history tracking...) is not compared.
+SCALAR_ELEMENTS = {
+    'CustomField': ('fullName', 'label', 'type'),
+    'StandardValueSet': ('sorted',),
+    'GlobalValueSet': ('masterLabel', 'sorted'),
+    'CustomMetadata': ('label', 'protected'),
+}
+
+# Elements that hold one value / setting; they are cleared once read so a
+# large file is never held in memory as a whole tree.
+ENTRY_ELEMENTS = ('value', 'valueSettings', 'standardValue', 'customValue', 'values')
+
+# ---------------------------------------------------------
+# PARSING
+# ---------------------------------------------------------
+
+def _local(tag):
+    return tag.rpartition('}')[2]
+
+def _children(elem):
+    return {_local(child.tag): child for child in elem}
+
+def _text(elem):
+    return (elem.text or '').strip() if elem is not None else ''
+
+def _typed_value(elem):
+    # Custom metadata values: nil and '' are the same (empty), booleans as bool
+    if elem is None or elem.get(f'{XSI_NS}nil') == 'true':
+        return None
+    text = elem.text or ''
+    if elem.get(f'{XSI_NS}type') == 'xsd:boolean':
+        return text.strip() == 'true'
+    return text or None
+
+def parse_metadata(source):
+    """
+    Stream-parses a .field-meta.xml, .standardValueSet-meta.xml,
+    .globalValueSet-meta.xml or .md-meta.xml file into a comparable summary.
+
+    :param source: Path or binary file object.
+    :return: (root element name, summary dict); two files deploy the same
+        thing when their summaries are equal.
+    """
+    root = None
+    depth = 0
+    parents = []
+    summary = {'values': {}}
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        tag = _local(elem.tag)
+        if event == 'start':
+            if root is None:
+                root = tag
+                if root == 'CustomField':
+                    summary['settings'] = {}
+                    summary['controllingField'] = ''
+                    summary['valueSetName'] = ''
+            parents.append(tag)
+            depth += 1
+            continue
+
+        parents.pop()
+        depth -= 1
+        parent = parents[-1] if parents else None
+
+        if depth == 1 and tag in SCALAR_ELEMENTS.get(root, ()):
+            summary[tag] = _text(elem)
+        elif tag == 'controllingField' and parent == 'valueSet':
+            summary['controllingField'] = _text(elem)
+        elif tag == 'valueSetName' and parent == 'valueSet':
+            summary['valueSetName'] = _text(elem)
+        elif tag == 'value' and parent == 'valueSetDefinition':
+            c = _children(elem)
+            summary['values'][_text(c.get('fullName'))] = (_text(c.get('label')), _text(c.get('default')))
+        elif tag == 'valueSettings':
+            c = _children(elem)
+            parents_enabling = frozenset(_text(e) for e in elem if _local(e.tag) == 'controllingFieldValue')
+            summary['settings'][_text(c.get('valueName'))] = parents_enabling
+        elif tag in ('standardValue', 'customValue'):
+            c = _children(elem)
+            summary['values'][_text(c.get('fullName'))] = (_text(c.get('label')), _text(c.get('default')))
+        elif tag == 'values' and root == 'CustomMetadata':
+            c = _children(elem)
+            summary['values'][_text(c.get('field'))] = _typed_value(c.get('value'))
+
+        # A record's <value> is still needed by its enclosing <values>
+        if tag in ENTRY_ELEMENTS and not (tag == 'value' and parent == 'values'):
+            elem.clear()
+
+    return root, summary
+
+def parse_record(source):
+    """
+    parse_metadata for custom metadata records: they are small, so parsing
+    them whole is much faster than streaming them.
+    """
+    root = ET.parse(source).getroot()
+    summary = {'values': {}}
+    for child in root:
+        tag = _local(child.tag)
+        if tag in SCALAR_ELEMENTS['CustomMetadata']:
+            summary[tag] = _text(child)
+        elif tag == 'values':
+            c = _children(child)
+            summary['values'][_text(c.get('field'))] = _typed_value(c.get('value'))
+    return _local(root.tag), summary
+
+def parse_metadata_string(content, parse=parse_metadata):
+    return parse(io.BytesIO(content.encode('utf-8')))
+
+# ---------------------------------------------------------
+# DIFF
+# ---------------------------------------------------------
+
+class GeneratedFile:
+    """One rendered member of the generated metadata, kept in memory."""
+    __slots__ = ('member', 'metadata_type', 'rel_path', 'content')
+
+    def __init__(self, member, metadata_type, rel_path, content):
+        self.member = member
+        self.metadata_type = metadata_type
+        self.rel_path = rel_path
+        self.content = content
+
+
+def generate_files(taxonomy):
+    """Renders the picklist fields, the value set and every record in memory."""
+    files = []
+    for rel_path, member, render, _ in generate_picklist_metadata.picklist_files(taxonomy):
+        metadata_type = generate_picklist_metadata.METADATA_FOLDERS[rel_path.split(os.sep)[0]]
+        files.append(GeneratedFile(member, metadata_type, rel_path, render_to_string(render)))
+    for node in taxonomy.iter_entries():
+        dev_name, label, fields = create_metadata_records.record_for_node(node)
+        member, rel_path = create_metadata_records.record_member(dev_name)
+        content = render_to_string(create_metadata_records.RECORD_RENDERER.render, label, fields)
+        files.append(GeneratedFile(member, 'CustomMetadata', rel_path, content))
+    return files
+
+
+class MetadataDiff:
+    """
+    Result of diff_metadata.
+
+    :ivar added: GeneratedFiles with no counterpart in the target.
+    :ivar changed: GeneratedFiles whose content differs semantically.
+    :ivar unchanged: Member names that need no deploy.
+    :ivar removed_records: Record members only found in the target.
+    :ivar removed_values: Dict { member: [values only found in the target] }.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.unchanged = []
+        self.removed_records = []
+        self.removed_values = {}
+
+    @property
+    def deploy(self):
+        return self.added + self.changed
+
+
+def _existing_records(target_dir):
+    records_dir = os.path.join(target_dir, 'customMetadata')
+    prefix = f"{create_metadata_records.MDT_FILENAME_PREFIX}."
+    suffix = '.md-meta.xml'
+    if not os.path.isdir(records_dir):
+        return set()
+    return {name[:-len(suffix)] for name in os.listdir(records_dir)
+            if name.startswith(prefix) and name.endswith(suffix)}
+
+def diff_metadata(files, target_dir):
+    """
+    Compares generated files with the files of the same members under
+    `target_dir` (source format, e.g. force-app/main/default).
+
+    :param files: GeneratedFiles (see generate_files).
+    """
+    diff = MetadataDiff()
+    for generated in files:
+        path = os.path.join(target_dir, generated.rel_path)
+        if not os.path.exists(path):
+            diff.added.append(generated)
+            continue
+        parse = parse_record if generated.metadata_type == 'CustomMetadata' else parse_metadata
+        _, existing = parse(path)
+        _, new = parse_metadata_string(generated.content, parse)
+        if existing == new:
+            diff.unchanged.append(generated.member)
+            continue
+        diff.changed.append(generated)
+        removed = sorted(set(existing['values']) - set(new['values']))
+        if removed and generated.metadata_type != 'CustomMetadata':
+            diff.removed_values[generated.member] = removed
+
+    generated_records = {f.member for f in files if f.metadata_type == 'CustomMetadata'}
+    diff.removed_records = sorted(_existing_records(target_dir) - generated_records)
+    return diff
+
+# ---------------------------------------------------------
+# OUTPUT
+# ---------------------------------------------------------
+
+def create_package_xml(members_by_type):
+    """
+    :param members_by_type: Dict { 'CustomField': ['Campaign.SubType__c', ...] };
+        empty types are left out.
+    """
+    lines = []
+    lines.append('<?xml version="1.0" encoding="UTF-8"?>')
+    lines.append('<Package xmlns="http://soap.sforce.com/2006/04/metadata">')
+    for metadata_type in sorted(members_by_type):
+        members = members_by_type[metadata_type]
+        if not members:
+            continue
+        lines.append('    <types>')
+        for m in sorted(members):
+            lines.append(f'        <members>{m}</members>')
+        lines.append(f'        <name>{metadata_type}</name>')
+        lines.append('    </types>')
+    lines.append(f'    <version>{API_VERSION}</version>')
+    lines.append('</Package>')
+    return "\n".join(lines)
+
+def write_delta(diff, output):
+    """
+    Writes the changed members, their package.xml and, when records were
+    removed, destructiveChanges.xml.
+    """
+    members_by_type = {}
+    for generated in diff.deploy:
+        with output.open(generated.rel_path) as f:
+            f.write(generated.content)
+        members_by_type.setdefault(generated.metadata_type, []).append(generated.member)
+    with output.open('package.xml') as f:
+        f.write(create_package_xml(members_by_type))
+    if diff.removed_records:
+        with output.open('destructiveChanges.xml') as f:
+            f.write(create_package_xml({'CustomMetadata': diff.removed_records}))
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diff the generated metadata against force-app (or a retrieved "
+                                                 "snapshot) and write a delta deploy package")
+    parser.add_argument('--input', default=INPUT_FILE)
+    parser.add_argument('--target', default=TARGET_DIR,
+                        help="source-format metadata to compare with (default: force-app/main/default)")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--zip', metavar='PATH', help="write the delta package to a zip instead of a folder")
+    parser.add_argument('--tar', metavar='PATH', help="write the delta package as a tar stream ('-' for stdout)")
+    parser.add_argument('--no-validate', action='store_true')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        sys.exit(f"Error: {args.input} not found.")
+    if not os.path.isdir(args.target):
+        sys.exit(f"Error: {args.target} is not a directory.")
+
+    archive = open_archive(args.zip, args.tar)
+    if archive is None:
+        # A destructiveChanges.xml left over from an earlier run must never be deployed
+        shutil.rmtree(args.output_dir, ignore_errors=True)
+    output = archive.package('') if archive else DirectoryOutput(args.output_dir)
+    # Keep stdout clean when it carries the tar stream
+    log = contextlib.redirect_stdout(sys.stderr) if args.tar == '-' else contextlib.nullcontext()
+    try:
+        with log:
+            taxonomy = load_taxonomy(args.input)
+            if not args.no_validate:
+                check_taxonomy(taxonomy, create_metadata_records.record_for_node,
+                               create_metadata_records.record_label)
+            diff = diff_metadata(generate_files(taxonomy), args.target)
+            write_delta(diff, output)
+
+            for generated in diff.added:
+                print(f"Added:   {generated.member}")
+            for generated in diff.changed:
+                print(f"Changed: {generated.member}")
+            for member, values in diff.removed_values.items():
+                print(f"Removed values of {member}: {', '.join(values)}")
+            for member in diff.removed_records:
+                print(f"Removed: {member}")
+            print(f"\n{len(diff.added)} added, {len(diff.changed)} changed, {len(diff.unchanged)} unchanged, "
+                  f"{len(diff.removed_records)} removed record(s)")
+    except ValidationError as exc:
+        exc.report.print(file=sys.stderr)
+        raise SystemExit(f"\nFailed: {len(exc.report.errors)} validation error(s), nothing was written.")
+    finally:
+        if archive:
+            archive.close()
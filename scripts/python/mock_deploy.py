@@ -0,0 +1,652 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import posixpath
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from package_planner import BATCH_MAX_BYTES, PLAN_FILE, member_of, references
+from validation import PACKAGE_MAX_FILES
+from verify_package import parse_package_xml
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# A local stand-in for the Metadata API deploy() / checkDeployStatus() calls:
+# it checks a package the way a deploy would, then holds it for a simulated
+# processing time, so batch sizes and parallel strategies can be compared
+# without an org.
+HOST = '127.0.0.1'
+PORT = 8765
+
+# Deploy limits (see package_planner.py): files per zip, package.xml
+# included, and bytes of the zip and of its content.
+MAX_FILES = PACKAGE_MAX_FILES
+MAX_ZIP_BYTES = BATCH_MAX_BYTES
+MAX_UNZIPPED_BYTES = 400 * 1000 * 1000
+
+# Simulated seconds per deploy (queue pickup, unzip, the final commit) and
+# per component, by metadata type
+DEPLOY_OVERHEAD = 2.0
+COMPONENT_LATENCY = {
+    'CustomObject': 0.5,
+    'CustomField': 0.25,
+    'StandardValueSet': 0.25,
+    'GlobalValueSet': 0.1,
+    'CustomMetadata': 0.01,
+}
+DEFAULT_COMPONENT_LATENCY = 0.05
+
+# Simulated seconds are multiplied by this (0.01: 100x faster than an org)
+TIME_SCALE = 0.01
+
+# Deploys processed at the same time; an org runs one and queues the rest
+MAX_CONCURRENT = 1
+
+# Components processed between two progress updates of a deploy
+PROGRESS_STEP = 100
+
+# Seconds between two status requests of the HTTP client
+POLL_INTERVAL = 0.05
+
+# Problem reported for a component whose requirement (package_planner.references)
+# is neither in the org nor in the same deploy, by type of the requirement
+MISSING_REQUIREMENT = {
+    'CustomObject': "Custom metadata type '{}' does not exist in the org",
+    'CustomField': "Controlling field '{}' does not exist in the org",
+    'GlobalValueSet': "Global value set '{}' does not exist in the org",
+    'StandardValueSet': "The controlling values of standard value set '{}' are not deployed to the org",
+}
+
+# ---------------------------------------------------------
+# PACKAGES
+# ---------------------------------------------------------
+
+def package_zip(source):
+    """
+    Zip bytes of a package folder (deploy_pkg, deploy_package, a batch) or
+    of a zip file, as they would be sent to deploy().
+    """
+    if not os.path.isdir(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for directory, _, names in os.walk(source):
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                archive.write(path, os.path.relpath(path, source).replace(os.sep, '/'))
+    return buffer.getvalue()
+
+def _failure(file_name, problem):
+    # Same keys as a componentFailure of a Metadata API DeployResult
+    return {'fileName': file_name, 'problem': problem}
+
+def check_package(zip_data, max_files=MAX_FILES, max_zip_bytes=MAX_ZIP_BYTES,
+                  max_unzipped_bytes=MAX_UNZIPPED_BYTES):
+    """
+    Checks a deploy zip without an org: the size limits, that every
+    package.xml member has its file and every file is listed, and that every
+    component is well-formed XML. A zip may hold several packages (one
+    folder with a package.xml each) or one at its root.
+
+    :return: (components, failures): components as (type, member, file name,
+        requirements), failures as dicts { 'fileName', 'problem' }.
+    """
+    if len(zip_data) > max_zip_bytes:
+        return [], [_failure('', f"The zip is {len(zip_data)} bytes, over the limit of {max_zip_bytes}")]
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(zip_data))
+    except zipfile.BadZipFile as exc:
+        return [], [_failure('', f"Not a zip file: {exc}")]
+
+    with archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        failures = []
+        if len(infos) > max_files:
+            failures.append(_failure('', f"{len(infos)} files, over the limit of {max_files}"))
+        unzipped = sum(info.file_size for info in infos)
+        if unzipped > max_unzipped_bytes:
+            failures.append(_failure('', f"{unzipped} bytes unzipped, over the limit of {max_unzipped_bytes}"))
+        if failures:
+            return [], failures
+
+        roots = sorted(posixpath.dirname(info.filename) for info in infos
+                       if posixpath.basename(info.filename) == 'package.xml')
+        if not roots:
+            return [], [_failure('package.xml', "No package.xml found")]
+
+        listed = {}
+        for root in roots:
+            manifest = posixpath.join(root, 'package.xml')
+            try:
+                with archive.open(manifest) as f:
+                    listed[root] = parse_package_xml(f)
+            except (ET.ParseError, KeyError) as exc:
+                failures.append(_failure(manifest, f"Invalid package.xml: {exc}"))
+                listed[root] = {}
+
+        components = []
+        found = {root: set() for root in roots}
+        for info in infos:
+            name = info.filename
+            if posixpath.basename(name) == 'package.xml':
+                continue
+            # The deepest package folder holding the file
+            root = max((r for r in roots if not r or name.startswith(r + '/')), key=len, default=None)
+            if root is None:
+                failures.append(_failure(name, "Not in the folder of any package.xml"))
+                continue
+            member = member_of(name[len(root) + 1:] if root else name)
+            if member is None:
+                failures.append(_failure(name, "Not a metadata component this package type can hold"))
+                continue
+            metadata_type, member_name = member
+            members = listed[root].get(metadata_type, ())
+            if member_name not in members and '*' not in members:
+                failures.append(_failure(name, f"{metadata_type} '{member_name}' is not listed in package.xml"))
+                continue
+            found[root].add(member)
+            content = archive.read(info)
+            try:
+                ET.fromstring(content)
+                requires = references(metadata_type, member_name, io.BytesIO(content))
+            except ET.ParseError as exc:
+                failures.append(_failure(name, f"Invalid XML: {exc}"))
+                continue
+            components.append((metadata_type, member_name, name, requires))
+
+        for root in roots:
+            for metadata_type, members in listed[root].items():
+                for member_name in members:
+                    if member_name != '*' and (metadata_type, member_name) not in found[root]:
+                        failures.append(_failure(posixpath.join(root, 'package.xml'),
+                                                 f"An object '{member_name}' of type {metadata_type} was named "
+                                                 f"in package.xml, but was not found in zipped directory"))
+    return components, failures
+
+def missing_dependencies(components, deployed):
+    """
+    Components requiring one that is neither in this deploy nor already
+    deployed: records before their custom metadata type, dependent
+    picklists before their controlling field or value set (e.g. batches
+    deployed out of plan order).
+
+    :param deployed: Set of (type, member) already in the org.
+    :return: List of failures.
+    """
+    available = deployed.union((metadata_type, member) for metadata_type, member, _, _ in components)
+    failures = []
+    for _, _, file_name, requires in components:
+        for required in requires:
+            if required not in available:
+                failures.append(_failure(file_name, MISSING_REQUIREMENT[required[0]].format(required[1])))
+    return failures
+
+# ---------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------
+
+class DeployMetrics:
+    """
+    Throughput and concurrency of the deploys of one server, updated by the
+    deploy threads under a lock. Times are seconds of this process; divide by
+    the time scale for simulated org seconds.
+    """
+
+    def __init__(self, time_scale=TIME_SCALE):
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self.first_submit = None
+        self.last_finish = None
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.peak_running = 0
+        self.deploys = []  # status dicts of the finished deploys
+
+    def submitted(self, now):
+        with self._lock:
+            if self.first_submit is None:
+                self.first_submit = now
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+    def started(self):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+
+    def finished(self, status, now):
+        with self._lock:
+            self.running -= 1
+            self.last_finish = now
+            self.deploys.append(status)
+
+    def summary(self):
+        """
+        Dict of the totals, rates and wait / processing times so far. The
+        simulated figures are None with a time scale of 0 (no simulated time).
+        """
+        with self._lock:
+            deploys = list(self.deploys)
+            wall = (self.last_finish - self.first_submit) if deploys else 0.0
+            peak_running, peak_queued = self.peak_running, self.peak_queued
+        succeeded = [d for d in deploys if d['status'] == 'Succeeded']
+        components = sum(d['numberComponentsDeployed'] for d in succeeded)
+
+        simulated = self.time_scale > 0
+
+        def spread(key):
+            values = [d[key] for d in deploys]
+            return {'mean': sum(values) / len(values) if values else 0.0, 'max': max(values, default=0.0)}
+
+        return {
+            'deploys': len(deploys),
+            'succeeded': len(succeeded),
+            'failed': len(deploys) - len(succeeded),
+            'components': components,
+            'zip_bytes': sum(d['zipBytes'] for d in deploys),
+            'wall_seconds': wall,
+            'simulated_wall_seconds': wall / self.time_scale if simulated else None,
+            'components_per_second': components / wall if wall else 0.0,
+            'simulated_components_per_second': (components * self.time_scale / wall if wall else 0.0)
+                                               if simulated else None,
+            'peak_running': peak_running,
+            'peak_queued': peak_queued,
+            'queue_seconds': spread('queueSeconds'),
+            'processing_seconds': spread('processingSeconds'),
+        }
+
+# ---------------------------------------------------------
+# SERVER
+# ---------------------------------------------------------
+
+class _Deploy:
+    # One deploy request and its progress; status() is its DeployResult
+    __slots__ = ('id', 'name', 'zip_bytes', 'state', 'total', 'deployed', 'failures',
+                 'submitted', 'started', 'finished', 'done')
+
+    def __init__(self, deploy_id, name, zip_bytes, now):
+        self.id = deploy_id
+        self.name = name
+        self.zip_bytes = zip_bytes
+        self.state = 'Pending'
+        self.total = 0
+        self.deployed = 0
+        self.failures = []
+        self.submitted = now
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def status(self):
+        end = self.finished if self.finished is not None else time.perf_counter()
+        started = self.started if self.started is not None else end
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.state,
+            'done': self.done.is_set(),
+            'numberComponentsTotal': self.total,
+            'numberComponentsDeployed': self.deployed,
+            'numberComponentErrors': len(self.failures),
+            'componentFailures': list(self.failures),
+            'zipBytes': self.zip_bytes,
+            'queueSeconds': started - self.submitted,
+            'processingSeconds': end - started,
+        }
+
+
+class MockDeployServer:
+    """
+    Accepts deploy zips and processes them on background threads, at most
+    max_concurrent at a time, like an org's deploy queue. A deploy is
+    checked (check_package), then takes DEPLOY_OVERHEAD plus the latency of
+    each of its components (times time_scale). As with rollbackOnError, a
+    deploy with any failure deploys nothing; the components of successful
+    deploys are remembered, so later deploys can depend on them.
+
+    Used in-process, or over HTTP with serve().
+    """
+
+    def __init__(self, max_files=MAX_FILES, max_zip_bytes=MAX_ZIP_BYTES, max_unzipped_bytes=MAX_UNZIPPED_BYTES,
+                 max_concurrent=MAX_CONCURRENT, time_scale=TIME_SCALE, deploy_overhead=DEPLOY_OVERHEAD,
+                 component_latency=None):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        if time_scale < 0:
+            raise ValueError("time_scale must not be negative")
+        self.max_files = max_files
+        self.max_zip_bytes = max_zip_bytes
+        self.max_unzipped_bytes = max_unzipped_bytes
+        self.time_scale = time_scale
+        self.deploy_overhead = deploy_overhead
+        self.component_latency = dict(COMPONENT_LATENCY, **(component_latency or {}))
+        self.metrics = DeployMetrics(time_scale)
+        self.org = set()  # (type, member) deployed so far
+        self._deploys = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent)
+
+    def deploy(self, zip_data, name=None):
+        """Queues a deploy zip; returns its id (as checked with check_status / wait)."""
+        now = time.perf_counter()
+        with self._lock:
+            deploy_id = f"0Af{next(self._ids):015d}"
+            deploy = self._deploys[deploy_id] = _Deploy(deploy_id, name or deploy_id, len(zip_data), now)
+        self.metrics.submitted(now)
+        threading.Thread(target=self._run, args=(deploy, zip_data), daemon=True).start()
+        return deploy_id
+
+    def check_status(self, deploy_id):
+        """DeployResult dict of a deploy; KeyError for an unknown id."""
+        return self._deploys[deploy_id].status()
+
+    def wait(self, deploy_id, timeout=None):
+        """Blocks until the deploy is done and returns its DeployResult dict."""
+        deploy = self._deploys[deploy_id]
+        deploy.done.wait(timeout)
+        return deploy.status()
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def _run(self, deploy, zip_data):
+        with self._slots:
+            deploy.started = time.perf_counter()
+            deploy.state = 'InProgress'
+            self.metrics.started()
+            try:
+                self._process(deploy, zip_data)
+            except Exception as exc:  # a bug here must not leave the deploy pending forever
+                deploy.failures.append(_failure('', f"Internal error: {exc!r}"))
+            deploy.state = 'Failed' if deploy.failures else 'Succeeded'
+            if deploy.failures:
+                deploy.deployed = 0
+            deploy.finished = time.perf_counter()
+            deploy.done.set()
+            self.metrics.finished(deploy.status(), deploy.finished)
+
+    def _process(self, deploy, zip_data):
+        components, failures = check_package(zip_data, self.max_files, self.max_zip_bytes, self.max_unzipped_bytes)
+        deploy.total = len(components)
+        self._sleep(self.deploy_overhead)
+        if not failures:
+            with self._lock:
+                failures = missing_dependencies(components, self.org)
+        if failures:
+            deploy.failures.extend(failures)
+            return
+
+        latency = self.component_latency
+        for start in range(0, len(components), PROGRESS_STEP):
+            chunk = components[start:start + PROGRESS_STEP]
+            self._sleep(sum(latency.get(metadata_type, DEFAULT_COMPONENT_LATENCY)
+                            for metadata_type, _, _, _ in chunk))
+            deploy.deployed += len(chunk)
+        with self._lock:
+            self.org.update((metadata_type, member) for metadata_type, member, _, _ in components)
+
+# ---------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------
+# POST /deploy?name=NAME   body: the zip     -> 201 {"id": ...}
+# GET  /deploy/<id>                          -> the DeployResult dict
+# GET  /metrics                              -> DeployMetrics.summary()
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'MockMetadataAPI/1.0'
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/deploy':
+            self._reply(404, {'error': f"Unknown path {url.path}"})
+            return
+        name = urllib.parse.parse_qs(url.query).get('name', [None])[0]
+        zip_data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply(201, {'id': self.server.deployer.deploy(zip_data, name)})
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/metrics':
+            self._reply(200, self.server.deployer.metrics.summary())
+        elif path.startswith('/deploy/'):
+            try:
+                self._reply(200, self.server.deployer.check_status(path[len('/deploy/'):]))
+            except KeyError:
+                self._reply(404, {'error': "Unknown deploy id"})
+        else:
+            self._reply(404, {'error': f"Unknown path {path}"})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_http_server(deployer, host=HOST, port=PORT, verbose=False):
+    """HTTP front end of a MockDeployServer (port 0 picks a free one); call serve_forever() on it."""
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.deployer = deployer
+    httpd.verbose = verbose
+    return httpd
+
+
+class HttpDeployClient:
+    """Same deploy / check_status / wait calls as MockDeployServer, against its HTTP front end."""
+
+    def __init__(self, url, poll_interval=POLL_INTERVAL):
+        self.url = url.rstrip('/')
+        self.poll_interval = poll_interval
+
+    def _request(self, path, data=None):
+        request = urllib.request.Request(self.url + path, data=data, method='POST' if data is not None else 'GET')
+        if data is not None:
+            request.add_header('Content-Type', 'application/zip')
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def deploy(self, zip_data, name=None):
+        query = f"?{urllib.parse.urlencode({'name': name})}" if name else ''
+        return self._request(f"/deploy{query}", zip_data)['id']
+
+    def check_status(self, deploy_id):
+        return self._request(f"/deploy/{urllib.parse.quote(deploy_id)}")
+
+    def wait(self, deploy_id, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            status = self.check_status(deploy_id)
+            if status['done'] or (deadline is not None and time.perf_counter() >= deadline):
+                return status
+            time.sleep(self.poll_interval)
+
+    def metrics(self):
+        return self._request('/metrics')
+
+# ---------------------------------------------------------
+# DEPLOY RUNS
+# ---------------------------------------------------------
+
+def deploy_waves(sources):
+    """
+    Orders the packages to deploy into waves: every package of a wave can be
+    deployed in parallel once the waves before it succeeded. A folder with a
+    PLAN_FILE (package_planner.py) expands to its batches, ordered by their
+    depends_on; other sources make one wave, in the order given.
+
+    :return: List of waves, each a list of (name, path).
+    """
+    waves = []
+    loose = []
+    for source in sources:
+        plan_path = os.path.join(source, PLAN_FILE)
+        if not os.path.isfile(plan_path):
+            loose.append((os.path.basename(os.path.normpath(source)), source))
+            continue
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        depth = {}
+        for batch in plan:  # batches come after the ones they depend on
+            depth[batch['name']] = max((depth[d] + 1 for d in batch['depends_on']), default=0)
+            path = batch['path']
+            if not os.path.exists(path):
+                path = os.path.join(source, os.path.basename(path))
+            while len(waves) <= depth[batch['name']]:
+                waves.append([])
+            waves[depth[batch['name']]].append((batch['name'], path))
+    if loose:
+        waves.append(loose)
+    return waves
+
+def run_deploys(target, waves, parallel=1):
+    """
+    Deploys the waves one after the other, up to `parallel` packages at a
+    time within a wave, and stops after a wave with a failed deploy.
+
+    :param target: MockDeployServer or HttpDeployClient.
+    :return: (DeployResult dicts in completion order, packages not deployed).
+    """
+    def deploy_one(item):
+        name, path = item
+        return target.wait(target.deploy(package_zip(path), name))
+
+    results = []
+    skipped = []
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        for index, wave in enumerate(waves):
+            statuses = list(pool.map(deploy_one, wave))
+            results.extend(statuses)
+            if any(status['status'] != 'Succeeded' for status in statuses):
+                skipped = [name for later in waves[index + 1:] for name, _ in later]
+                break
+    return results, skipped
+
+def print_results(results, skipped, summary):
+    for status in results:
+        print(f"{status['name']}: {status['status']}, {status['numberComponentsDeployed']}/"
+              f"{status['numberComponentsTotal']} components, queued {status['queueSeconds']:.2f}s, "
+              f"processed {status['processingSeconds']:.2f}s")
+        for failure in status['componentFailures'][:5]:
+            print(f"    {failure['fileName'] or '(package)'}: {failure['problem']}")
+        if len(status['componentFailures']) > 5:
+            print(f"    ... and {len(status['componentFailures']) - 5} more")
+    if skipped:
+        print(f"Not deployed after a failure: {', '.join(skipped)}")
+    if summary['simulated_wall_seconds'] is None:
+        simulated = "no simulated time"
+    else:
+        simulated = (f"{summary['simulated_wall_seconds']:.1f}s simulated, "
+                     f"{summary['simulated_components_per_second']:.1f} components/s simulated")
+    print(f"\n{summary['succeeded']}/{summary['deploys']} deploy(s) succeeded, {summary['components']} components "
+          f"in {summary['wall_seconds']:.2f}s ({simulated})")
+    print(f"Peak {summary['peak_running']} running / {summary['peak_queued']} queued; queue wait "
+          f"mean {summary['queue_seconds']['mean']:.2f}s max {summary['queue_seconds']['max']:.2f}s")
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+def _latency(text):
+    metadata_type, _, seconds = text.partition('=')
+    try:
+        return metadata_type, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TYPE=SECONDS, got '{text}'")
+
+def _add_server_arguments(parser):
+    parser.add_argument('--max-files', type=int, default=MAX_FILES,
+                        help=f"files per deploy, package.xml included (default: {MAX_FILES})")
+    parser.add_argument('--max-zip-bytes', type=int, default=MAX_ZIP_BYTES,
+                        help=f"(default: {MAX_ZIP_BYTES})")
+    parser.add_argument('--max-unzipped-bytes', type=int, default=MAX_UNZIPPED_BYTES,
+                        help=f"(default: {MAX_UNZIPPED_BYTES})")
+    parser.add_argument('--max-concurrent', type=int, default=MAX_CONCURRENT,
+                        help=f"deploys processed at the same time (default: {MAX_CONCURRENT})")
+    parser.add_argument('--time-scale', type=float, default=TIME_SCALE,
+                        help=f"real seconds per simulated second, 0 for no waiting (default: {TIME_SCALE})")
+    parser.add_argument('--overhead', type=float, default=DEPLOY_OVERHEAD,
+                        help=f"simulated seconds per deploy (default: {DEPLOY_OVERHEAD})")
+    parser.add_argument('--latency', type=_latency, action='append', default=[], metavar='TYPE=SECONDS',
+                        help="simulated seconds per component of a metadata type (repeatable)")
+
+def _server_from_args(args):
+    return MockDeployServer(args.max_files, args.max_zip_bytes, args.max_unzipped_bytes, args.max_concurrent,
+                            args.time_scale, args.overhead, dict(args.latency))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Metadata API deploy calls, to test "
+                                                 "generated packages and deploy strategies offline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the mock deploy server on localhost")
+    serve.add_argument('--host', default=HOST)
+    serve.add_argument('--port', type=int, default=PORT)
+    serve.add_argument('--verbose', action='store_true', help="log every request")
+    _add_server_arguments(serve)
+
+    run = commands.add_parser('run', help="deploy packages, zips or package_planner batches and report metrics")
+    run.add_argument('sources', nargs='+', metavar='PACKAGE',
+                     help="package folders, zips, or batch folders holding a plan.json")
+    run.add_argument('--url', help="deploy to a running `serve` instead of an in-process server")
+    run.add_argument('--parallel', type=int, default=1, help="deploys submitted at the same time (default: 1)")
+    run.add_argument('--metrics-json', metavar='PATH', help="also write the results and metrics as JSON")
+    _add_server_arguments(run)
+    args = parser.parse_args()
+
+    if args.max_concurrent < 1:
+        sys.exit("Error: --max-concurrent must be at least 1.")
+    if args.time_scale < 0:
+        sys.exit("Error: --time-scale must not be negative.")
+
+    if args.command == 'serve':
+        httpd = make_http_server(_server_from_args(args), args.host, args.port, args.verbose)
+        print(f"Mock deploy server on http://{args.host}:{httpd.server_address[1]} (Ctrl+C to stop)")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopped.")
+        finally:
+            httpd.server_close()
+        sys.exit(0)
+
+    missing = [source for source in args.sources if not os.path.exists(source)]
+    if missing:
+        sys.exit(f"Error: {missing[0]} not found.")
+    if args.parallel < 1:
+        sys.exit("Error: --parallel must be at least 1.")
+
+    target = HttpDeployClient(args.url) if args.url else _server_from_args(args)
+    try:
+        results, skipped = run_deploys(target, deploy_waves(args.sources), args.parallel)
+        summary = target.metrics() if args.url else target.metrics.summary()
+    except urllib.error.URLError as exc:
+        sys.exit(f"Error: cannot reach {args.url}: {exc.reason}")
+    print_results(results, skipped, summary)
+    if args.metrics_json:
+        with open(args.metrics_json, 'w', encoding='utf-8') as f:
+            json.dump({'deploys': results, 'skipped': skipped, 'metrics': summary}, f, indent=2)
+    if skipped or any(status['status'] != 'Succeeded' for status in results):
+        sys.exit(1)
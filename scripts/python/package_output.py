@@ -0,0 +1,155 @@
+import abc
+import io
+import os
+import sys
+import tarfile
+import threading
+import zipfile
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# Fixed timestamp for archive members, so identical packages give identical
+# archives (and diffs / caches on the archive stay meaningful).
+ARCHIVE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# ---------------------------------------------------------
+# OUTPUTS
+# ---------------------------------------------------------
+# Generators write every package member through an output's open(rel_path),
+# which returns a writable text handle. rel_path is relative to the package
+# root (e.g. 'customMetadata/Financial_Campaign_Config.General.md-meta.xml').
+
+class DirectoryOutput:
+    """Writes members as files under `root` (the deploy_pkg / deploy_package folders)."""
+
+    def __init__(self, root):
+        self.root = root
+        self._dirs = set()
+
+    def open(self, rel_path):
+        file_path = os.path.join(self.root, rel_path)
+        directory = os.path.dirname(file_path)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        return open(file_path, 'w', encoding='utf-8')
+
+
+class _ArchiveMember(io.StringIO):
+    # Buffers one (small) member in memory and adds it to the archive on close
+    def __init__(self, archive, arcname):
+        super().__init__()
+        self.archive = archive
+        self.arcname = arcname
+
+    def close(self):
+        if not self.closed:
+            self.archive.add(self.arcname, self.getvalue().encode('utf-8'))
+        super().close()
+
+
+class ArchiveOutput(abc.ABC):
+    """
+    Base class of the archive outputs: members never touch the filesystem,
+    they are buffered in memory and appended to the archive one by one.
+    add() is serialized with a lock so the parallel record writer can use it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.members = 0
+        self.bytes = 0
+
+    def package(self, root):
+        """
+        A view of this archive for one package.
+
+        :param root: Folder of the package inside the archive (e.g. 'deploy_pkg'),
+            or '' to put package.xml at the archive root (single package).
+        """
+        return PackageView(self, root)
+
+    def add(self, arcname, data):
+        with self._lock:
+            self._add(arcname, data)
+            self.members += 1
+            self.bytes += len(data)
+
+    @abc.abstractmethod
+    def _add(self, arcname, data):
+        """Writes one member to the archive (called under the lock)."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Finishes the archive."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackageView:
+    """Output that writes into an archive below one package root."""
+
+    def __init__(self, archive, root):
+        self.archive = archive
+        self.root = root.strip('/').replace(os.sep, '/')
+
+    def open(self, rel_path):
+        arcname = rel_path.replace(os.sep, '/')
+        if self.root:
+            arcname = f"{self.root}/{arcname}"
+        return _ArchiveMember(self.archive, arcname)
+
+
+class ZipOutput(ArchiveOutput):
+    """Deploy-ready ZIP for the Metadata API, written straight from memory."""
+
+    def __init__(self, target):
+        """:param target: Path or binary file object of the zip."""
+        super().__init__()
+        self.zip = zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _add(self, arcname, data):
+        info = zipfile.ZipInfo(arcname, date_time=ARCHIVE_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self.zip.writestr(info, data)
+
+    def close(self):
+        self.zip.close()
+
+
+class TarOutput(ArchiveOutput):
+    """Uncompressed tar stream (e.g. on stdout, for piping into other tools)."""
+
+    def __init__(self, target=None):
+        """:param target: Path or binary file object; defaults to stdout."""
+        super().__init__()
+        if target is None or target == '-':
+            self.tar = tarfile.open(fileobj=sys.stdout.buffer, mode='w|')
+        elif isinstance(target, str):
+            self.tar = tarfile.open(target, mode='w')
+        else:
+            self.tar = tarfile.open(fileobj=target, mode='w|')
+
+    def _add(self, arcname, data):
+        info = tarfile.TarInfo(arcname)
+        info.size = len(data)
+        info.mtime = 0
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+def open_archive(zip_path=None, tar_path=None):
+    """Archive output chosen by the --zip / --tar command line options (or None)."""
+    if zip_path:
+        return ZipOutput(zip_path)
+    if tar_path:
+        return TarOutput(tar_path)
+    return None
@@ -0,0 +1,290 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import xml.etree.ElementTree as ET
+
+from hierarchy import SCHEMA
+from metadata_diff import create_package_xml, parse_metadata
+from package_output import DirectoryOutput, ZipOutput
+from validation import PACKAGE_MAX_FILES
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+PACKAGE_DIR = 'deploy_pkg'
+PLAN_FILE = 'plan.json'
+
+# Metadata API deploy limits. package.xml is one of the files; the size
+# limit is on the zip, so staying under it uncompressed is always safe.
+BATCH_MAX_FILES = PACKAGE_MAX_FILES
+BATCH_MAX_BYTES = 39 * 1000 * 1000
+
+# Custom metadata records need their type, '<Type>__mdt'
+RECORD_OBJECT_SUFFIX = '__mdt'
+
+# Standard picklist fields and the StandardValueSet holding their values:
+# a picklist controlled by one of them needs the values deployed first
+STANDARD_VALUE_SETS = {f'Campaign.{level.picklist_field}': level.standard_value_set
+                       for level in SCHEMA if level.standard_value_set}
+
+# ---------------------------------------------------------
+# MEMBERS
+# ---------------------------------------------------------
+
+def member_of(rel_path):
+    """
+    'customMetadata/Financial_Campaign_Config.General.md-meta.xml'
+        -> ('CustomMetadata', 'Financial_Campaign_Config.General')
+
+    :return: (metadata type, member), or None for files that are not
+        metadata (package.xml, destructiveChanges.xml...).
+    """
+    parts = rel_path.replace(os.sep, '/').split('/')
+    name = parts[-1]
+    if parts[0] == 'customMetadata' and name.endswith('.md-meta.xml'):
+        return 'CustomMetadata', name[:-len('.md-meta.xml')]
+    if parts[0] == 'standardValueSets' and name.endswith('.standardValueSet-meta.xml'):
+        return 'StandardValueSet', name[:-len('.standardValueSet-meta.xml')]
+    if parts[0] == 'globalValueSets' and name.endswith('.globalValueSet-meta.xml'):
+        return 'GlobalValueSet', name[:-len('.globalValueSet-meta.xml')]
+    if parts[0] == 'objects' and len(parts) == 2 and name.endswith('.object'):
+        return 'CustomObject', name[:-len('.object')]
+    if parts[0] == 'objects' and len(parts) == 4 and parts[2] == 'fields' and name.endswith('.field-meta.xml'):
+        return 'CustomField', f"{parts[1]}.{name[:-len('.field-meta.xml')]}"
+    return None
+
+def references(metadata_type, member, source):
+    """
+    Components a member cannot be deployed without: the custom metadata
+    type of a record, the controlling field of a dependent picklist (or the
+    StandardValueSet of a standard one) and the GlobalValueSet of a field.
+
+    :param source: Path or binary file object of the member file; only
+        CustomFields are read.
+    :return: List of (metadata type, member).
+    """
+    if metadata_type == 'CustomMetadata':
+        return [('CustomObject', member.partition('.')[0] + RECORD_OBJECT_SUFFIX)]
+    if metadata_type != 'CustomField':
+        return []
+    _, summary = parse_metadata(source)
+    required = []
+    if summary['controllingField']:
+        controlling = f"{member.partition('.')[0]}.{summary['controllingField']}"
+        if controlling in STANDARD_VALUE_SETS:
+            required.append(('StandardValueSet', STANDARD_VALUE_SETS[controlling]))
+        elif controlling.endswith('__c'):
+            required.append(('CustomField', controlling))
+    if summary['valueSetName']:
+        required.append(('GlobalValueSet', summary['valueSetName']))
+    return required
+
+# ---------------------------------------------------------
+# PLANNING
+# ---------------------------------------------------------
+
+class PackageFile:
+    """
+    One member file of a generated package.
+
+    :ivar requires: (type, member) of the components it needs (see references).
+    """
+    __slots__ = ('metadata_type', 'member', 'rel_path', 'size', 'requires')
+
+    def __init__(self, metadata_type, member, rel_path, size, requires=()):
+        self.metadata_type = metadata_type
+        self.member = member
+        self.rel_path = rel_path
+        self.size = size
+        self.requires = tuple(requires)
+
+
+def collect_files(package_dir):
+    """Member files of a package folder, with their sizes and references (package.xml aside)."""
+    files = []
+    for directory, _, names in os.walk(package_dir):
+        for name in names:
+            path = os.path.join(directory, name)
+            rel_path = os.path.relpath(path, package_dir)
+            member = member_of(rel_path)
+            if member is not None:
+                files.append(PackageFile(member[0], member[1], rel_path, os.path.getsize(path),
+                                         references(member[0], member[1], path)))
+    return files
+
+def _split(files, count, slots, max_bytes):
+    # Cuts `files` (in order) into `count` runs of about the same number of
+    # files and bytes; None when they do not fit
+    batches = []
+    position = 0
+    remaining_bytes = sum(f.size for f in files)
+    for index in range(count):
+        left = count - index
+        target_files = min(slots, math.ceil((len(files) - position) / left))
+        target_bytes = remaining_bytes / left
+        batch = []
+        size = 0
+        while position < len(files) and len(batch) < target_files:
+            file = files[position]
+            if batch and (size + file.size > max_bytes or (left > 1 and size >= target_bytes)):
+                break
+            batch.append(file)
+            size += file.size
+            position += 1
+        remaining_bytes -= size
+        if batch:
+            batches.append(batch)
+    return batches if position == len(files) else None
+
+def _tiers(files):
+    # Tier of every file: 0 when it needs nothing else of the package,
+    # otherwise one more than the deepest file it needs
+    by_member = {(f.metadata_type, f.member): f for f in files}
+    tiers = {}
+    visiting = set()
+
+    def tier(file):
+        if file.rel_path not in tiers:
+            if file.rel_path in visiting:
+                raise ValueError(f"{file.rel_path} depends on itself")
+            visiting.add(file.rel_path)
+            tiers[file.rel_path] = max((tier(by_member[r]) + 1 for r in file.requires if r in by_member),
+                                       default=0)
+        return tiers[file.rel_path]
+
+    for file in files:
+        tier(file)
+    return tiers
+
+def plan_batches(files, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_BYTES):
+    """
+    Splits the member files of a package into as few deploy batches as the
+    limits allow, balanced by file count and bytes.
+
+    Members are ordered by dependency tier (objects and value sets, then
+    controlling fields, then the fields and records depending on them...)
+    and then by (type, member), so a file never lands in a batch before one
+    it requires and a batch holds a contiguous range of records.
+
+    :return: List of batches (lists of PackageFile).
+    :raises ValueError: when a single file cannot fit in one batch, or on
+        circular references.
+    """
+    slots = max_files - 1  # package.xml
+    oversized = [f.rel_path for f in files if f.size > max_bytes]
+    if oversized:
+        raise ValueError(f"{oversized[0]} alone exceeds {max_bytes} bytes")
+    tiers = _tiers(files)
+    ordered = sorted(files, key=lambda f: (tiers[f.rel_path], f.metadata_type, f.member))
+    if not ordered:
+        return []
+
+    count = max(1, math.ceil(len(ordered) / slots), math.ceil(sum(f.size for f in ordered) / max_bytes))
+    while True:
+        batches = _split(ordered, count, slots, max_bytes)
+        if batches is not None:
+            return batches
+        count += 1
+
+def batch_name(index):
+    return f"batch_{index + 1:03d}"
+
+def batch_dependencies(batches):
+    """
+    Earlier batches holding members that each batch requires.
+
+    :return: List (one per batch) of sorted batch indexes.
+    """
+    batch_of = {(f.metadata_type, f.member): index for index, batch in enumerate(batches) for f in batch}
+    return [sorted({batch_of[r] for f in batch for r in f.requires if batch_of.get(r, index) != index})
+            for index, batch in enumerate(batches)]
+
+def write_batches(package_dir, batches, output_dir, zip_output=False):
+    """
+    Writes every batch as a deployable package (a folder, or a zip with
+    zip_output) with its own package.xml, plus PLAN_FILE describing the
+    batches: each one lists in depends_on the batches that have to be
+    deployed before it; the others can be deployed in parallel.
+
+    :return: The plan (list of dicts, as written to PLAN_FILE).
+    """
+    # Batches of an earlier, larger plan must never be deployed
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    plan = []
+    dependencies = batch_dependencies(batches)
+    for index, batch in enumerate(batches):
+        name = batch_name(index)
+        if zip_output:
+            target = os.path.join(output_dir, f"{name}.zip")
+            archive = ZipOutput(target)
+            output = archive.package('')
+        else:
+            target = os.path.join(output_dir, name)
+            archive = None
+            output = DirectoryOutput(target)
+        try:
+            members_by_type = {}
+            for file in batch:
+                with open(os.path.join(package_dir, file.rel_path), 'r', encoding='utf-8') as source:
+                    content = source.read()
+                with output.open(file.rel_path) as f:
+                    f.write(content)
+                members_by_type.setdefault(file.metadata_type, []).append(file.member)
+            with output.open('package.xml') as f:
+                f.write(create_package_xml(members_by_type))
+        finally:
+            if archive is not None:
+                archive.close()
+        plan.append({
+            'name': name,
+            'path': target,
+            'files': len(batch) + 1,
+            'bytes': sum(f.size for f in batch),
+            'members': {t: len(m) for t, m in sorted(members_by_type.items())},
+            'depends_on': [batch_name(d) for d in dependencies[index]],
+        })
+    with open(os.path.join(output_dir, PLAN_FILE), 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2)
+    return plan
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a generated package into deploy batches that respect the "
+                                                 "Metadata API limits")
+    parser.add_argument('package_dir', nargs='?', default=PACKAGE_DIR, help=f"(default: {PACKAGE_DIR})")
+    parser.add_argument('--output-dir', help="where the batches are written (default: <package_dir>_batches)")
+    parser.add_argument('--max-files', type=int, default=BATCH_MAX_FILES,
+                        help=f"files per batch, package.xml included (default: {BATCH_MAX_FILES})")
+    parser.add_argument('--max-bytes', type=int, default=BATCH_MAX_BYTES,
+                        help=f"uncompressed bytes per batch (default: {BATCH_MAX_BYTES})")
+    parser.add_argument('--zip', action='store_true', help="write batch_NNN.zip files instead of folders")
+    parser.add_argument('--dry-run', action='store_true', help="only print the plan")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.package_dir):
+        sys.exit(f"Error: {args.package_dir} is not a directory.")
+    if args.max_files < 2:
+        sys.exit("Error: --max-files must leave room for package.xml and one member.")
+    output_dir = args.output_dir or f"{args.package_dir.rstrip(os.sep)}_batches"
+
+    try:
+        files = collect_files(args.package_dir)
+        batches = plan_batches(files, args.max_files, args.max_bytes)
+    except (ValueError, ET.ParseError) as exc:
+        sys.exit(f"Error: {exc}")
+
+    for index, dependencies in enumerate(batch_dependencies(batches)):
+        batch = batches[index]
+        after = f" (after {', '.join(batch_name(d) for d in dependencies)})" if dependencies else ""
+        print(f"{batch_name(index)}: {len(batch) + 1} files, {sum(f.size for f in batch)} bytes, "
+              f"{batch[0].member} .. {batch[-1].member}{after}")
+    if not args.dry_run:
+        write_batches(args.package_dir, batches, output_dir, args.zip)
+        print(f"\n{len(batches)} batch(es) of {len(files)} member(s) written to '{output_dir}'")
@@ -0,0 +1,268 @@
+import argparse
+import contextlib
+import csv
+import io
+import os
+import sys
+
+import create_metadata_records
+import generate_picklist_metadata
+import json_generator
+from dependency_matrix import DependencyMatrix
+from hierarchy import PARENT_LEVELS, SCHEMA
+from package_output import DirectoryOutput, open_archive
+from renderers import render_custom_field, render_standard_valueset
+from taxonomy import TaxonomyBuilder
+from validation import TaxonomyValidator, ValidationError
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+JSON_OUTPUT_FILE = generate_picklist_metadata.INPUT_FILE  # real.json
+
+# ---------------------------------------------------------
+# SINKS
+# ---------------------------------------------------------
+# A sink receives every taxonomy node once, in pre-order, while the pipeline
+# walks the tree (on_node), plus each finished Type subtree in its real.json
+# form (on_type). close() writes whatever needs the whole taxonomy.
+
+class Sink:
+    name = None
+    # Output of the deploy package the sink writes to (set by run_pipeline)
+    output = None
+
+    def open(self):
+        pass
+
+    def on_node(self, node):
+        pass
+
+    def on_type(self, type_obj):
+        pass
+
+    def close(self):
+        pass
+
+
+class PicklistFieldSink(Sink):
+    """Dependent picklist fields, one per level below the top (deploy_package)."""
+    name = 'picklist'
+
+    def __init__(self):
+        levels = [level.name for level in SCHEMA[1:]]
+        self.values = {level: set() for level in levels}
+        self.pairs = {level: set() for level in levels}  # (value, parent value)
+        self.members = []
+
+    def on_node(self, node):
+        if not node.name or node.level not in self.values:
+            return
+        self.values[node.level].add(node.name)
+        parent_name = node.parent.name if node.parent is not None else ''
+        if parent_name:
+            self.pairs[node.level].add((node.name, parent_name))
+
+    def close(self):
+        for level in SCHEMA[1:]:
+            field_api_name = level.picklist_field
+            values = self.values[level.name]
+            controlling_field = PARENT_LEVELS[level.name].picklist_field
+            matrix = DependencyMatrix.from_pairs(self.pairs[level.name], child_values=values)
+            generate_picklist_metadata.write_metadata_file(
+                os.path.join('objects', 'Campaign', 'fields', f'{field_api_name}.field-meta.xml'),
+                f'Campaign.{field_api_name}',
+                lambda out: render_custom_field(out, field_api_name, values, controlling_field, matrix),
+                (),
+                output=self.output,
+            )
+            self.members.append(f'Campaign.{field_api_name}')
+
+
+class StandardValueSetSink(Sink):
+    """Standard value set of the top level, CampaignType (deploy_package)."""
+    name = 'valueset'
+
+    def __init__(self):
+        self.values = set()
+        self.members = []
+
+    def on_node(self, node):
+        if node.depth == 0 and node.name:
+            self.values.add(node.name)
+
+    def close(self):
+        value_set = SCHEMA[0].standard_value_set
+        generate_picklist_metadata.write_metadata_file(
+            os.path.join('standardValueSets', f'{value_set}.standardValueSet-meta.xml'),
+            value_set,
+            lambda out: render_standard_valueset(out, self.values),
+            (),
+            output=self.output,
+        )
+        self.members.append(value_set)
+
+
+class MetadataRecordSink(Sink):
+    """Financial_Campaign_Config__mdt object and records (deploy_pkg)."""
+    name = 'records'
+
+    def __init__(self):
+        self.members = []
+
+    def open(self):
+        create_metadata_records.generate_object_file(output=self.output)
+
+    def on_node(self, node):
+        if node.independent_entry:
+            dev_name, label, fields = create_metadata_records.record_for_node(node)
+            self.members.append(
+                create_metadata_records.generate_record_file(dev_name, label, fields, output=self.output))
+
+    def close(self):
+        create_metadata_records.generate_package_xml(self.members, output=self.output)
+
+
+class JsonSink(Sink):
+    """real.json, written one Type object at a time."""
+    name = 'json'
+
+    def __init__(self, output_file=JSON_OUTPUT_FILE):
+        self.output_file = output_file
+        self.out = None
+        self.first = True
+
+    def open(self):
+        self.out = open(self.output_file, 'w', encoding='utf-8')
+
+    def on_type(self, type_obj):
+        json_generator.write_type_object(type_obj, self.out, self.first)
+        self.first = False
+
+    def close(self):
+        self.out.write("[]" if self.first else "\n]")
+        self.out.close()
+
+
+SINKS = {
+    'picklist': PicklistFieldSink,
+    'valueset': StandardValueSetSink,
+    'records': MetadataRecordSink,
+    'json': JsonSink,
+}
+
+# ---------------------------------------------------------
+# PIPELINE
+# ---------------------------------------------------------
+
+def run_pipeline(csv_file, sinks, archive=None, single_package=False, validate=True):
+    """
+    Parses the CSV once and fans every node out to `sinks` in one traversal.
+
+    :param csv_file: Open CSV file (a column per level of hierarchy.SCHEMA, Connected to a Year,
+        Campaign Name).
+    :param sinks: Sink instances to feed.
+    :param archive: ArchiveOutput that receives the deploy packages instead of
+        the deploy_package / deploy_pkg folders.
+    :param single_package: Put the (only) package at the archive root.
+    :param validate: Check the whole taxonomy before any sink writes
+        (raises ValidationError).
+    :return: The Taxonomy that was built on the way.
+    """
+    picklist_sinks = [s for s in sinks if isinstance(s, (PicklistFieldSink, StandardValueSetSink))]
+    record_sinks = [s for s in sinks if isinstance(s, MetadataRecordSink)]
+    if single_package and picklist_sinks and record_sinks:
+        raise ValueError("A single package archive holds either the picklist or the record package, not both.")
+
+    for package_sinks, root in ((picklist_sinks, generate_picklist_metadata.OUTPUT_DIR),
+                                (record_sinks, create_metadata_records.ROOT_DIR)):
+        if archive is not None:
+            output = archive.package('' if single_package else root)
+        else:
+            output = DirectoryOutput(root)
+        for sink in package_sinks:
+            sink.output = output
+
+    tree = json_generator.build_tree(csv.DictReader(csv_file))
+    builder = TaxonomyBuilder()
+    types = ((type_obj, builder.add(type_obj)) for type_obj in json_generator.iter_type_objects(tree))
+
+    if validate:
+        # Records are written while the nodes stream by, so the whole
+        # taxonomy is indexed and checked before the first sink call.
+        types = list(types)
+        validator = TaxonomyValidator(
+            create_metadata_records.record_for_node if record_sinks else None,
+            create_metadata_records.record_label,
+            picklists=bool(picklist_sinks),
+        )
+        for node in builder.taxonomy.nodes:
+            validator.add(node)
+        report = validator.finish()
+        if not report.ok:
+            raise ValidationError(report)
+        report.print()
+
+    for sink in sinks:
+        sink.open()
+
+    for type_obj, nodes in types:
+        for node in nodes:
+            for sink in sinks:
+                sink.on_node(node)
+        for sink in sinks:
+            sink.on_type(type_obj)
+
+    for sink in sinks:
+        sink.close()
+
+    # The picklist field and value set sinks share deploy_package/package.xml
+    if picklist_sinks:
+        field_members = [m for s in picklist_sinks if isinstance(s, PicklistFieldSink) for m in s.members]
+        valueset_members = [m for s in picklist_sinks if isinstance(s, StandardValueSetSink) for m in s.members]
+        with picklist_sinks[0].output.open('package.xml') as f:
+            f.write(generate_picklist_metadata.create_package_xml(field_members, valueset_members))
+
+    return builder.taxonomy
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CSV -> taxonomy -> every deploy package, in one pass")
+    parser.add_argument('input', nargs='?',
+                        help="CSV file to read ('-' for stdin); defaults to json_generator's built-in csv_data")
+    parser.add_argument('--sinks', nargs='+', choices=list(SINKS), default=list(SINKS),
+                        help="outputs to generate (default: all)")
+    parser.add_argument('--json-output', default=JSON_OUTPUT_FILE, help="file written by the json sink")
+    parser.add_argument('--zip', metavar='PATH', help="write the deploy packages to a zip instead of folders")
+    parser.add_argument('--tar', metavar='PATH', help="write the deploy packages as a tar stream ('-' for stdout)")
+    parser.add_argument('--single-package', action='store_true',
+                        help="put package.xml at the archive root (only one package may be selected)")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="skip the collision / Salesforce limit checks")
+    args = parser.parse_args()
+
+    if args.input is None:
+        csv_file = io.StringIO(json_generator.csv_data)
+    elif args.input == '-':
+        csv_file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        csv_file = open(args.input, 'r', encoding='utf-8-sig', newline='')
+
+    sinks = [JsonSink(args.json_output) if name == 'json' else SINKS[name]() for name in args.sinks]
+    archive = open_archive(args.zip, args.tar)
+    # Keep stdout clean when it carries the tar stream
+    log = contextlib.redirect_stdout(sys.stderr) if args.tar == '-' else contextlib.nullcontext()
+    try:
+        with csv_file, log:
+            taxonomy = run_pipeline(csv_file, sinks, archive, args.single_package,
+                                    validate=not args.no_validate)
+            print(f"Success! {len(taxonomy)} nodes written to: {', '.join(s.name for s in sinks)}")
+    except ValidationError as exc:
+        exc.report.print(file=sys.stderr)
+        raise SystemExit(f"\nFailed: {len(exc.report.errors)} validation error(s), nothing was written.")
+    finally:
+        if archive:
+            archive.close()
@@ -0,0 +1,247 @@
+import io
+import xml.sax.saxutils
+from functools import lru_cache
+
+from dependency_matrix import DependencyMatrix
+
+# ---------------------------------------------------------
+# ESCAPING
+# ---------------------------------------------------------
+# The same labels ("Aliyah", "Psicha", "Bereshis"...) occur over and over in
+# a taxonomy, so every distinct value is escaped once and reused.
+ESCAPE_CACHE_SIZE = 65536
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def escape_text(value):
+    """Escapes &, < and > (picklist values)."""
+    return xml.sax.saxutils.escape(value)
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _escape_value(value):
+    return xml.sax.saxutils.escape(value, {"'": "&apos;", "\"": "&quot;"})
+
+def escape_value(value):
+    """Escapes &, <, >, ' and " (custom metadata values). None becomes ""."""
+    if value is None: return ""
+    return _escape_value(str(value))
+
+# ---------------------------------------------------------
+# LAYOUTS
+# ---------------------------------------------------------
+# Each layout is compiled once into constant fragments and small format
+# strings; renderers write the fragments straight to a file handle instead of
+# building and joining a list of lines.
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+FIELD_HEAD = (
+    XML_DECLARATION +
+    '<CustomField xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+    '    <fullName>{field_api_name}</fullName>\n'
+    '    <label>{label}</label>\n'
+    '    <type>Picklist</type>\n'
+    '    <valueSet>\n'
+)
+FIELD_CONTROLLING = '        <controllingField>{controlling_field}</controllingField>\n'
+FIELD_DEFINITION_OPEN = (
+    '        <valueSetDefinition>\n'
+    '            <sorted>false</sorted>\n'
+)
+FIELD_VALUE = (
+    '            <value>\n'
+    '                <fullName>{0}</fullName>\n'
+    '                <default>false</default>\n'
+    '                <label>{0}</label>\n'
+    '            </value>\n'
+)
+FIELD_DEFINITION_CLOSE = '        </valueSetDefinition>\n'
+# Fields backed by a GlobalValueSet reference it instead of defining values
+FIELD_VALUESET_NAME = (
+    '        <restricted>true</restricted>\n'
+    '        <valueSetName>{0}</valueSetName>\n'
+)
+FIELD_SETTING_OPEN = (
+    '        <valueSettings>\n'
+    '            <valueName>{0}</valueName>\n'
+)
+FIELD_SETTING_PARENT = '            <controllingFieldValue>{0}</controllingFieldValue>\n'
+FIELD_SETTING_CLOSE = '        </valueSettings>\n'
+FIELD_TAIL = (
+    '    </valueSet>\n'
+    '</CustomField>'
+)
+
+VALUESET_HEAD = (
+    XML_DECLARATION +
+    '<StandardValueSet xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+    '    <sorted>false</sorted>\n'
+)
+VALUESET_VALUE = (
+    '    <standardValue>\n'
+    '        <fullName>{0}</fullName>\n'
+    '        <default>false</default>\n'
+    '        <label>{0}</label>\n'
+    '    </standardValue>\n'
+)
+VALUESET_TAIL = '</StandardValueSet>'
+
+GLOBAL_VALUESET_HEAD = (
+    XML_DECLARATION +
+    '<GlobalValueSet xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+)
+GLOBAL_VALUESET_VALUE = (
+    '    <customValue>\n'
+    '        <fullName>{0}</fullName>\n'
+    '        <default>false</default>\n'
+    '        <label>{0}</label>\n'
+    '    </customValue>\n'
+)
+GLOBAL_VALUESET_TAIL = (
+    '    <masterLabel>{label}</masterLabel>\n'
+    '    <sorted>false</sorted>\n'
+    '</GlobalValueSet>'
+)
+
+RECORD_HEAD = (
+    XML_DECLARATION +
+    '<CustomMetadata xmlns="http://soap.sforce.com/2006/04/metadata" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:type="{object_name}">\n'
+)
+RECORD_LABEL = (
+    '    <label>{0}</label>\n'
+    '    <protected>false</protected>\n'
+)
+RECORD_FIELD = (
+    '    <values>\n'
+    '        <field>{0}</field>\n'
+)
+RECORD_STRING = (
+    '        <value xsi:type="xsd:string">{0}</value>\n'
+    '    </values>\n'
+)
+RECORD_TRUE = (
+    '        <value xsi:type="xsd:boolean">true</value>\n'
+    '    </values>\n'
+)
+RECORD_FALSE = (
+    '        <value xsi:type="xsd:boolean">false</value>\n'
+    '    </values>\n'
+)
+RECORD_TAIL = '</CustomMetadata>'
+
+# Rendered fragments for values that repeat across files / parents.
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _field_value(value):
+    return FIELD_VALUE.format(escape_text(value))
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _field_setting_parent(value):
+    return FIELD_SETTING_PARENT.format(escape_text(value))
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _valueset_value(value):
+    return VALUESET_VALUE.format(escape_text(value))
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _global_valueset_value(value):
+    return GLOBAL_VALUESET_VALUE.format(escape_text(value))
+
+@lru_cache(maxsize=256)
+def _record_field(field_api):
+    return RECORD_FIELD.format(field_api)
+
+# ---------------------------------------------------------
+# RENDERERS
+# ---------------------------------------------------------
+
+def render_custom_field(out, field_api_name, all_values, controlling_field=None, dependency_map=None,
+                        value_set_name=None):
+    """
+    Streams the XML of a (dependent) picklist Custom Field to `out`.
+
+    :param out: Writable text handle.
+    :param field_api_name: The API name of the field being created (e.g., SubType__c)
+    :param all_values: A set of all possible values for this field.
+    :param controlling_field: The API name of the parent field (e.g., Type).
+    :param dependency_map: DependencyMatrix, or a dict { 'ChildValue': {'ParentValue1', 'ParentValue2'} }
+    :param value_set_name: GlobalValueSet holding the values (see
+        render_global_valueset); the field then only references it.
+    """
+    write = out.write
+    write(FIELD_HEAD.format(field_api_name=field_api_name, label=field_api_name.replace('__c', '')))
+    if controlling_field:
+        write(FIELD_CONTROLLING.format(controlling_field=controlling_field))
+
+    sorted_values = sorted(all_values)
+    if value_set_name:
+        write(FIELD_VALUESET_NAME.format(value_set_name))
+    else:
+        write(FIELD_DEFINITION_OPEN)
+        for val in sorted_values:
+            write(_field_value(val))
+        write(FIELD_DEFINITION_CLOSE)
+
+    # Which Controlling Values enable which Dependent Value
+    if controlling_field and dependency_map:
+        # A DependencyMatrix already returns its parents sorted
+        presorted = isinstance(dependency_map, DependencyMatrix)
+        for child_val in sorted_values:
+            parents = dependency_map.get(child_val)
+            if parents:
+                write(FIELD_SETTING_OPEN.format(escape_text(child_val)))
+                for parent_val in (parents if presorted else sorted(parents)):
+                    write(_field_setting_parent(parent_val))
+                write(FIELD_SETTING_CLOSE)
+
+    write(FIELD_TAIL)
+
+def render_standard_valueset(out, values_set):
+    """Streams the XML of a Standard Value Set (e.g., CampaignType) to `out`."""
+    write = out.write
+    write(VALUESET_HEAD)
+    for val in sorted(values_set):
+        write(_valueset_value(val))
+    write(VALUESET_TAIL)
+
+
+def render_global_valueset(out, label, values_set):
+    """Streams the XML of a GlobalValueSet (values shared by picklist fields) to `out`."""
+    write = out.write
+    write(GLOBAL_VALUESET_HEAD)
+    for val in sorted(values_set):
+        write(_global_valueset_value(val))
+    write(GLOBAL_VALUESET_TAIL.format(label=escape_text(label)))
+
+
+class MdtRecordRenderer:
+    """Custom Metadata record layout, compiled once per custom metadata type."""
+
+    def __init__(self, object_name):
+        self.head = RECORD_HEAD.format(object_name=object_name)
+
+    def render(self, out, label, values):
+        """
+        Streams one record to `out`.
+
+        :param label: Record label.
+        :param values: Dict { 'Field__c': value }; bools are written as xsd:boolean.
+        """
+        write = out.write
+        write(self.head)
+        write(RECORD_LABEL.format(escape_value(label)))
+        for field_api, val in values.items():
+            write(_record_field(field_api))
+            if val is True:
+                write(RECORD_TRUE)
+            elif val is False:
+                write(RECORD_FALSE)
+            else:
+                write(RECORD_STRING.format(escape_value(val)))
+        write(RECORD_TAIL)
+
+
+def render_to_string(render, *args, **kwargs):
+    """Runs a streaming renderer into memory and returns the XML."""
+    out = io.StringIO()
+    render(out, *args, **kwargs)
+    return out.getvalue()
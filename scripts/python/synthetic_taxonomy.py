@@ -0,0 +1,136 @@
+import argparse
+import csv
+import io
+import json
+import random
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# Fan-out per level: SubTypes per Type, Details per SubType.
+DEFAULT_FANOUT = (12, 6)
+DEFAULT_SEED = 5784
+
+# Vocabulary the names are drawn from. Details deliberately repeat across
+# SubTypes (like "Aliyah" or "Psicha" in real.json) and a few names carry
+# characters that need escaping.
+TYPE_WORDS = ['General', 'Kibudim', 'Events', 'Grants', 'Services', 'Membership',
+              'Advertising', 'Shul Renovation', 'Hall Rental', 'Education', 'Youth']
+SUBTYPE_WORDS = ['Shabbos', 'Rosh Hashana', 'Yom Kipur', 'Sukkos', 'Simchas Torah', 'Pesach',
+                 'Shavuos', 'Chanukah', 'Purim', 'Tishrei', '19 Kislev', 'Hagbah Yearly',
+                 'Psicha Yearly', 'Building Fund', 'Mikvah Fund', "Men's Mikvah", 'Kiddush', 'Shiurim']
+DETAIL_WORDS = ['Aliyah', 'Psicha', 'Hagbah', 'Gelilah', 'Maftir', 'Bereshis', 'Shemos', 'Vayikra',
+                'Bamidbar', 'Devarim', 'Geshem', 'Tal', "Kol Hane'orim", "Vehoyo Zar'acho",
+                'Choson Torah', 'Choson Breishis', 'Ata Horisa', 'Kol Nidrei', 'Sponsor & Honor']
+
+CSV_HEADER = ['Type', 'SubType', 'Detail', 'Connected to a Year', 'Campaign Name']
+
+# ---------------------------------------------------------
+# GENERATOR
+# ---------------------------------------------------------
+
+def _names(words, count, rng):
+    """`count` distinct names drawn from `words`, numbered once the words run out."""
+    picked = rng.sample(words, min(count, len(words)))
+    rounds = 2
+    while len(picked) < count:
+        picked.extend(f"{w} {rounds}" for w in rng.sample(words, min(count - len(picked), len(words))))
+        rounds += 1
+    return picked
+
+def _entry(obj, name, rng, independent_probability):
+    if rng.random() < independent_probability:
+        connected = rng.random() < 0.7
+        obj['independentEntry'] = True
+        obj['campaignName'] = f"{{year}} - {name}" if connected else name
+        obj['connectedToYear'] = connected
+    return obj
+
+def generate_taxonomy(node_count, fanout=DEFAULT_FANOUT, seed=DEFAULT_SEED):
+    """
+    Builds a real.json-shaped list with roughly `node_count` nodes.
+
+    :param node_count: Target number of Type + SubType + Detail nodes.
+    :param fanout: (SubTypes per Type, Details per SubType).
+    :param seed: Seed of the random generator; the same arguments always
+        produce the same taxonomy.
+    """
+    rng = random.Random(seed)
+    subtypes_per_type, details_per_subtype = fanout
+    nodes_per_type = 1 + subtypes_per_type * (1 + details_per_subtype)
+    type_count = max(1, round(node_count / nodes_per_type))
+
+    data = []
+    for type_name in _names(TYPE_WORDS, type_count, rng):
+        # Nodes without children only exist through their own entry
+        type_obj = _entry({'name': type_name, 'type': 'type', 'independentEntry': False}, type_name, rng,
+                          0.3 if subtypes_per_type else 1.0)
+        subtypes = []
+        for sub_name in _names(SUBTYPE_WORDS, subtypes_per_type, rng):
+            sub_obj = _entry({'name': sub_name, 'type': 'subtype', 'independentEntry': False}, sub_name, rng,
+                             0.8 if details_per_subtype else 1.0)
+            details = []
+            for detail_name in _names(DETAIL_WORDS, details_per_subtype, rng):
+                details.append(_entry({'name': detail_name, 'type': 'detail'}, f"{sub_name} {detail_name}", rng, 1.0))
+            if details:
+                sub_obj['details'] = details
+            subtypes.append(sub_obj)
+        if subtypes:
+            type_obj['subtypes'] = subtypes
+        data.append(type_obj)
+    return data
+
+def count_nodes(data):
+    count = 0
+    for type_obj in data:
+        count += 1
+        for sub_obj in type_obj.get('subtypes', []):
+            count += 1 + len(sub_obj.get('details', []))
+    return count
+
+def iter_csv_rows(data):
+    """The CSV rows json_generator.py turns back into `data`."""
+    def row(type_name, sub_name, detail_name, obj):
+        return [type_name, sub_name, detail_name,
+                'Yes' if obj.get('connectedToYear') else 'No', obj.get('campaignName', '')]
+
+    for type_obj in data:
+        if type_obj.get('independentEntry'):
+            yield row(type_obj['name'], '', '', type_obj)
+        for sub_obj in type_obj.get('subtypes', []):
+            if sub_obj.get('independentEntry'):
+                yield row(type_obj['name'], sub_obj['name'], '', sub_obj)
+            for detail_obj in sub_obj.get('details', []):
+                yield row(type_obj['name'], sub_obj['name'], detail_obj['name'], detail_obj)
+
+def write_csv(data, out):
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+    writer.writerows(iter_csv_rows(data))
+
+def generate_csv_text(data):
+    out = io.StringIO()
+    write_csv(data, out)
+    return out.getvalue()
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic real.json (and matching CSV)")
+    parser.add_argument('nodes', type=int, help="approximate number of nodes")
+    parser.add_argument('--fanout', type=int, nargs=2, default=DEFAULT_FANOUT, metavar=('SUBTYPES', 'DETAILS'),
+                        help="SubTypes per Type and Details per SubType")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--json', default='synthetic.json', help="output real.json-shaped file")
+    parser.add_argument('--csv', help="also write the matching CSV export")
+    args = parser.parse_args()
+
+    data = generate_taxonomy(args.nodes, tuple(args.fanout), args.seed)
+    with open(args.json, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            write_csv(data, f)
+    print(f"Generated {count_nodes(data)} nodes in '{args.json}'")
@@ -0,0 +1,343 @@
+import codecs
+import json
+import mmap
+import os
+import re
+import sys
+from collections import defaultdict
+
+import instrumentation
+from hierarchy import CHILD_KEYS, LEVELS
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# Levels of the taxonomy (LEVELS, top to bottom) and the JSON key holding
+# the children of each level (CHILD_KEYS) come from hierarchy.SCHEMA.
+
+# Bytes of real.json decoded at a time by the streaming reader; the window
+# doubles while a single Type subtree does not fit.
+READ_CHUNK = 1 << 16
+
+# ---------------------------------------------------------
+# MODEL
+# ---------------------------------------------------------
+
+class TaxonomyNode:
+    """
+    One Type / SubType / Detail entry of the taxonomy.
+
+    Nodes are kept small on purpose: large taxonomies hold tens of thousands of
+    them, so attributes live in __slots__ and names are interned (the same
+    Detail, e.g. "Aliyah", appears under many SubTypes).
+    """
+    __slots__ = ('name', 'level', 'depth', 'parent', 'children',
+                 'independent_entry', 'campaign_name', 'connected_to_year')
+
+    def __init__(self, name, level, depth, parent=None, independent_entry=False,
+                 campaign_name='', connected_to_year=False):
+        self.name = sys.intern(name)
+        self.level = level
+        self.depth = depth
+        self.parent = parent
+        self.children = []
+        self.independent_entry = independent_entry
+        self.campaign_name = campaign_name
+        self.connected_to_year = connected_to_year
+
+    @property
+    def path(self):
+        """Tuple of names from the Type down to this node."""
+        names = []
+        node = self
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return tuple(reversed(names))
+
+    def ancestor(self, level):
+        """Returns the node at `level` on the path to this node (or None)."""
+        node = self
+        while node is not None and node.level != level:
+            node = node.parent
+        return node
+
+    def __repr__(self):
+        return f"TaxonomyNode({' > '.join(self.path)!r}, level={self.level!r})"
+
+
+class Taxonomy:
+    """
+    The whole taxonomy plus the indexes both generators need.
+
+    :ivar roots: Type nodes in file order.
+    :ivar nodes: Every node in pre-order (Type, its SubTypes, their Details...).
+    :ivar by_path: Dict { ('Type', 'SubType', 'Detail'): node }
+    :ivar by_level: Dict { 'subtype': [node, ...] } in pre-order.
+    :ivar by_name: Dict { 'detail': { 'Aliyah': [node, ...] } }
+    """
+
+    def __init__(self):
+        self.roots = []
+        self.nodes = []
+        self.by_path = {}
+        self.by_level = {level: [] for level in LEVELS}
+        self.by_name = {level: defaultdict(list) for level in LEVELS}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _index(self, node, path):
+        self.nodes.append(node)
+        self.by_path[path] = node
+        self.by_level[node.level].append(node)
+        self.by_name[node.level][node.name].append(node)
+
+    def extend(self, other):
+        """
+        Appends the nodes and indexes of another taxonomy, e.g. one Type
+        subtree built on its own, without walking its nodes again.
+        """
+        self.roots.extend(other.roots)
+        self.nodes.extend(other.nodes)
+        self.by_path.update(other.by_path)
+        for level in LEVELS:
+            self.by_level[level].extend(other.by_level[level])
+            by_name = self.by_name[level]
+            for name, nodes in other.by_name[level].items():
+                by_name[name].extend(nodes)
+
+    def iter_entries(self):
+        """Yields the nodes that produce a record (independentEntry), in pre-order."""
+        for node in self.nodes:
+            if node.independent_entry:
+                yield node
+
+    def values(self, level):
+        """Set of all non-empty names used at `level`."""
+        return {name for name in self.by_name[level] if name}
+
+    def dependency_map(self, level):
+        """
+        Maps every value of `level` to the set of parent values that enable it.
+
+        :return: Dict { 'ChildValue': {'ParentValue1', 'ParentValue2'} }
+        """
+        dependency_map = defaultdict(set)
+        for name, nodes in self.by_name[level].items():
+            if not name:
+                continue
+            for node in nodes:
+                if node.parent is not None and node.parent.name:
+                    dependency_map[name].add(node.parent.name)
+        return dependency_map
+
+# ---------------------------------------------------------
+# BUILDING
+# ---------------------------------------------------------
+
+class TaxonomyBuilder:
+    """
+    Adds Type subtrees (real.json dicts) to a Taxonomy one at a time, so a
+    caller can act on the new nodes while the rest of the input is still
+    being read.
+    """
+
+    def __init__(self, taxonomy=None):
+        self.taxonomy = taxonomy if taxonomy is not None else Taxonomy()
+
+    def add(self, raw_type):
+        """
+        Indexes one Type subtree in a single iterative pass.
+
+        :return: The new nodes, in pre-order.
+        :raises ValueError: when the subtree does not have the real.json
+            shape (see _check_shape).
+        """
+        taxonomy = self.taxonomy
+        added = []
+
+        # Stack of (raw dict, parent node, parent path); children are pushed in
+        # reverse so nodes come off the stack in file (pre-)order.
+        stack = [(raw_type, None, ())]
+        while stack:
+            raw, parent, parent_path = stack.pop()
+            depth = len(parent_path)
+            level = LEVELS[depth]
+            _check_shape(raw, level, parent_path)
+            node = TaxonomyNode(
+                raw.get('name') or '',
+                level,
+                depth,
+                parent=parent,
+                independent_entry=raw.get('independentEntry') is True,
+                campaign_name=raw.get('campaignName', ''),
+                connected_to_year=raw.get('connectedToYear', False),
+            )
+            if parent is None:
+                taxonomy.roots.append(node)
+            else:
+                parent.children.append(node)
+            path = parent_path + (node.name,)
+            taxonomy._index(node, path)
+            added.append(node)
+
+            child_key = CHILD_KEYS.get(level)
+            if child_key and raw.get(child_key):
+                for child in reversed(raw[child_key]):
+                    stack.append((child, node, path))
+
+        return added
+
+
+def _check_shape(raw, level, parent_path):
+    # Rejects what a hand edit can break in real.json (a number where the
+    # list of children goes, a bare string as a node...) with a ValueError
+    # naming the place, instead of a TypeError deep in a generator
+    where = ' > '.join(parent_path) or 'top level'
+    if not isinstance(raw, dict):
+        raise ValueError(f"{where}: expected a {level} object, got {type(raw).__name__}")
+    for key in ('name', 'campaignName'):
+        if raw.get(key) is not None and not isinstance(raw[key], str):
+            raise ValueError(f"{where}: '{key}' of a {level} must be a string")
+    child_key = CHILD_KEYS.get(level)
+    if child_key and raw.get(child_key) and not isinstance(raw[child_key], list):
+        raise ValueError(f"{where} > {raw.get('name') or ''}: '{child_key}' must be a list")
+
+def build_taxonomy(data):
+    """
+    Builds a Taxonomy from the parsed real.json list in a single iterative pass.
+    """
+    builder = TaxonomyBuilder()
+    for raw_type in data:
+        builder.add(raw_type)
+    return builder.taxonomy
+
+# ---------------------------------------------------------
+# READING
+# ---------------------------------------------------------
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _MappedText:
+    # A decoded window over a memory-mapped UTF-8 file. `text[pos:]` is the
+    # unread part; fill() appends the next bytes of the mapping to it.
+    def __init__(self, mapped, chunk_size):
+        self.mapped = mapped
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.text = ''
+        self.pos = 0
+
+    def fill(self, size):
+        """Reads up to `size` more bytes; False at the end of the file."""
+        if self.offset >= len(self.mapped):
+            return False
+        end = min(self.offset + size, len(self.mapped))
+        decoded = self.decoder.decode(self.mapped[self.offset:end], final=end == len(self.mapped))
+        self.text = self.text[self.pos:] + decoded
+        self.pos = 0
+        self.offset = end
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character ('' at the end)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill(self.chunk_size):
+                return ''
+
+    def error(self, message):
+        return ValueError(f"{message} (near byte {self.offset - len(self.text[self.pos:].encode('utf-8'))})")
+
+
+def iter_raw_types(input_file, chunk_size=READ_CHUNK):
+    """
+    Yields the Type dicts of a real.json file one at a time.
+
+    The file is memory-mapped and decoded a window at a time, and every
+    element of the top-level array is parsed on its own: only one Type
+    subtree is ever held as Python objects, never the whole document.
+
+    :raises ValueError: when the file is not a JSON array of objects.
+    """
+    decoder = json.JSONDecoder()
+    with open(input_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{input_file} is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            reader = _MappedText(mapped, chunk_size)
+            if reader.peek() != '[':
+                raise reader.error(f"{input_file} is not a JSON array")
+            reader.pos += 1
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    reader.peek()
+                    size = chunk_size
+                    while True:
+                        try:
+                            raw, end = decoder.raw_decode(reader.text, reader.pos)
+                            break
+                        except json.JSONDecodeError:
+                            # Most likely the subtree runs past the window
+                            if not reader.fill(size):
+                                raise
+                            size *= 2
+                    if not isinstance(raw, dict):
+                        raise reader.error(f"{input_file}: expected a Type object")
+                    reader.pos = end
+                    yield raw
+
+                    separator = reader.peek()
+                    if separator not in (',', ']'):
+                        raise reader.error(f"{input_file}: expected ',' or ']'")
+                    reader.pos += 1
+                    if separator == ']':
+                        break
+            if reader.peek() != '':
+                raise reader.error(f"{input_file}: extra data after the array")
+
+
+def stream_taxonomy(input_file):
+    """
+    Reads real.json one Type subtree at a time (see iter_raw_types).
+
+    :return: Generator of (taxonomy, new nodes in pre-order); the taxonomy is
+        complete once the generator is exhausted.
+    """
+    builder = TaxonomyBuilder()
+    raw_types = iter_raw_types(input_file)
+    while True:
+        with instrumentation.stage('parse'):
+            raw_type = next(raw_types, None)
+        if raw_type is None:
+            return
+        with instrumentation.stage('index'):
+            added = builder.add(raw_type)
+        yield builder.taxonomy, added
+
+
+_cache = {}
+
+def load_taxonomy(input_file):
+    """
+    Loads and indexes a real.json file (streamed, see stream_taxonomy).
+
+    Results are cached per file (path, size and mtime), so running both
+    generators in one process parses and walks the file only once.
+    """
+    stat = os.stat(input_file)
+    key = (os.path.abspath(input_file), stat.st_size, stat.st_mtime_ns)
+    if key not in _cache:
+        taxonomy = Taxonomy()
+        for taxonomy, _ in stream_taxonomy(input_file):
+            pass
+        _cache.clear()
+        _cache[key] = taxonomy
+    return _cache[key]
@@ -0,0 +1,21 @@
+import os
+
+from batch import discover_tenants
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[]')
+
+def test_discovery_skips_files_of_other_scripts(tmp_path):
+    for rel_path in ('shul_a.json', 'shul_b/real.json', 'deploy_pkg.manifest.json', 'bench_results.json',
+                     'plan.json', 'shul_b/deploy_package.manifest.json'):
+        _touch(tmp_path / rel_path)
+
+    assert [name for name, _ in discover_tenants([str(tmp_path)])] == ['shul_a', 'shul_b']
+    assert [name for name, _ in discover_tenants([str(tmp_path / '*.json')])] == ['shul_a']
+
+def test_files_given_by_name_are_used(tmp_path):
+    _touch(tmp_path / 'plan.json')
+    assert discover_tenants([str(tmp_path / 'plan.json')]) == [('plan', str(tmp_path / 'plan.json'))]
@@ -0,0 +1,26 @@
+import pytest
+
+from campaign_expansion import hebrew_numeral, year_label
+
+
+def test_hebrew_numerals():
+    assert hebrew_numeral(784) == 'תשפ״ד'
+    assert hebrew_numeral(5) == 'ה׳'
+    assert hebrew_numeral(15) == 'ט״ו'
+    assert hebrew_numeral(16) == 'ט״ז'
+    assert hebrew_numeral(400) == 'ת׳'
+
+def test_hebrew_numeral_range():
+    for number in (0, 1000):
+        with pytest.raises(ValueError):
+            hebrew_numeral(number)
+
+def test_year_labels():
+    assert year_label(5784) == '84'
+    assert year_label(5784, 'full') == '5784'
+    assert year_label(5784, 'hebrew') == 'תשפ״ד'
+
+def test_exact_thousands():
+    assert year_label(5000, 'hebrew') == 'ה׳'
+    assert year_label(6000, 'hebrew') == 'ו׳'
+    assert year_label(5000) == '00'
@@ -0,0 +1,70 @@
+import csv
+import io
+
+import pytest
+
+from campaign_index import CampaignIndex, resolve_csv, write_index
+from taxonomy import build_taxonomy
+
+
+@pytest.fixture
+def taxonomy():
+    return build_taxonomy([
+        {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+            {"name": "Shabbos", "type": "subtype", "independentEntry": True,
+             "campaignName": "{year} - Shabbos Kibud", "connectedToYear": True, "details": [
+                {"name": "Aliyah", "type": "detail", "independentEntry": True,
+                 "campaignName": "{year} - Aliyah", "connectedToYear": True},
+                {"name": "Parshas Bamidbar", "type": "detail", "independentEntry": True,
+                 "campaignName": "Bamidbar", "connectedToYear": False},
+            ]},
+        ]},
+        {"name": "Men's Mikvah", "type": "type", "independentEntry": True,
+         "campaignName": "Mikvah Fund", "connectedToYear": False},
+    ])
+
+@pytest.fixture
+def index(taxonomy, tmp_path):
+    path = str(tmp_path / 'campaign_index.bin')
+    write_index(taxonomy, path)
+    with CampaignIndex(path) as index:
+        yield index
+
+def test_every_node_round_trips(taxonomy, index):
+    for node in taxonomy.nodes:
+        entry = index.lookup(*node.path)
+        assert entry.path == node.path
+        assert entry.campaign_name == node.campaign_name
+        assert entry.independent_entry == node.independent_entry
+        assert entry.connected_to_year == node.connected_to_year
+        assert entry.score == 1.0
+
+def test_lookup_folds_case_and_punctuation(index):
+    assert index.lookup('  mens MIKVAH ').campaign_name == 'Mikvah Fund'
+    assert index.lookup('Kibudim', 'Shabbos', 'Walrus') is None
+
+def test_fuzzy_lookup_accepts_spelling_variants(index):
+    assert index.lookup('Kibudim', 'Shabos', 'Parshas Bamidbor') is None
+    entry = index.lookup('Kibudim', 'Shabos', 'Parshas Bamidbor', fuzzy=True)
+    assert entry.path == ('Kibudim', 'Shabbos', 'Parshas Bamidbar')
+    assert 0.8 <= entry.score < 1.0
+
+def test_prefix(index):
+    assert [entry.path[-1] for entry in index.prefix('PARSH')] == ['Parshas Bamidbar']
+    assert [entry.path[-1] for entry in index.prefix('sh', level='subtype')] == ['Shabbos']
+    assert index.prefix('sh', level='type') == []
+
+def test_resolve_csv_counts_non_entries_as_unresolved(index):
+    source = io.StringIO(
+        "Type,SubType,Detail,Amount\n"
+        "Kibudim,Shabbos,Aliyah,18\n"
+        "Kibudim,,,36\n"
+        "Kibudim,Shabbos,Walrus,5\n"
+        "Kibudim,Shabbos,Aliyah,18\n"
+    )
+    target = io.StringIO()
+    assert resolve_csv(index, source, target) == (4, 2)
+
+    rows = list(csv.DictReader(io.StringIO(target.getvalue())))
+    assert [row['Campaign_Name'] for row in rows] == ['{year} - Aliyah', '', '', '{year} - Aliyah']
+    assert rows[1]['Match_Score'] == ''
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from csv_merge import CSV_COLUMNS, merge_sources
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'csv_merge.py')
+
+BASE = [
+    {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+        {"name": "Shabbos", "type": "subtype", "independentEntry": True,
+         "campaignName": "{year} - Shabbos Kibud", "connectedToYear": True, "details": [
+            {"name": "Aliyah", "type": "detail", "independentEntry": True,
+             "campaignName": "{year} - Aliyah", "connectedToYear": True},
+        ]},
+    ]},
+    {"name": "Mikvah", "type": "type", "independentEntry": True,
+     "campaignName": "Mikvah Fund", "connectedToYear": False},
+]
+
+EARLY_ROWS = [
+    ('Yom Tov', 'Succos', '', 'Yes', '{year} - Succos'),
+    ('Kibudim', 'Shabbos', 'Maftir', 'Yes', '{year} - Maftir'),
+    ('Kibudim', 'Shabbos', 'Aliyah', 'No', 'Aliyah (old)'),
+    ('Building', '', '', 'No', 'Building Fund'),
+    ('Yom Tov', 'Pesach', 'Matzos', 'Yes', '{year} - Matzos'),
+]
+
+LATE_ROWS = [
+    ('Kibudim', 'Shabbos', 'Aliyah', 'No', 'Aliyah'),
+    ('Yom Tov', 'Succos', 'Lulav', 'Yes', '{year} - Lulav'),
+    ('Building', '', '', 'Yes', '{year} - Building'),
+]
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for names in rows:
+            writer.writerow(names)
+    return str(path)
+
+@pytest.fixture
+def sources(tmp_path):
+    base = tmp_path / 'real.json'
+    base.write_text(json.dumps(BASE), encoding='utf-8')
+    return (str(base), [_write_csv(tmp_path / 'early.csv', EARLY_ROWS),
+                        _write_csv(tmp_path / 'late.csv', LATE_ROWS)])
+
+def _merge(sources, chunk_rows, tmp_path):
+    base, csv_files = sources
+    output = io.StringIO()
+    report = merge_sources(csv_files, base, output, chunk_rows=chunk_rows, tmp_dir=str(tmp_path))
+    assert report.problems == []
+    return output.getvalue()
+
+def test_output_does_not_depend_on_chunk_rows(sources, tmp_path):
+    in_memory = _merge(sources, 1000, tmp_path)
+    for chunk_rows in (1, 2, 3, 5):
+        assert _merge(sources, chunk_rows, tmp_path) == in_memory
+    # Spilled runs are removed with their temporary directory
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['early.csv', 'late.csv', 'real.json']
+
+@pytest.mark.parametrize('chunk_rows', [0, -1])
+def test_chunk_rows_below_one_are_rejected(sources, chunk_rows):
+    base, csv_files = sources
+    output = io.StringIO()
+    with pytest.raises(ValueError, match='chunk_rows must be at least 1'):
+        merge_sources(csv_files, base, output, chunk_rows=chunk_rows)
+    assert output.getvalue() == ''
+
+def test_cli_keeps_the_base_on_zero_chunk_rows(sources):
+    base, csv_files = sources
+    with open(base, 'r', encoding='utf-8') as f:
+        before = f.read()
+    result = subprocess.run([sys.executable, SCRIPT, *csv_files, '--base', base, '-o', base, '--chunk-rows', '0'],
+                            capture_output=True, text=True)
+
+    assert result.returncode != 0
+    assert '--chunk-rows must be at least 1' in result.stderr
+    with open(base, 'r', encoding='utf-8') as f:
+        assert f.read() == before
+
+def test_later_sources_win(sources, tmp_path):
+    merged = json.loads(_merge(sources, 2, tmp_path))
+    by_name = {node['name']: node for node in merged}
+
+    assert [node['name'] for node in merged] == ['Building', 'Kibudim', 'Mikvah', 'Yom Tov']
+    assert by_name['Building']['campaignName'] == '{year} - Building'
+    assert by_name['Building']['connectedToYear'] is True
+    aliyah = next(d for d in by_name['Kibudim']['subtypes'][0]['details'] if d['name'] == 'Aliyah')
+    assert (aliyah['campaignName'], aliyah['connectedToYear']) == ('Aliyah', False)
+    assert by_name['Mikvah']['campaignName'] == 'Mikvah Fund'
@@ -0,0 +1,118 @@
+import os
+
+import create_metadata_records
+import generate_picklist_metadata
+from manifest import Manifest
+from taxonomy import build_taxonomy
+from verify_package import package_members
+
+RECORD_PREFIX = create_metadata_records.MDT_FILENAME_PREFIX
+
+
+def _taxonomy(*details, campaign_name='{year} - Aliyah'):
+    return build_taxonomy([
+        {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+            {"name": "Sukkos", "type": "subtype", "independentEntry": True,
+             "campaignName": "{year} - Sukkos Kibud", "connectedToYear": True, "details": [
+                {"name": detail, "type": "detail", "independentEntry": True,
+                 "campaignName": campaign_name, "connectedToYear": True}
+                for detail in details
+            ]},
+        ]},
+    ])
+
+def _records(taxonomy, root_dir):
+    create_metadata_records.process_json(taxonomy, incremental=True, validate=False, root_dir=str(root_dir))
+    return Manifest(str(root_dir))
+
+def test_second_run_is_a_no_op(tmp_path):
+    root = tmp_path / 'deploy_pkg'
+    _records(_taxonomy('Aliyah', 'Hagbah'), root)
+    record = root / 'customMetadata' / f'{RECORD_PREFIX}.Kibudim_Sukkos_Aliyah.md-meta.xml'
+    mtime = os.stat(record).st_mtime_ns
+
+    manifest = _records(_taxonomy('Aliyah', 'Hagbah'), root)
+
+    assert os.stat(record).st_mtime_ns == mtime
+    # The package stays complete, the delta is empty
+    assert len(package_members(str(root))['CustomMetadata']) == 3
+    assert package_members(str(root))['CustomObject'] == [create_metadata_records.MDT_OBJECT_NAME]
+    assert package_members(manifest.delta_dir) == {}
+    assert os.listdir(manifest.delta_dir) == ['package.xml']
+
+def test_changed_record_goes_to_the_delta(tmp_path):
+    root = tmp_path / 'deploy_pkg'
+    _records(_taxonomy('Aliyah'), root)
+    manifest = _records(_taxonomy('Aliyah', campaign_name='{year} - Sukkos Aliyah'), root)
+
+    member = f'{RECORD_PREFIX}.Kibudim_Sukkos_Aliyah'
+    assert package_members(manifest.delta_dir) == {'CustomMetadata': [member]}
+    with open(os.path.join(manifest.delta_dir, 'customMetadata', f'{member}.md-meta.xml'), encoding='utf-8') as f:
+        assert '{year} - Sukkos Aliyah' in f.read()
+    assert len(package_members(str(root))['CustomMetadata']) == 2
+
+def test_touched_file_is_hashed_and_edited_file_rewritten(tmp_path):
+    root = tmp_path / 'deploy_pkg'
+    _records(_taxonomy('Aliyah'), root)
+    record = root / 'customMetadata' / f'{RECORD_PREFIX}.Kibudim_Sukkos_Aliyah.md-meta.xml'
+
+    # Same content, new mtime: still current
+    os.utime(record, ns=(0, 0))
+    manifest = _records(_taxonomy('Aliyah'), root)
+    assert package_members(manifest.delta_dir) == {}
+
+    # Edited by hand: rendered again
+    content = record.read_text(encoding='utf-8')
+    record.write_text(content.replace('Sukkos - Aliyah', 'Edited'), encoding='utf-8')
+    manifest = _records(_taxonomy('Aliyah'), root)
+    assert package_members(manifest.delta_dir) == {'CustomMetadata': [f'{RECORD_PREFIX}.Kibudim_Sukkos_Aliyah']}
+    assert record.read_text(encoding='utf-8') == content
+
+def test_orphaned_record_is_removed_and_destroyed(tmp_path):
+    root = tmp_path / 'deploy_pkg'
+    _records(_taxonomy('Aliyah', 'Hagbah'), root)
+    manifest = _records(_taxonomy('Aliyah'), root)
+
+    member = f'{RECORD_PREFIX}.Kibudim_Sukkos_Hagbah'
+    assert not os.path.exists(root / 'customMetadata' / f'{member}.md-meta.xml')
+    assert member not in package_members(str(root))['CustomMetadata']
+    with open(os.path.join(manifest.delta_dir, 'destructiveChanges.xml'), encoding='utf-8') as f:
+        assert f'<members>{member}</members>' in f.read()
+
+def test_picklist_package_stays_complete(tmp_path):
+    root = tmp_path / 'deploy_package'
+    for detail in ('Aliyah', 'Hagbah'):
+        generate_picklist_metadata.process_json_and_generate_files(
+            _taxonomy('Aliyah', detail), incremental=True, validate=False, output_dir=str(root))
+
+    members = package_members(str(root))
+    assert members['CustomField'] == ['Campaign.SubType__c', 'Campaign.Detail__c']
+    assert members['StandardValueSet'] == ['CampaignType']
+    delta = package_members(str(root) + '_delta')
+    assert delta == {'CustomField': ['Campaign.Detail__c']}
+
+def test_turning_global_value_sets_off_removes_them(tmp_path):
+    root = tmp_path / 'deploy_package'
+    for global_value_sets in (True, False):
+        generate_picklist_metadata.process_json_and_generate_files(
+            _taxonomy('Aliyah'), incremental=True, validate=False, output_dir=str(root),
+            global_value_sets=global_value_sets)
+
+    assert not (root / 'globalValueSets').exists()
+    assert 'GlobalValueSet' not in package_members(str(root))
+    destructive = str(root) + '_delta'
+    with open(os.path.join(destructive, 'destructiveChanges.xml'), 'r', encoding='utf-8') as f:
+        content = f.read()
+    assert '<members>Campaign_SubType</members>' in content and '<members>Campaign_Detail</members>' in content
+    assert package_members(destructive) == {'CustomField': ['Campaign.SubType__c', 'Campaign.Detail__c']}
+
+def test_full_run_removes_stale_global_value_sets(tmp_path):
+    root = tmp_path / 'deploy_package'
+    generate_picklist_metadata.process_json_and_generate_files(
+        _taxonomy('Aliyah'), validate=False, output_dir=str(root), global_value_sets=True)
+    assert sorted(os.listdir(root / 'globalValueSets')) == [
+        'Campaign_Detail.globalValueSet-meta.xml', 'Campaign_SubType.globalValueSet-meta.xml']
+
+    generate_picklist_metadata.process_json_and_generate_files(_taxonomy('Aliyah'), validate=False,
+                                                               output_dir=str(root))
+    assert not (root / 'globalValueSets').exists()
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+import instrumentation
+from package_output import DirectoryOutput
+
+
+def test_failed_render_writes_nothing(tmp_path):
+    profiler = instrumentation.Profiler()
+    output = instrumentation.ProfiledOutput(DirectoryOutput(str(tmp_path)), profiler)
+
+    with pytest.raises(RuntimeError):
+        with output.open('broken.xml') as f:
+            f.write('<CustomField')
+            raise RuntimeError("render failed")
+    with output.open('ok.xml') as f:
+        f.write('<CustomField/>')
+
+    assert os.listdir(tmp_path) == ['ok.xml']
+    assert profiler.files == 1
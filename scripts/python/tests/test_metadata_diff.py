@@ -0,0 +1,46 @@
+import os
+
+from metadata_diff import diff_metadata, generate_files, parse_metadata_string, write_delta
+from package_output import DirectoryOutput
+from taxonomy import build_taxonomy
+
+
+def _taxonomy(campaign_name='{year} - Aliyah'):
+    return build_taxonomy([
+        {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+            {"name": "Shabbos", "type": "subtype", "independentEntry": True,
+             "campaignName": "{year} - Shabbos Kibud", "connectedToYear": True, "details": [
+                {"name": "Aliyah", "type": "detail", "independentEntry": True,
+                 "campaignName": campaign_name, "connectedToYear": True},
+            ]},
+        ]},
+    ])
+
+def _write(files, target_dir):
+    output = DirectoryOutput(str(target_dir))
+    for generated in files:
+        with output.open(generated.rel_path) as f:
+            f.write(generated.content)
+
+def test_record_values_are_parsed():
+    record = next(f for f in generate_files(_taxonomy()) if f.metadata_type == 'CustomMetadata')
+    _, summary = parse_metadata_string(record.content)
+    assert summary['values']['Campaign_Name__c'] == '{year} - Shabbos Kibud'
+    assert summary['values']['Has_Year__c'] is True
+
+def test_unchanged_tree_has_empty_delta(tmp_path):
+    _write(generate_files(_taxonomy()), tmp_path)
+    diff = diff_metadata(generate_files(_taxonomy()), str(tmp_path))
+    assert diff.deploy == [] and diff.removed_records == []
+
+def test_record_with_one_edited_field_is_deployed(tmp_path):
+    _write(generate_files(_taxonomy()), tmp_path / 'target')
+    diff = diff_metadata(generate_files(_taxonomy('{year} - Shabbos Aliyah')), str(tmp_path / 'target'))
+
+    assert [f.member for f in diff.changed] == ['Financial_Campaign_Config.Kibudim_Shabbos_Aliyah']
+    assert diff.added == [] and diff.removed_records == []
+
+    write_delta(diff, DirectoryOutput(str(tmp_path / 'delta')))
+    with open(tmp_path / 'delta' / 'package.xml', encoding='utf-8') as f:
+        assert '<members>Financial_Campaign_Config.Kibudim_Shabbos_Aliyah</members>' in f.read()
+    assert not os.path.exists(tmp_path / 'delta' / 'destructiveChanges.xml')
@@ -0,0 +1,93 @@
+import os
+import threading
+
+import pytest
+
+import generate_picklist_metadata
+from mock_deploy import (HttpDeployClient, MockDeployServer, deploy_waves, make_http_server, package_zip,
+                         print_results, run_deploys)
+from package_planner import collect_files, plan_batches, write_batches
+from taxonomy import build_taxonomy
+
+
+def _batches(tmp_path, global_value_sets=False):
+    root = tmp_path / 'deploy_package'
+    generate_picklist_metadata.process_json_and_generate_files(build_taxonomy([
+        {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+            {"name": "Sukkos", "type": "subtype", "independentEntry": True,
+             "campaignName": "{year} - Sukkos Kibud", "connectedToYear": True, "details": [
+                {"name": "Aliyah", "type": "detail", "independentEntry": True,
+                 "campaignName": "{year} - Aliyah", "connectedToYear": True},
+            ]},
+        ]},
+    ]), validate=False, output_dir=str(root), global_value_sets=global_value_sets)
+    output_dir = str(tmp_path / 'batches')
+    write_batches(str(root), plan_batches(collect_files(str(root)), max_files=2), output_dir)
+    return output_dir
+
+def _server():
+    return MockDeployServer(max_files=2, time_scale=0)
+
+def test_planned_batches_deploy_in_order(tmp_path):
+    results, skipped = run_deploys(_server(), deploy_waves([_batches(tmp_path)]), parallel=2)
+
+    assert [status['status'] for status in results] == ['Succeeded'] * 3
+    assert skipped == []
+
+def test_dependent_picklist_needs_its_controlling_field(tmp_path):
+    output_dir = _batches(tmp_path)
+    server = _server()
+    status = server.wait(server.deploy(package_zip(os.path.join(output_dir, 'batch_003'))))
+
+    assert status['status'] == 'Failed'
+    assert [f['problem'] for f in status['componentFailures']] == [
+        "Controlling field 'Campaign.SubType__c' does not exist in the org"]
+
+def test_field_needs_its_global_value_set(tmp_path):
+    output_dir = _batches(tmp_path, global_value_sets=True)
+    server = _server()
+    server.org.add(('StandardValueSet', 'CampaignType'))
+    # Campaign_Detail, Campaign_SubType, CampaignType, then the fields
+    status = server.wait(server.deploy(package_zip(os.path.join(output_dir, 'batch_004'))))
+
+    assert [f['problem'] for f in status['componentFailures']] == [
+        "Global value set 'Campaign_SubType' does not exist in the org"]
+
+def test_summary_without_simulated_time(tmp_path, capsys):
+    server = _server()
+    results, skipped = run_deploys(server, deploy_waves([_batches(tmp_path)]))
+    summary = server.metrics.summary()
+
+    assert (summary['deploys'], summary['succeeded'], summary['components']) == (3, 3, 3)
+    assert summary['simulated_wall_seconds'] is None
+    assert summary['simulated_components_per_second'] is None
+    print_results(results, skipped, summary)
+    assert "3/3 deploy(s) succeeded, 3 components" in capsys.readouterr().out
+
+def test_summary_with_simulated_time(tmp_path):
+    server = MockDeployServer(max_files=2, time_scale=0.001)
+    run_deploys(server, deploy_waves([_batches(tmp_path)]))
+    summary = server.metrics.summary()
+
+    assert summary['simulated_wall_seconds'] == pytest.approx(summary['wall_seconds'] / 0.001)
+    assert summary['simulated_components_per_second'] > 0
+
+@pytest.mark.parametrize('arguments', [{'time_scale': -1}, {'max_concurrent': 0}])
+def test_invalid_server_settings_are_rejected(arguments):
+    with pytest.raises(ValueError):
+        MockDeployServer(**arguments)
+
+def test_http_deploy_and_metrics(tmp_path):
+    httpd = make_http_server(_server(), port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = HttpDeployClient(f"http://127.0.0.1:{httpd.server_address[1]}")
+        results, skipped = run_deploys(client, deploy_waves([_batches(tmp_path)]))
+        summary = client.metrics()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert [status['status'] for status in results] == ['Succeeded'] * 3
+    assert summary['succeeded'] == 3 and summary['simulated_wall_seconds'] is None
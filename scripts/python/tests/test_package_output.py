@@ -0,0 +1,27 @@
+import io
+import zipfile
+
+import pytest
+
+from package_output import ArchiveOutput, ZipOutput
+
+
+def test_archive_output_without_close_cannot_be_created():
+    class NoClose(ArchiveOutput):
+        def _add(self, arcname, data):
+            pass
+
+    with pytest.raises(TypeError):
+        NoClose()
+    with pytest.raises(TypeError):
+        ArchiveOutput()
+
+def test_zip_output_writes_package_members():
+    target = io.BytesIO()
+    with ZipOutput(target) as archive:
+        with archive.package('deploy_pkg').open('package.xml') as f:
+            f.write('<Package/>')
+
+    with zipfile.ZipFile(io.BytesIO(target.getvalue())) as written:
+        assert written.read('deploy_pkg/package.xml') == b'<Package/>'
+    assert (archive.members, archive.bytes) == (1, len('<Package/>'))
@@ -0,0 +1,61 @@
+import json
+import os
+
+import generate_picklist_metadata
+from package_planner import PLAN_FILE, PackageFile, batch_dependencies, collect_files, plan_batches, write_batches
+from taxonomy import build_taxonomy
+
+
+def _taxonomy():
+    return build_taxonomy([
+        {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+            {"name": "Sukkos", "type": "subtype", "independentEntry": True,
+             "campaignName": "{year} - Sukkos Kibud", "connectedToYear": True, "details": [
+                {"name": "Aliyah", "type": "detail", "independentEntry": True,
+                 "campaignName": "{year} - Aliyah", "connectedToYear": True},
+            ]},
+        ]},
+    ])
+
+def _picklists(root, global_value_sets=False):
+    generate_picklist_metadata.process_json_and_generate_files(
+        _taxonomy(), validate=False, output_dir=str(root), global_value_sets=global_value_sets)
+    return collect_files(str(root))
+
+def _members(batches):
+    return [[f.member for f in batch] for batch in batches]
+
+def test_picklists_are_planned_in_dependency_order(tmp_path):
+    root = tmp_path / 'deploy_package'
+    batches = plan_batches(_picklists(root), max_files=2)
+
+    assert _members(batches) == [['CampaignType'], ['Campaign.SubType__c'], ['Campaign.Detail__c']]
+    assert batch_dependencies(batches) == [[], [0], [1]]
+
+    plan = write_batches(str(root), batches, str(tmp_path / 'batches'))
+    assert [batch['depends_on'] for batch in plan] == [[], ['batch_001'], ['batch_002']]
+    with open(os.path.join(tmp_path, 'batches', PLAN_FILE), 'r', encoding='utf-8') as f:
+        assert json.load(f) == plan
+
+def test_global_value_sets_come_before_their_fields(tmp_path):
+    batches = plan_batches(_picklists(tmp_path / 'deploy_package', global_value_sets=True), max_files=3)
+
+    assert _members(batches) == [['Campaign_Detail', 'Campaign_SubType'], ['CampaignType', 'Campaign.SubType__c'],
+                                 ['Campaign.Detail__c']]
+    assert batch_dependencies(batches) == [[], [0], [0, 1]]
+
+def test_members_of_one_batch_do_not_depend_on_each_other(tmp_path):
+    batches = plan_batches(_picklists(tmp_path / 'deploy_package'))
+
+    assert len(batches) == 1
+    assert batch_dependencies(batches) == [[]]
+
+def test_records_come_after_their_object():
+    files = [PackageFile('CustomMetadata', f'Config.Record_{i}', f'customMetadata/Config.Record_{i}.md-meta.xml', 10,
+                         [('CustomObject', 'Config__mdt')])
+             for i in range(4)]
+    files.append(PackageFile('CustomObject', 'Config__mdt', 'objects/Config__mdt.object', 10))
+    batches = plan_batches(files, max_files=3)
+
+    assert _members(batches)[0][0] == 'Config__mdt'
+    assert batch_dependencies(batches) == [[], [0], [0]]
@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from taxonomy import build_taxonomy, iter_raw_types, load_taxonomy
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REAL_JSON = os.path.join(HERE, 'real.json')
+
+# Multi-byte names, so chunk boundaries fall inside characters
+TYPES = [
+    {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+        {"name": "שמחת תורה", "type": "subtype", "independentEntry": True, "campaignName": "{year} - ש״ת"},
+    ]},
+    {"name": "Events", "type": "type", "independentEntry": True, "campaignName": "Events — כ״ף"},
+]
+
+
+def _write(tmp_path, text, bom=False):
+    path = tmp_path / 'real.json'
+    path.write_bytes((b'\xef\xbb\xbf' if bom else b'') + text.encode('utf-8'))
+    return str(path)
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 64, 1 << 16])
+def test_chunk_boundaries(tmp_path, chunk_size):
+    for indent in (None, 4):
+        path = _write(tmp_path, json.dumps(TYPES, ensure_ascii=False, indent=indent))
+        assert list(iter_raw_types(path, chunk_size)) == TYPES
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_real_json_matches_json_load(chunk_size):
+    with open(REAL_JSON, encoding='utf-8') as f:
+        expected = json.load(f)
+    assert list(iter_raw_types(REAL_JSON, chunk_size)) == expected
+
+def test_bom_and_empty_array(tmp_path):
+    assert list(iter_raw_types(_write(tmp_path, json.dumps(TYPES), bom=True), 4)) == TYPES
+    assert list(iter_raw_types(_write(tmp_path, ' [ \n ] \n'), 1)) == []
+
+def test_load_taxonomy_matches_build_taxonomy():
+    with open(REAL_JSON, encoding='utf-8') as f:
+        expected = build_taxonomy(json.load(f))
+    loaded = load_taxonomy(REAL_JSON)
+    assert [n.path for n in loaded.nodes] == [n.path for n in expected.nodes]
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1 << 16])
+@pytest.mark.parametrize('text, message', [
+    ('{"name": "A"}', "is not a JSON array (near byte 0)"),
+    ('[{"name": "א"} {"name": "B"}]', "expected ',' or ']' (near byte 16)"),
+    ('[{"name": "A"}, 5]', "expected a Type object (near byte 16)"),
+    ('[{"name": "א"}] x', "extra data after the array (near byte 17)"),
+])
+def test_error_positions(tmp_path, chunk_size, text, message):
+    with pytest.raises(ValueError) as exc:
+        list(iter_raw_types(_write(tmp_path, text), chunk_size))
+    assert str(exc.value).endswith(message)
+
+def test_truncated_and_empty_files(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_raw_types(_write(tmp_path, '[{"name": "A"}, {"name": "B"'), 4))
+    with pytest.raises(ValueError, match="is empty"):
+        list(iter_raw_types(_write(tmp_path, '')))
+
+@pytest.mark.parametrize('raw_type, message', [
+    ({"name": "Kibudim", "subtypes": 5}, "'subtypes' must be a list"),
+    ({"name": "Kibudim", "subtypes": ["Shabbos"]}, "expected a subtype object, got str"),
+    ({"name": "Kibudim", "subtypes": [{"name": "Shabbos", "details": {"name": "Aliyah"}}]},
+     "Kibudim > Shabbos: 'details' must be a list"),
+    ({"name": 18}, "'name' of a type must be a string"),
+    ({"name": "Kibudim", "independentEntry": True, "campaignName": ["Kibudim"]}, "'campaignName' of a type"),
+])
+def test_malformed_shapes_raise_value_error(raw_type, message):
+    with pytest.raises(ValueError, match=message):
+        build_taxonomy([raw_type])
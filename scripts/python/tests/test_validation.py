@@ -0,0 +1,66 @@
+import pytest
+
+import create_metadata_records
+import validation
+from taxonomy import build_taxonomy
+from validation import ValidationError, check_taxonomy, validate_taxonomy
+
+
+def _type(name, *subtypes, entry=False):
+    return {"name": name, "type": "type", "independentEntry": entry, "campaignName": name,
+            "subtypes": [{"name": s, "type": "subtype", "independentEntry": True, "campaignName": s}
+                         for s in subtypes]}
+
+def _validate(*types):
+    return validate_taxonomy(build_taxonomy(list(types)), create_metadata_records.record_for_node,
+                             create_metadata_records.record_label)
+
+def test_clean_taxonomy_passes():
+    report = _validate(_type('Kibudim', 'Sukkos', 'Pesach'))
+    assert report.ok and report.warnings == []
+
+def test_developer_name_collision():
+    report = _validate(_type('Kibudim', 'Simchas Torah', 'Simchas-Torah'))
+    assert len(report.errors) == 1
+    assert "DeveloperName collision 'Kibudim_Simchas_Torah'" in report.errors[0]
+
+def test_developer_name_length_and_first_character():
+    report = _validate(_type('1 Kibudim', 'x' * 40))
+    assert any("does not start with a letter" in e for e in report.errors)
+    assert any("is longer than 40 characters" in e for e in report.errors)
+
+def test_cut_and_shared_labels_are_warnings():
+    # DeveloperName 'Ev_...' is 39 characters, the label 'Ev - ...' 41
+    cut = _validate(_type('Ev', 'S' * 36))
+    assert cut.ok
+    assert cut.warnings == [f"Label cut to 40 characters: 'Ev - {'S' * 36}' -> 'Ev - {'S' * 35}'"]
+
+    # Records are labelled with their last two names
+    detail = {"name": "Aliyah", "type": "detail", "independentEntry": True, "campaignName": "Aliyah"}
+    shared = _validate(*({"name": name, "type": "type", "subtypes": [
+        {"name": "Sukkos", "type": "subtype", "details": [detail]}]} for name in ('Kibudim', 'Events')))
+    assert shared.ok
+    assert shared.warnings == ["Label 'Sukkos - Aliyah' shared by 'Kibudim > Sukkos > Aliyah' and "
+                               "'Events > Sukkos > Aliyah'"]
+
+def test_values_differing_in_case():
+    report = _validate(_type('Kibudim', 'Sukkos'), _type('Events', 'SUKKOS'))
+    assert any("'Sukkos' and 'SUKKOS' only differ in case" in e for e in report.errors)
+
+def test_controlling_field_value_limit():
+    types = [_type(f'Type {i}') for i in range(validation.CONTROLLING_MAX_VALUES + 1)]
+    report = validate_taxonomy(build_taxonomy(types))
+    assert report.errors == [f"Campaign.Type has {validation.CONTROLLING_MAX_VALUES + 1} values "
+                             f"(limit {validation.CONTROLLING_MAX_VALUES} for a controlling field)"]
+
+def test_too_many_records_is_only_a_warning(monkeypatch):
+    monkeypatch.setattr(validation, 'PACKAGE_MAX_FILES', 3)
+    report = _validate(_type('Kibudim', 'Sukkos', 'Pesach'))
+    assert report.ok
+    assert any("split it with package_planner.py" in w for w in report.warnings)
+
+def test_check_taxonomy_raises_on_errors():
+    taxonomy = build_taxonomy([_type('Kibudim', 'Simchas Torah', 'Simchas-Torah')])
+    with pytest.raises(ValidationError) as exc:
+        check_taxonomy(taxonomy, create_metadata_records.record_for_node, create_metadata_records.record_label)
+    assert len(exc.value.report.errors) == 1
@@ -0,0 +1,49 @@
+import json
+import os
+
+import create_metadata_records
+from watch import Watcher
+
+TYPES = [
+    {"name": "Kibudim", "type": "type", "independentEntry": False, "subtypes": [
+        {"name": "Sukkos", "type": "subtype", "independentEntry": True,
+         "campaignName": "{year} - Sukkos Kibud", "connectedToYear": True},
+    ]},
+]
+
+
+def _watcher(tmp_path, types):
+    input_file = tmp_path / 'real.json'
+    input_file.write_text(json.dumps(types), encoding='utf-8')
+    return Watcher(str(input_file), picklist_dir=str(tmp_path / 'deploy_package'),
+                   records_dir=str(tmp_path / 'deploy_pkg'))
+
+def _record_files(tmp_path):
+    return sorted(os.listdir(tmp_path / 'deploy_pkg' / create_metadata_records.RECORDS_REL_DIR))
+
+def test_malformed_input_is_reported(tmp_path, capsys):
+    watcher = _watcher(tmp_path, [{"name": "Kibudim", "subtypes": 5}])
+    assert watcher.rebuild() is False
+    assert "'subtypes' must be a list" in capsys.readouterr().out
+
+    (tmp_path / 'real.json').write_text(json.dumps([{"name": "Kibudim", "subtypes": [7]}]), encoding='utf-8')
+    assert watcher.rebuild() is False
+    assert "expected a subtype object, got int" in capsys.readouterr().out
+
+    (tmp_path / 'real.json').write_text(json.dumps(TYPES), encoding='utf-8')
+    assert watcher.rebuild() is True
+
+def test_write_errors_are_reported_and_retried(tmp_path, capsys, monkeypatch):
+    watcher = _watcher(tmp_path, TYPES)
+    generate_record_file = create_metadata_records.generate_record_file
+
+    def locked(dev_name, *args, **kwargs):
+        raise PermissionError(f"{dev_name} is locked")
+
+    monkeypatch.setattr(create_metadata_records, 'generate_record_file', locked)
+    assert watcher.rebuild() is False
+    assert "Cannot write the packages: 1 record file(s) failed: Kibudim_Sukkos" in capsys.readouterr().out
+
+    monkeypatch.setattr(create_metadata_records, 'generate_record_file', generate_record_file)
+    assert watcher.rebuild() is True
+    assert _record_files(tmp_path) == [f'{create_metadata_records.MDT_FILENAME_PREFIX}.Kibudim_Sukkos.md-meta.xml']
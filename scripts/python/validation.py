@@ -0,0 +1,218 @@
+import argparse
+import os
+import sys
+
+from hierarchy import SCHEMA
+from taxonomy import LEVELS, load_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+# Salesforce limits the generated metadata has to respect.
+DEVELOPER_NAME_MAX_LENGTH = 40    # Custom metadata record DeveloperName
+LABEL_MAX_LENGTH = 40             # Custom metadata record label (longer labels are cut)
+TEXT_FIELD_MAX_LENGTH = 255       # Record level fields (Type__c...), Campaign_Name__c
+PICKLIST_VALUE_MAX_LENGTH = 255   # Picklist value API name / label
+PICKLIST_MAX_VALUES = 1000        # Values of one picklist field
+CONTROLLING_MAX_VALUES = 300      # Values of a controlling field (Type, SubType__c)
+PACKAGE_MAX_FILES = 10000         # Files in one deploy package
+
+# Picklist fields per level, and whether the field controls the next level.
+PICKLIST_FIELDS = {
+    level.name: (f'Campaign.{level.picklist_field}', depth < len(SCHEMA) - 1)
+    for depth, level in enumerate(SCHEMA)
+}
+
+# Report at most this many messages per kind on the command line.
+MAX_PRINTED = 50
+
+# ---------------------------------------------------------
+# REPORT
+# ---------------------------------------------------------
+
+class ValidationReport:
+    """Errors (the deploy would fail or overwrite files) and warnings (data is altered)."""
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def print(self, file=sys.stdout, limit=MAX_PRINTED):
+        for kind, messages in (("Error", self.errors), ("Warning", self.warnings)):
+            for message in messages[:limit]:
+                print(f"{kind}: {message}", file=file)
+            if len(messages) > limit:
+                print(f"{kind}: ... and {len(messages) - limit} more", file=file)
+
+
+class ValidationError(Exception):
+    """Raised before rendering when the taxonomy cannot be deployed as is."""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(f"{len(report.errors)} validation error(s): " + "; ".join(report.errors[:10]))
+
+# ---------------------------------------------------------
+# VALIDATION
+# ---------------------------------------------------------
+
+def _path(node):
+    return ' > '.join(node.path)
+
+
+class TaxonomyValidator:
+    """
+    Checks nodes one at a time (in a single pass, against hash indexes) for
+    anything that would only show up after rendering or at deploy time:
+
+    - two records with the same DeveloperName (the second silently overwrites
+      the first file), e.g. "Simchas Torah" and "Simchas-Torah"
+    - DeveloperNames that are empty, too long or do not start with a letter
+    - labels cut to 40 characters, and records sharing a cut label
+    - picklist values that only differ in case (Salesforce treats them as one)
+    - value lengths and value / file counts over the Salesforce limits (a
+      package over the file limit is only a warning: package_planner.py
+      splits it)
+
+    :param record_for_node: Callable returning (dev_name, label, fields) for a
+        node (create_metadata_records.record_for_node); None skips the record checks.
+    :param record_label: Callable returning the label of a node before it is cut.
+    :param picklists: Check the picklist values.
+    """
+
+    def __init__(self, record_for_node=None, record_label=None, picklists=True):
+        self.record_for_node = record_for_node
+        self.record_label = record_label
+        self.picklists = picklists
+        self.report = ValidationReport()
+
+        self.dev_names = {}  # lowercased DeveloperName -> node
+        self.labels = {}     # record label (as deployed) -> node
+        self.values = {level: {} for level in LEVELS}  # casefolded value -> value
+        self.records = 0
+
+    def add(self, node):
+        if self.picklists and node.name:
+            self._check_value(node)
+        if self.record_for_node is not None and node.independent_entry:
+            self._check_record(node)
+
+    def _check_value(self, node):
+        report = self.report
+        seen = self.values[node.level]
+        key = node.name.casefold()
+        other = seen.get(key)
+        if other is None:
+            seen[key] = node.name
+            if len(node.name) > PICKLIST_VALUE_MAX_LENGTH:
+                report.errors.append(f"{PICKLIST_FIELDS[node.level][0]} value longer than "
+                                     f"{PICKLIST_VALUE_MAX_LENGTH} characters: '{_path(node)}'")
+        elif other != node.name:
+            report.errors.append(f"{PICKLIST_FIELDS[node.level][0]} values '{other}' and '{node.name}' "
+                                 f"only differ in case (at '{_path(node)}')")
+
+    def _check_record(self, node):
+        report = self.report
+        dev_name, label, fields = self.record_for_node(node)
+        self.records += 1
+
+        if not dev_name:
+            report.errors.append(f"Empty DeveloperName for '{_path(node)}'")
+        else:
+            if len(dev_name) > DEVELOPER_NAME_MAX_LENGTH:
+                report.errors.append(f"DeveloperName '{dev_name}' is longer than "
+                                     f"{DEVELOPER_NAME_MAX_LENGTH} characters ('{_path(node)}')")
+            if not dev_name[0].isalpha():
+                report.errors.append(f"DeveloperName '{dev_name}' does not start with a letter ('{_path(node)}')")
+            key = dev_name.lower()
+            other = self.dev_names.get(key)
+            if other is None:
+                self.dev_names[key] = node
+            else:
+                report.errors.append(f"DeveloperName collision '{dev_name}': '{_path(other)}' "
+                                     f"and '{_path(node)}' write the same record")
+
+        if self.record_label is not None:
+            full_label = self.record_label(node)
+            if len(full_label) > LABEL_MAX_LENGTH:
+                report.warnings.append(f"Label cut to {LABEL_MAX_LENGTH} characters: '{full_label}' -> '{label}'")
+        other = self.labels.get(label)
+        if other is None:
+            self.labels[label] = node
+        else:
+            report.warnings.append(f"Label '{label}' shared by '{_path(other)}' and '{_path(node)}'")
+
+        for field_api, value in fields.items():
+            if isinstance(value, str) and len(value) > TEXT_FIELD_MAX_LENGTH:
+                report.errors.append(f"{field_api} longer than {TEXT_FIELD_MAX_LENGTH} characters "
+                                     f"('{_path(node)}')")
+
+    def finish(self):
+        """Checks the count limits and returns the ValidationReport."""
+        report = self.report
+        if self.picklists:
+            for level, (field, controlling) in PICKLIST_FIELDS.items():
+                count = len(self.values[level])
+                limit = CONTROLLING_MAX_VALUES if controlling else PICKLIST_MAX_VALUES
+                if count > limit:
+                    report.errors.append(f"{field} has {count} values (limit {limit}"
+                                         + (" for a controlling field)" if controlling else ")"))
+        if self.record_for_node is not None:
+            # Records + the object definition + package.xml
+            files = self.records + 2
+            if files > PACKAGE_MAX_FILES:
+                # Deployable once split into batches (package_planner.py)
+                report.warnings.append(f"{self.records} records exceed the {PACKAGE_MAX_FILES} files "
+                                       f"of one deploy package; split it with package_planner.py")
+        return report
+
+
+def validate_taxonomy(taxonomy, record_for_node=None, record_label=None, picklists=True):
+    """
+    Runs the TaxonomyValidator over every node.
+
+    :return: ValidationReport
+    """
+    validator = TaxonomyValidator(record_for_node, record_label, picklists)
+    for node in taxonomy.nodes:
+        validator.add(node)
+    return validator.finish()
+
+
+def check_taxonomy(taxonomy, record_for_node=None, record_label=None, picklists=True):
+    """
+    Validates before anything is rendered: prints the warnings and raises
+    ValidationError if there is any error.
+    """
+    report = validate_taxonomy(taxonomy, record_for_node, record_label, picklists)
+    if not report.ok:
+        raise ValidationError(report)
+    report.print()
+    return report
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    import create_metadata_records
+
+    parser = argparse.ArgumentParser(description="Check a real.json taxonomy against the Salesforce limits")
+    parser.add_argument('input', nargs='?', default=create_metadata_records.INPUT_FILE)
+    parser.add_argument('--strict', action='store_true', help="fail on warnings too")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        sys.exit(f"Error: {args.input} not found.")
+
+    taxonomy = load_taxonomy(args.input)
+    report = validate_taxonomy(taxonomy, create_metadata_records.record_for_node,
+                               create_metadata_records.record_label)
+    report.print()
+    print(f"\n{len(taxonomy)} nodes checked: {len(report.errors)} error(s), {len(report.warnings)} warning(s)")
+    if not report.ok or (args.strict and report.warnings):
+        sys.exit(1)
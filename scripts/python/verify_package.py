@@ -0,0 +1,259 @@
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import create_metadata_records
+import generate_picklist_metadata
+from hierarchy import PARENT_LEVELS, SCHEMA
+from metadata_diff import parse_metadata, parse_record
+from taxonomy import load_taxonomy
+from validation import ValidationReport
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+INPUT_FILE = 'real.json'
+PICKLIST_DIR = generate_picklist_metadata.OUTPUT_DIR  # deploy_package
+RECORDS_DIR = create_metadata_records.ROOT_DIR        # deploy_pkg
+
+RECORD_SUFFIX = '.md-meta.xml'
+# Below this many files parsing in this process beats starting a pool
+MIN_PARALLEL_FILES = 500
+# Files handed to a worker at a time
+CHUNKS_PER_WORKER = 8
+
+# Level of the taxonomy each picklist member is built from, and its
+# controlling field (see generate_picklist_metadata.picklist_files)
+PICKLIST_LEVELS = {
+    level.standard_value_set or f'Campaign.{level.picklist_field}':
+        (level.name, PARENT_LEVELS[level.name].picklist_field if level.name in PARENT_LEVELS else None)
+    for level in SCHEMA
+}
+
+# ---------------------------------------------------------
+# PARSING
+# ---------------------------------------------------------
+
+def parse_file(path):
+    """
+    Pool worker: parses one generated file back.
+
+    :return: (path, summary or None, error message or None); see
+        metadata_diff.parse_metadata for the summary.
+    """
+    try:
+        parse = parse_record if path.endswith(RECORD_SUFFIX) else parse_metadata
+        _, summary = parse(path)
+        return path, summary, None
+    except (ET.ParseError, OSError) as exc:
+        return path, None, str(exc)
+
+def parse_files(paths, workers=None):
+    """Parses every path, on a process pool when there are many."""
+    if workers == 1 or len(paths) < MIN_PARALLEL_FILES:
+        return [parse_file(path) for path in paths]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * CHUNKS_PER_WORKER))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_file, paths, chunksize=chunksize))
+
+def package_members(package_dir):
+    """Members listed in a package.xml, as { type name: [members] } (None when there is none)."""
+    path = os.path.join(package_dir, 'package.xml')
+    if not os.path.exists(path):
+        return None
+    return parse_package_xml(path)
+
+def parse_package_xml(source):
+    """
+    :param source: Path or open binary file of a package.xml.
+    :return: Dict { type name: [members] }.
+    :raises ET.ParseError: when it is not well-formed.
+    """
+    members = {}
+    for types in ET.parse(source).getroot():
+        if types.tag.rpartition('}')[2] != 'types':
+            continue
+        children = {child.tag.rpartition('}')[2]: child for child in types}
+        names = [(child.text or '').strip() for child in types if child.tag.endswith('members')]
+        members.setdefault((children['name'].text or '').strip(), []).extend(names)
+    return members
+
+# ---------------------------------------------------------
+# VERIFICATION
+# ---------------------------------------------------------
+
+def _expected_record(fields):
+    # parse_metadata reads '' and nil as None and booleans as bool
+    return {field: value if isinstance(value, bool) else (value or None) for field, value in fields.items()}
+
+def _describe(values, limit=5):
+    values = sorted(values)
+    shown = ", ".join(repr(v) for v in values[:limit])
+    return shown + (f" and {len(values) - limit} more" if len(values) > limit else "")
+
+def verify_picklists(taxonomy, parsed, report):
+    """
+    :param parsed: Dict { member: summary } of the parsed picklist files
+        (GlobalValueSets included).
+    """
+    for member, (level, controlling_field) in PICKLIST_LEVELS.items():
+        summary = parsed.get(member)
+        if summary is None:
+            continue
+        # A field of a --global-value-sets package takes its values from the set
+        actual_values = summary['values']
+        if summary.get('valueSetName'):
+            value_set = parsed.get(summary['valueSetName'])
+            if value_set is None:
+                report.errors.append(f"{member}: GlobalValueSet '{summary['valueSetName']}' is missing")
+                continue
+            actual_values = value_set['values']
+        values = taxonomy.values(level)
+        expected_values = {value.strip(): (value.strip(), 'false') for value in values}
+        if actual_values != expected_values:
+            missing = set(expected_values) - set(actual_values)
+            extra = set(actual_values) - set(expected_values)
+            wrong = {v for v in set(expected_values) & set(actual_values)
+                     if expected_values[v] != actual_values[v]}
+            for kind, names in (("missing", missing), ("unexpected", extra), ("wrong label / default", wrong)):
+                if names:
+                    report.errors.append(f"{member}: {len(names)} {kind} value(s): {_describe(names)}")
+        if controlling_field is None:
+            continue
+        if summary['controllingField'] != controlling_field:
+            report.errors.append(f"{member}: controlled by '{summary['controllingField']}', "
+                                 f"expected '{controlling_field}'")
+        expected_settings = {child.strip(): frozenset(p.strip() for p in parents)
+                             for child, parents in taxonomy.dependency_map(level).items()}
+        if summary['settings'] != expected_settings:
+            differing = {child for child in set(expected_settings) | set(summary['settings'])
+                         if expected_settings.get(child) != summary['settings'].get(child)}
+            report.errors.append(f"{member}: dependencies of {len(differing)} value(s) differ: "
+                                 f"{_describe(differing)}")
+
+def verify_records(taxonomy, parsed, report):
+    """
+    Rebuilds the (Type, SubType, Detail) entries from the parsed records and
+    compares them with the taxonomy.
+
+    :param parsed: Dict { member: summary } of the parsed record files.
+    """
+    expected = {}
+    for node in taxonomy.iter_entries():
+        dev_name, label, fields = create_metadata_records.record_for_node(node)
+        member, _ = create_metadata_records.record_member(dev_name)
+        # Nodes sharing a DeveloperName are a validation error; on disk the
+        # last one written wins, so it does here too
+        expected[member] = (node, label, _expected_record(fields))
+
+    for member in sorted(set(expected) - set(parsed)):
+        report.errors.append(f"{member}: missing record ('{' > '.join(expected[member][0].path)}')")
+    for member in sorted(set(parsed) - set(expected)):
+        values = parsed[member]['values']
+        path = ' > '.join(v for v in (values.get(level.record_field) for level in SCHEMA) if v)
+        report.errors.append(f"{member}: record not in the taxonomy ('{path}')")
+    for member in sorted(set(expected) & set(parsed)):
+        node, label, fields = expected[member]
+        summary = parsed[member]
+        if summary.get('label') != label.strip():
+            report.errors.append(f"{member}: label {summary.get('label')!r}, expected {label.strip()!r}")
+        for field in sorted(set(fields) | set(summary['values'])):
+            if summary['values'].get(field) != fields.get(field):
+                report.errors.append(f"{member}: {field} is {summary['values'].get(field)!r}, "
+                                     f"expected {fields.get(field)!r} ('{' > '.join(node.path)}')")
+
+def verify_manifest(package_dir, members, report):
+    """Every member listed in package.xml needs its file (a delta package.xml may list fewer)."""
+    listed = package_members(package_dir)
+    if listed is None:
+        report.errors.append(f"{package_dir}: package.xml is missing")
+        return
+    present = set(members)
+    for metadata_type, names in listed.items():
+        if metadata_type == 'CustomObject':
+            continue
+        for name in names:
+            if name not in present:
+                report.errors.append(f"{package_dir}/package.xml lists {metadata_type} {name} without its file")
+
+def verify_packages(taxonomy, picklist_dir=PICKLIST_DIR, records_dir=RECORDS_DIR, workers=None,
+                    global_value_sets=False):
+    """
+    Parses every generated file back (in parallel) and checks that the
+    packages encode exactly the taxonomy: picklist values, dependency maps,
+    and one record per independent entry with its names, campaign name and
+    year flag.
+
+    :param picklist_dir: deploy_package folder, or None to skip it.
+    :param records_dir: deploy_pkg folder, or None to skip it.
+    :param global_value_sets: deploy_package was generated with --global-value-sets.
+    :return: (ValidationReport, number of files parsed)
+    """
+    report = ValidationReport()
+    picklist_paths = {}
+    if picklist_dir is not None:
+        for rel_path, member, _, _ in generate_picklist_metadata.picklist_files(taxonomy, global_value_sets):
+            path = os.path.join(picklist_dir, rel_path)
+            if os.path.exists(path):
+                picklist_paths[path] = member
+            else:
+                report.errors.append(f"{member}: missing file {path}")
+    record_paths = {}
+    if records_dir is not None:
+        prefix = f"{create_metadata_records.MDT_FILENAME_PREFIX}."
+        records_folder = os.path.join(records_dir, 'customMetadata')
+        names = os.listdir(records_folder) if os.path.isdir(records_folder) else []
+        for name in names:
+            if name.startswith(prefix) and name.endswith(RECORD_SUFFIX):
+                record_paths[os.path.join(records_folder, name)] = name[:-len(RECORD_SUFFIX)]
+
+    parsed_picklists = {}
+    parsed_records = {}
+    for path, summary, error in parse_files(sorted(picklist_paths) + sorted(record_paths), workers):
+        if error is not None:
+            report.errors.append(f"{path}: not well-formed XML ({error})")
+        elif path in picklist_paths:
+            parsed_picklists[picklist_paths[path]] = summary
+        else:
+            parsed_records[record_paths[path]] = summary
+
+    if picklist_dir is not None:
+        verify_picklists(taxonomy, parsed_picklists, report)
+        verify_manifest(picklist_dir, picklist_paths.values(), report)
+    if records_dir is not None:
+        verify_records(taxonomy, parsed_records, report)
+        verify_manifest(records_dir, record_paths.values(), report)
+    return report, len(picklist_paths) + len(record_paths)
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse the generated packages back and check they encode real.json")
+    parser.add_argument('--input', default=INPUT_FILE)
+    parser.add_argument('--picklist-dir', default=PICKLIST_DIR, help=f"(default: {PICKLIST_DIR})")
+    parser.add_argument('--records-dir', default=RECORDS_DIR, help=f"(default: {RECORDS_DIR})")
+    parser.add_argument('--skip-picklists', action='store_true')
+    parser.add_argument('--skip-records', action='store_true')
+    parser.add_argument('--global-value-sets', action='store_true',
+                        help="deploy_package was generated with --global-value-sets")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        sys.exit(f"Error: {args.input} not found.")
+    start = time.perf_counter()
+    taxonomy = load_taxonomy(args.input)
+    report, files = verify_packages(taxonomy,
+                                    None if args.skip_picklists else args.picklist_dir,
+                                    None if args.skip_records else args.records_dir,
+                                    args.workers, args.global_value_sets)
+    report.print()
+    print(f"\n{files} file(s) verified in {time.perf_counter() - start:.2f}s: {len(report.errors)} mismatch(es)")
+    if not report.ok:
+        sys.exit(1)
@@ -0,0 +1,329 @@
+import argparse
+import io
+import os
+import sys
+import time
+
+import create_metadata_records
+import generate_picklist_metadata
+import json_generator
+from manifest import hash_inputs
+from package_output import DirectoryOutput
+from taxonomy import Taxonomy, TaxonomyBuilder, iter_raw_types
+from validation import validate_taxonomy
+
+# ---------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------
+INPUT_FILE = 'real.json'
+
+# Seconds between two stat() calls on the inputs
+POLL_INTERVAL = 0.1
+# Seconds the inputs have to stay unchanged before a rebuild: editors often
+# save in several writes (truncate, write, rename)
+DEBOUNCE = 0.2
+
+# ---------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------
+
+def file_signature(path):
+    """(mtime, size) of a file, None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def csv_to_json_text(csv_file):
+    """real.json content of a CSV export (see json_generator.convert_csv_stream)."""
+    out = io.StringIO()
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+        json_generator.convert_csv_stream(f, out)
+    return out.getvalue()
+
+def _remove(root_dir, rel_path):
+    path = os.path.join(root_dir, rel_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+# ---------------------------------------------------------
+# WATCHER
+# ---------------------------------------------------------
+
+class _TypeState:
+    """
+    What the watcher keeps of one Type subtree between rebuilds.
+
+    :ivar raw: real.json object of the Type, compared on the next rebuild.
+    :ivar taxonomy: Taxonomy of this Type alone (merged with Taxonomy.extend).
+    :ivar records: Dict { member: (rel_path, label, fields) } of its record files.
+    :ivar node_records: Dict { node: (dev_name, label, fields) }, for the validator.
+    :ivar full_labels: Dict { node: label before it is cut }, for the validator.
+    :ivar outline: (level, name, parent name) of every node: picklists only
+        change when an outline does.
+    """
+    __slots__ = ('raw', 'taxonomy', 'records', 'node_records', 'full_labels', 'outline')
+
+    def __init__(self, raw):
+        self.raw = raw
+        builder = TaxonomyBuilder()
+        nodes = builder.add(raw)
+        self.taxonomy = builder.taxonomy
+        self.records = {}
+        self.node_records = {}
+        self.full_labels = {}
+        for node in nodes:
+            if node.independent_entry:
+                dev_name, label, fields = self.node_records[node] = create_metadata_records.record_for_node(node)
+                member, rel_path = create_metadata_records.record_member(dev_name)
+                self.records[member] = (rel_path, label, fields)
+                self.full_labels[node] = create_metadata_records.record_label(node)
+        self.outline = [(node.level, node.name, node.parent.name if node.parent else None) for node in nodes]
+
+
+class Watcher:
+    """
+    Keeps the last taxonomy and what was written for it in memory, and on
+    every rebuild rewrites only the files whose content changed.
+
+    Edits are diffed per Type subtree: the nodes and records of a Type whose
+    real.json object did not change are reused as they are, the others are
+    rebuilt and only differing records are written. Picklists are skipped
+    unless a name or a parent changed somewhere; their files are then
+    compared by the hash of their inputs. A package.xml is only rewritten
+    when its members change.
+    """
+
+    def __init__(self, input_file=INPUT_FILE, csv_file=None, picklist_dir=generate_picklist_metadata.OUTPUT_DIR,
+                 records_dir=create_metadata_records.ROOT_DIR, global_value_sets=False, validate=True):
+        self.input_file = input_file
+        self.csv_file = csv_file
+        self.picklist_dir = picklist_dir
+        self.records_dir = records_dir
+        self.global_value_sets = global_value_sets
+        self.validate = validate
+
+        # (Type name, occurrence) -> _TypeState
+        self.types = {}
+        self.records = {}    # member -> (rel_path, label, fields)
+        self.picklists = {}  # member -> (rel_path, inputs hash)
+        self.started = False
+
+    def signatures(self):
+        return file_signature(self.input_file), file_signature(self.csv_file) if self.csv_file else None
+
+    def convert_csv(self):
+        """Regenerates real.json from the CSV export; False when it is unchanged."""
+        content = csv_to_json_text(self.csv_file)
+        if os.path.exists(self.input_file):
+            with open(self.input_file, 'r', encoding='utf-8') as f:
+                if f.read() == content:
+                    return False
+        tmp_path = f"{self.input_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, self.input_file)
+        return True
+
+    def _read(self):
+        # Rebuilds the taxonomy from the Type states, reusing the ones whose
+        # real.json object did not change
+        taxonomy = Taxonomy()
+        types = {}
+        occurrences = {}
+        changed_types = 0
+        outline_changed = False
+        for raw_type in iter_raw_types(self.input_file):
+            name = raw_type.get('name') or ''
+            occurrences[name] = occurrences.get(name, 0) + 1
+            key = (name, occurrences[name])
+            state = self.types.get(key)
+            if state is None or state.raw != raw_type:
+                previous = state
+                state = _TypeState(raw_type)
+                changed_types += 1
+                if previous is None or previous.outline != state.outline:
+                    outline_changed = True
+            types[key] = state
+            taxonomy.extend(state.taxonomy)
+        outline_changed = outline_changed or types.keys() != self.types.keys()
+        return taxonomy, types, changed_types, outline_changed
+
+    def _validate(self, taxonomy, types):
+        node_records = {}
+        full_labels = {}
+        for state in types.values():
+            node_records.update(state.node_records)
+            full_labels.update(state.full_labels)
+        return validate_taxonomy(taxonomy, node_records.__getitem__, full_labels.__getitem__)
+
+    def _write_records(self, types):
+        output = DirectoryOutput(self.records_dir)
+        if not self.started:
+            create_metadata_records.ensure_dirs(self.records_dir)
+            create_metadata_records.generate_object_file(output=output)
+
+        records = {}
+        written = 0
+        errors = []
+        for key, state in types.items():
+            records.update(state.records)
+            if self.types.get(key) is state:
+                continue
+            for member, (rel_path, label, fields) in state.records.items():
+                if self.records.get(member) != (rel_path, label, fields):
+                    dev_name = member[len(create_metadata_records.MDT_FILENAME_PREFIX) + 1:]
+                    try:
+                        create_metadata_records.generate_record_file(dev_name, label, fields, output=output)
+                    except OSError as exc:
+                        errors.append((dev_name, exc))
+                        continue
+                    written += 1
+        if errors:
+            raise create_metadata_records.RecordWriteError(errors)
+
+        removed = [member for member in self.records if member not in records]
+        for member in removed:
+            _remove(self.records_dir, self.records[member][0])
+        if not self.started:
+            # Record files of an earlier run that are not part of this package
+            records_folder = os.path.join(self.records_dir, create_metadata_records.RECORDS_REL_DIR)
+            expected = {os.path.basename(rel_path) for rel_path, _, _ in records.values()}
+            for name in os.listdir(records_folder):
+                if name.startswith(f"{create_metadata_records.MDT_FILENAME_PREFIX}.") and name not in expected:
+                    os.remove(os.path.join(records_folder, name))
+                    removed.append(name)
+
+        if not self.started or records.keys() != self.records.keys():
+            create_metadata_records.generate_package_xml(list(records), output=output)
+        self.records = records
+        return written, len(removed)
+
+    def _write_picklists(self, taxonomy):
+        output = DirectoryOutput(self.picklist_dir)
+        picklists = {}
+        members_by_type = {metadata_type: [] for metadata_type in generate_picklist_metadata.METADATA_FOLDERS.values()}
+        written = 0
+        for rel_path, member, render, inputs in generate_picklist_metadata.picklist_files(taxonomy,
+                                                                                          self.global_value_sets):
+            picklists[member] = (rel_path, hash_inputs(*inputs))
+            metadata_type = generate_picklist_metadata.METADATA_FOLDERS[rel_path.split(os.sep)[0]]
+            members_by_type[metadata_type].append(member)
+            if self.picklists.get(member) != picklists[member]:
+                generate_picklist_metadata.write_metadata_file(rel_path, member, render, inputs, output=output)
+                written += 1
+        for member, (rel_path, _) in self.picklists.items():
+            if member not in picklists:
+                _remove(self.picklist_dir, rel_path)
+        if not self.started:
+            # Sets left by an earlier run in the other --global-value-sets mode
+            generate_picklist_metadata.remove_stale_value_sets(self.picklist_dir, members_by_type['GlobalValueSet'])
+
+        if not self.started or picklists.keys() != self.picklists.keys():
+            with output.open('package.xml') as f:
+                f.write(generate_picklist_metadata.create_package_xml(
+                    members_by_type['CustomField'], members_by_type['StandardValueSet'],
+                    members_by_type['GlobalValueSet']))
+        self.picklists = picklists
+        return written
+
+    def rebuild(self, csv_changed=False):
+        """
+        Brings both packages up to date with the inputs. Nothing is written
+        when real.json cannot be read or does not validate; the previous
+        packages stay as they are. Files that cannot be written are reported
+        and retried on the next rebuild.
+
+        :return: True when the packages were updated.
+        """
+        start = time.perf_counter()
+        stamp = time.strftime('%H:%M:%S')
+        try:
+            if self.csv_file and csv_changed:
+                self.convert_csv()
+            taxonomy, types, changed_types, outline_changed = self._read()
+        except (OSError, ValueError, KeyError) as exc:
+            # Most often a save caught half-way or a typo: wait for the next one
+            print(f"[{stamp}] Cannot read the input: {exc}")
+            return False
+
+        if self.validate:
+            report = self._validate(taxonomy, types)
+            if not report.ok:
+                report.print()
+                print(f"[{stamp}] {len(report.errors)} validation error(s), nothing was written.")
+                return False
+
+        try:
+            records_written, records_removed = self._write_records(types)
+            picklists_written = 0
+            if outline_changed or not self.started:
+                picklists_written = self._write_picklists(taxonomy)
+        except (OSError, create_metadata_records.RecordWriteError) as exc:
+            # e.g. a file locked by an editor: the state is left as it was,
+            # so the next rebuild writes everything this one did not
+            print(f"[{stamp}] Cannot write the packages: {exc}")
+            return False
+        self.types = types
+        self.started = True
+        print(f"[{stamp}] {len(taxonomy)} nodes, {changed_types} changed Type(s): {records_written} record(s) "
+              f"written, {records_removed} removed, {picklists_written} picklist file(s) written "
+              f"({time.perf_counter() - start:.2f}s)")
+        return True
+
+    def run(self, poll_interval=POLL_INTERVAL, debounce=DEBOUNCE):
+        """Builds once, then rebuilds after every change of the inputs until interrupted."""
+        self.rebuild(csv_changed=True)
+        signatures = self.signatures()
+        while True:
+            time.sleep(poll_interval)
+            current = self.signatures()
+            if current == signatures:
+                continue
+            # Wait for the writes of one save to settle
+            while True:
+                time.sleep(debounce)
+                settled = self.signatures()
+                if settled == current:
+                    break
+                current = settled
+            self.rebuild(csv_changed=current[1] != signatures[1])
+            # real.json may have been rewritten from the CSV: that is not a new edit
+            signatures = self.signatures()
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep deploy_package and deploy_pkg up to date while real.json "
+                                                 "(or the CSV export) is edited")
+    parser.add_argument('--input', default=INPUT_FILE, help=f"taxonomy JSON file (default: {INPUT_FILE})")
+    parser.add_argument('--csv', help="CSV export to watch; real.json is regenerated from it on every save")
+    parser.add_argument('--picklist-dir', default=generate_picklist_metadata.OUTPUT_DIR,
+                        help=f"(default: {generate_picklist_metadata.OUTPUT_DIR})")
+    parser.add_argument('--records-dir', default=create_metadata_records.ROOT_DIR,
+                        help=f"(default: {create_metadata_records.ROOT_DIR})")
+    parser.add_argument('--global-value-sets', action='store_true',
+                        help="write the dependent field values as GlobalValueSets (see generate_picklist_metadata)")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="skip the collision / Salesforce limit checks")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                        help=f"seconds between two checks of the inputs (default: {POLL_INTERVAL})")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE,
+                        help=f"seconds the inputs must stay unchanged before a rebuild (default: {DEBOUNCE})")
+    args = parser.parse_args()
+
+    if args.csv and not os.path.exists(args.csv):
+        sys.exit(f"Error: {args.csv} not found.")
+    if not args.csv and not os.path.exists(args.input):
+        sys.exit(f"Error: {args.input} not found.")
+
+    watcher = Watcher(args.input, args.csv, args.picklist_dir, args.records_dir, args.global_value_sets,
+                      validate=not args.no_validate)
+    print(f"Watching {args.csv or args.input} (Ctrl+C to stop)")
+    try:
+        watcher.run(args.interval, args.debounce)
+    except KeyboardInterrupt:
+        print("\nStopped.")